@@ -1,7 +1,6 @@
 import simpledali
 import simplemseed
 import asyncio
-import bz2
 import json
 import logging
 from datetime import datetime, timedelta
@@ -31,9 +30,10 @@ async def stream_data(dali, max=0):
             print(f"    MSeed3: {ms3}")
         elif daliPacket.streamIdType() == simpledali.JSON_TYPE:
             print(f"    JSON: {daliPacket.data.decode('utf-8')}")
-        elif daliPacket.streamIdType() == simpledali.BZ2_JSON_TYPE:
-            daliPacket.data = bz2.decompress(daliPacket.data)
-            print(f"    BZ2 JSON: {daliPacket.data.decode('utf-8')}")
+        elif simpledali.jsonCodec(daliPacket.streamIdType()) is not None:
+            codec = simpledali.jsonCodec(daliPacket.streamIdType())
+            daliPacket.data = codec.decompress(daliPacket.data)
+            print(f"    {codec.packetType}: {daliPacket.data.decode('utf-8')}")
         else:
             print(f"    Unknown type")
         if max > 0 and count >= max:
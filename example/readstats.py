@@ -38,7 +38,7 @@ async def main(host, port, verbose=False):
         # can get status, stream, connections parsed into a dict
         infoStatus = await dali.parsedInfoStatus()
         print(
-            f"Info Status: {json.dumps(infoStatus, indent=4, sort_keys=True, cls=simpledali.JsonEncoder)} "
+            f"Info Status: {simpledali.dumpJSON(infoStatus, indent=True, sort_keys=True)} "
         )
 
         # set regex match pattern, really important on high volume server
@@ -56,7 +56,7 @@ async def main(host, port, verbose=False):
 
         infoStreams = await dali.parsedInfoStreams()
         print(
-            f"Info Streams: {json.dumps(infoStreams, indent=4, sort_keys=True, cls=simpledali.JsonEncoder)} "
+            f"Info Streams: {simpledali.dumpJSON(infoStreams, indent=True, sort_keys=True)} "
         )
         # or can get status, streams and connections as xml
         status_xml = await dali.info("STATUS")
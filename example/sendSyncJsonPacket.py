@@ -0,0 +1,55 @@
+import simpledali
+from simplemseed import FDSNSourceId
+import logging
+import time
+from threading import Thread
+
+logging.basicConfig(level=logging.DEBUG)
+
+host = "localhost"
+port = 16000
+uri = f"ws://{host}:{port}/datalink"
+
+
+def send_test_json(dali, station):
+    network = "XX"
+    starttime = simpledali.utcnowWithTz()
+    sid = FDSNSourceId.fromNslc(network, station, "00", "SOH")
+    streamid = simpledali.fdsnSourceIdToStreamId(
+        sid, simpledali.JSON_TYPE, dali.dali.dlproto == simpledali.DLPROTO_1_0
+    )
+    hpdatastart = simpledali.datetimeToHPTime(starttime)
+    hpdataend = hpdatastart
+    jsonMessage = {
+        "from": station,
+        "to": "you",
+        "msg": "howdy",
+        "when": starttime.isoformat(),
+    }
+    # blocks until the server acks, no asyncio needed in this thread
+    sendResult = dali.writeJSON(streamid, hpdatastart, hpdataend, jsonMessage)
+    print(f"writeJSON {streamid} response: {sendResult}")
+
+
+def sender(dali, station, numSend):
+    for i in range(numSend):
+        send_test_json(dali, station)
+        time.sleep(1)
+
+
+def main():
+    numSend = 3
+    # one connection, on an event loop in a background thread, shared by
+    # plain threads
+    with simpledali.SyncDataLink.forSocket(host, port) as dali:
+    # with simpledali.SyncDataLink.forWebSocket(uri) as dali:
+        serverId = dali.id("simpleDali", "dragrace", 0, "python")
+        print(f"Id: {serverId}")
+        threads = [Thread(target=sender, args=(dali, sta, numSend)) for sta in ["TESTA", "TESTB"]]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+main()
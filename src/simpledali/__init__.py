@@ -23,16 +23,41 @@ from .dalipacket import (
     DaliClosed,
     nslcToStreamId,
     fdsnSourceIdToStreamId,
+    parseStreamId,
+    streamIdCacheInfo,
     JSON_TYPE,
     BZ2_JSON_TYPE,
+    ZSTD_JSON_TYPE,
+    LZ4_JSON_TYPE,
     MSEED_TYPE,
     MSEED3_TYPE,
 )
-from .jsonencoder import JsonEncoder
+from .jsoncodec import (
+    JsonCodec,
+    ZstdJsonCodec,
+    Lz4JsonCodec,
+    registerJsonCodec,
+    jsonCodec,
+    trainZstdDictionary,
+)
+from .jsonencoder import JsonEncoder, encodeJSON, dumpJSON, jsonBackend, setJsonBackend
 from .util import datetimeToHPTime, hptimeToDatetime, utcnowWithTz, encodeAuthToken
 from .socketdali import SocketDataLink
 from .websocketdali import WebSocketDataLink
+from .dalipool import DataLinkPool
+from .syncdali import SyncDataLink
+from .broadcast import (
+    DaliBroadcaster,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DISCONNECT,
+)
+from .daliserver import DaliServer, MemoryRing
+from .aggregator import MSeed3Aggregator
+from .queuedwriter import QueuedWriter
 from .dali2jsonl import Dali2Jsonl
+from .dali2mseed import Dali2MSeed
 
 __all__ = [
     "DataLink",
@@ -41,18 +66,44 @@ __all__ = [
     "DaliException",
     "nslcToStreamId",
     "fdsnSourceIdToStreamId",
+    "parseStreamId",
+    "streamIdCacheInfo",
     "JSON_TYPE",
     "BZ2_JSON_TYPE",
+    "ZSTD_JSON_TYPE",
+    "LZ4_JSON_TYPE",
+    "JsonCodec",
+    "ZstdJsonCodec",
+    "Lz4JsonCodec",
+    "registerJsonCodec",
+    "jsonCodec",
+    "trainZstdDictionary",
     "MSEED_TYPE",
     "MSEED3_TYPE",
     "DLPROTO_1_0",
     "DLPROTO_1_1",
     "Dali2Jsonl",
+    "Dali2MSeed",
     "datetimeToHPTime",
     "hptimeToDatetime",
     "JsonEncoder",
+    "encodeJSON",
+    "dumpJSON",
+    "jsonBackend",
+    "setJsonBackend",
     "utcnowWithTz",
     "encodeAuthToken",
     "SocketDataLink",
     "WebSocketDataLink",
+    "DataLinkPool",
+    "SyncDataLink",
+    "DaliBroadcaster",
+    "OVERFLOW_BLOCK",
+    "OVERFLOW_DROP_OLDEST",
+    "OVERFLOW_DROP_NEWEST",
+    "OVERFLOW_DISCONNECT",
+    "DaliServer",
+    "MemoryRing",
+    "MSeed3Aggregator",
+    "QueuedWriter",
 ]
@@ -1,20 +1,28 @@
 from abc import ABC, abstractmethod
-import bz2
-import json
+import asyncio
+from collections import deque
+from contextlib import aclosing
 import defusedxml.ElementTree
 from .dalipacket import (
     DaliException,
-    nslcToStreamId,
-    fdsnSourceIdToStreamId,
+    DaliClosed,
+    DaliPacket,
+    DaliResponse,
+    nslcStreamId,
+    sourceIdStreamId,
     MSEED_TYPE,
-    MSEED3_TYPE
+    MSEED3_TYPE,
+    BZ2_JSON_TYPE,
+    ZSTD_JSON_TYPE,
+    LZ4_JSON_TYPE,
 )
+from .jsoncodec import checkJsonCodec
+from .jsonencoder import encodeJSON
 from .util import (
     datetimeToHPTime,
     optional_date,
     MICROS
 )
-from simplemseed import FDSNSourceId
 
 # https://iris-edu.github.io/libdali/datalink-protocol.html
 DLPROTO_1_0 = "1.0"
@@ -25,17 +33,42 @@ NO_SOUP = "Write permission not granted, no soup for you!"
 QUERY_MODE="query"
 STREAM_MODE="stream"
 
+DEFAULT_ACK_WINDOW = 8
+
+# seconds to wait for the server's ENDSTREAM when a stream is ended,
+# after which the connection is closed instead
+DEFAULT_ENDSTREAM_TIMEOUT = 10
+
+# distinct streamids kept with their encoded WRITE header start, per connection
+WRITE_PREFIX_CACHE_SIZE = 4096
+
+WRITE_FLAGS = {"A": b"A", "N": b"N"}
+
 class DataLink(ABC):
-    def __init__(self, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False):
+    def __init__(self, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False, ack_window=DEFAULT_ACK_WINDOW):
         """init DataLink. Packet_size and dlproto can be set,
         or can be acquired from the
         server via the capabilities response within id()
+
+        ack_window is the maximum number of acknowledged writes that may be
+        outstanding at once when writing with wait=False.
         """
         self.__mode = QUERY_MODE
         self.packet_size = packet_size
         self.dlproto = dlproto
         self.verbose = verbose
+        self.ack_window = ack_window
+        self.endstream_timeout = DEFAULT_ENDSTREAM_TIMEOUT
         self.token = None
+        self.idArgs = None
+        self.matchPattern = None
+        self.rejectPattern = None
+        # last position command, as method name and args, for streamResume()
+        self.positionArgs = None
+        self._pendingAcks = deque()
+        self._writePrefixes = dict()
+        self._ackSlots = None
+        self._ackReader = None
         self.int_types = [
             "RingSize",
             "PacketSize",
@@ -90,6 +123,20 @@ class DataLink(ABC):
     async def send(self, header, data):
         pass
 
+    async def sendBuffered(self, header, data):
+        """
+        Send a frame that does not expect a reply from the server.
+        Subclasses may hold these to send several at once, by default it is
+        the same as send().
+        """
+        return await self.send(header, data)
+
+    async def flush(self):
+        """
+        Send any frames held by sendBuffered().
+        """
+        pass
+
     @abstractmethod
     async def parseResponse(self):
         pass
@@ -134,13 +181,37 @@ class DataLink(ABC):
             raise DaliException(
                 f"Data larger than configured max packet_size, {len(data)}>{self.packet_size}"
             )
-        header = f"WRITE {streamid} {hpdatastart:d} {hpdataend:d} {flags} {len(data):d}"
+        # header is built as bytes, only the times, size and pktid change
+        flagBytes = WRITE_FLAGS.get(flags)
+        if flagBytes is None:
+            flagBytes = flags.encode("UTF-8")
+        header = b"%b%d %d %b %d" % (
+            self.writePrefix(streamid), hpdatastart, hpdataend, flagBytes, len(data)
+        )
         if pktid is not None:
-            header += f" {pktid}"
-        r = await self.send(header, data)
+            header += b" " + str(pktid).encode("UTF-8")
+        if "A" in flags:
+            r = await self.send(header, data)
+        else:
+            r = await self.sendBuffered(header, data)
         return r
 
+    def writePrefix(self, streamid):
+        """
+        Encoded start of a WRITE header for the streamid, cached as the same
+        streams are written repeatedly.
+        """
+        prefix = self._writePrefixes.get(streamid)
+        if prefix is None:
+            if len(self._writePrefixes) >= WRITE_PREFIX_CACHE_SIZE:
+                self._writePrefixes.clear()
+            prefix = f"WRITE {streamid} ".encode("UTF-8")
+            self._writePrefixes[streamid] = prefix
+        return prefix
+
     async def writeAck(self, streamid, hpdatastart, hpdataend, data, pktid=None):
+        if self._pendingAcks:
+            await self.flushAcks()
         await self.write(streamid, hpdatastart, hpdataend, "A", data, pktid=pktid)
         r = await self.parseResponse()
         if r.type == "ERROR" and r.message.startswith(NO_SOUP):
@@ -148,85 +219,240 @@ class DataLink(ABC):
             await self.close()
         return r
 
-    async def writeMSeed(self, msr, pktid=None):
+    async def writeAckPipelined(self, streamid, hpdatastart, hpdataend, data, pktid=None):
+        """
+        Send an acknowledged WRITE without waiting for the server's reply.
+
+        Returns a future that resolves to the DaliResponse for this write.
+        Up to ack_window writes may be outstanding, beyond that this waits
+        for the oldest to be acknowledged before sending. Replies are
+        matched to writes in the order sent. Any other command waits for
+        all outstanding writes to be acknowledged first.
+        """
+        if self._ackSlots is None:
+            self._ackSlots = asyncio.Semaphore(max(1, self.ack_window))
+        await self._ackSlots.acquire()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await self.write(streamid, hpdatastart, hpdataend, "A", data, pktid=pktid)
+        except:
+            self._ackSlots.release()
+            raise
+        self._pendingAcks.append((pktid, future))
+        if self._ackReader is None or self._ackReader.done():
+            self._ackReader = asyncio.create_task(self._readAcks())
+        return future
+
+    async def flushAcks(self):
+        """
+        Wait until all writes sent with writeAckPipelined have been
+        acknowledged, or failed.
+        """
+        if self._ackReader is not None and not self._ackReader.done():
+            await self._ackReader
+
+    async def _readAcks(self):
+        error = None
+        try:
+            while self._pendingAcks:
+                r = await self.parseResponse()
+                if not isinstance(r, DaliResponse) or r.type not in ("OK", "ERROR"):
+                    raise DaliException(f"Expected OK or ERROR for write, got {r}")
+                self._resolveAck(r)
+                if r.type == "ERROR" and r.message.startswith(NO_SOUP):
+                    # no write premission to ringserver, it usually closes connection
+                    await self.close()
+        except Exception as e:
+            error = e
+        finally:
+            # also on cancel, so no write waits forever for its ack or slot
+            if self._pendingAcks:
+                self._failPendingAcks(
+                    error if error is not None else DaliClosed("Connection closed before write was acknowledged")
+                )
+
+    def _failPendingAcks(self, error):
+        while self._pendingAcks:
+            pktid, future = self._pendingAcks.popleft()
+            self._ackSlots.release()
+            if not future.done():
+                future.set_exception(error)
+
+    def _resolveAck(self, r):
+        # replies on a connection come in the order the writes were sent,
+        # the value is the server's packet id, not the client's pktid
+        pktid, future = self._pendingAcks.popleft()
+        self._ackSlots.release()
+        if self.verbose and pktid is not None and r.type == "OK" and str(pktid) != r.value:
+            print(f"ack for pktid {pktid} has packet id {r.value}")
+        if not future.done():
+            future.set_result(r)
+
+    async def _writeAckOrPipeline(self, streamid, hpdatastart, hpdataend, data, pktid, wait):
+        if wait:
+            return await self.writeAck(streamid, hpdatastart, hpdataend, data, pktid=pktid)
+        return await self.writeAckPipelined(streamid, hpdatastart, hpdataend, data, pktid=pktid)
+
+    def packMSeed(self, msr):
+        """
+        Streamid, data start and end hptimes and data bytes to write a single
+        miniseed2 record, see writeMSeed().
+        """
+        # old style nn_sss_ll_ccc/MSEED for datalink 1.0, otherwise fdsn
+        # sourceid style, cached as the same channels are written repeatedly
+        streamid = nslcStreamId(msr.header.network,
+                                msr.header.station,
+                                msr.header.location,
+                                msr.header.channel,
+                                MSEED_TYPE,
+                                self.dlproto == DLPROTO_1_0)
+        hpdatastart = datetimeToHPTime(msr.starttime())
+        hpdataend = datetimeToHPTime(msr.endtime())
+        return streamid, hpdatastart, hpdataend, msr.pack()
+
+    def packMSeed3(self, ms3):
+        """
+        Streamid, data start and end hptimes and data bytes to write a single
+        mseed3 record, see writeMSeed3().
+        """
+        streamid = sourceIdStreamId(str(ms3.identifier),
+                                    MSEED3_TYPE, self.dlproto == DLPROTO_1_0)
+        hpdatastart = datetimeToHPTime(ms3.starttime)
+        hpdataend = datetimeToHPTime(ms3.endtime)
+        return streamid, hpdatastart, hpdataend, ms3.pack()
+
+    def packJSON(self, streamid, hpdatastart, hpdataend, jsonMessage):
+        jsonAsByteArray = encodeJSON(jsonMessage)
+        return streamid, hpdatastart, hpdataend, jsonAsByteArray
+
+    def packBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage):
+        return self.packCompressedJSON(streamid, hpdatastart, hpdataend, jsonMessage, BZ2_JSON_TYPE)
+
+    def packCompressedJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, packetType):
+        """
+        Pack JSON compressed by the codec for packetType, see jsoncodec.
+        """
+        codec = checkJsonCodec(packetType)
+        jsonAsByteArray = encodeJSON(jsonMessage)
+        return streamid, hpdatastart, hpdataend, codec.compress(jsonAsByteArray)
+
+    async def writeMSeed(self, msr, pktid=None, wait=True):
         """
         Write a datalink packet with data that is a single miniseed2 record.
 
         Calcuates the streamid based on the headers to be:
         <net>_<station>_<loc>_<channel>/MSEED
+
+        If wait is False, returns a future for the server's response
+        instead of the response, see writeAckPipelined().
         """
-        if self.dlproto == DLPROTO_1_0:
-            # old style nn_sss_ll_ccc/MSEED style
-            streamid = nslcToStreamId(msr.header.network,
-                                  msr.header.station,
-                                  msr.header.location,
-                                  msr.header.channel,
-                                  MSEED_TYPE)
-        else:
-            # new style fdsn sourceids
-            sid = FDSNSourceId.fromNslc(msr.header.network,
-                                  msr.header.station,
-                                  msr.header.location,
-                                  msr.header.channel)
-            streamid = fdsnSourceIdToStreamId(sid, MSEED_TYPE)
-        hpdatastart = datetimeToHPTime(msr.starttime())
-        hpdataend = datetimeToHPTime(msr.endtime())
+        streamid, hpdatastart, hpdataend, data = self.packMSeed(msr)
         if self.verbose:
             print(
                 f"simpleDali.writeMSeed {streamid} {hpdatastart} {hpdataend}"
             )
-        r = await self.writeAck(streamid, hpdatastart, hpdataend, msr.pack(), pktid=pktid)
+        r = await self._writeAckOrPipeline(streamid, hpdatastart, hpdataend, data, pktid, wait)
         return r
 
-    async def writeMSeed3(self, ms3, pktid=None):
+    async def writeMSeed3(self, ms3, pktid=None, wait=True):
         """
         Write a datalink packet with data that is a single mseed3 record
 
         Calcuates the streamid based on the headers to be:
         <sid>/MSEED3
         where <sid> is the source identifier without the leading FDSN:
+
+        If wait is False, returns a future for the server's response.
         """
-        streamid = fdsnSourceIdToStreamId(ms3.identifier,
-                                  MSEED3_TYPE, self.dlproto == DLPROTO_1_0)
-        hpdatastart = datetimeToHPTime(ms3.starttime)
-        hpdataend = datetimeToHPTime(ms3.endtime)
+        streamid, hpdatastart, hpdataend, data = self.packMSeed3(ms3)
         if self.verbose:
             print(
                 f"simpleDali.writeMSeed3 {streamid} {hpdatastart} {hpdataend}"
             )
-        r = await self.writeAck(streamid, hpdatastart, hpdataend, ms3.pack(), pktid=pktid)
+        r = await self._writeAckOrPipeline(streamid, hpdatastart, hpdataend, data, pktid, wait)
         return r
 
-    async def writeJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None):
+    async def writeJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
         """
         Write a datalink packet with data that is JSON.
 
         Usually the streamid ends with /JSON
+
+        If wait is False, returns a future for the server's response.
         """
         if self.verbose:
             print(
                 f"simpleDali.writeJSON {streamid} {hpdatastart} {hpdataend}"
             )
-        jsonAsByteArray = json.dumps(jsonMessage).encode("UTF-8")
-        r = await self.writeAck(streamid, hpdatastart, hpdataend, jsonAsByteArray, pktid=pktid)
+        packet = self.packJSON(streamid, hpdatastart, hpdataend, jsonMessage)
+        r = await self._writeAckOrPipeline(*packet, pktid, wait)
         return r
 
-    async def writeBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None):
+    async def writeBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
         """
         Write a datalink packet with data that is JSON and compressed with bzip2.
 
         Usually the streamid ends with /BZJSON
+
+        If wait is False, returns a future for the server's response.
         """
         if self.verbose:
             print(
                 f"simpleDali.writeBZ2JSON {streamid} {hpdatastart} {hpdataend}"
             )
-        jsonAsByteArray = json.dumps(jsonMessage).encode("UTF-8")
-        compressedJson = bz2.compress(jsonAsByteArray)
-        r = await self.writeAck(streamid, hpdatastart, hpdataend, compressedJson, pktid=pktid)
+        packet = self.packBZ2JSON(streamid, hpdatastart, hpdataend, jsonMessage)
+        r = await self._writeAckOrPipeline(*packet, pktid, wait)
+        return r
+
+    async def writeCompressedJSON(
+        self, streamid, hpdatastart, hpdataend, jsonMessage, packetType, pktid=None, wait=True
+    ):
+        """
+        Write a datalink packet with data that is JSON compressed by the
+        codec registered for packetType, see jsoncodec.registerJsonCodec().
+
+        Usually the streamid ends with /packetType
+
+        If wait is False, returns a future for the server's response.
+        """
+        if self.verbose:
+            print(
+                f"simpleDali.writeCompressedJSON {streamid} {hpdatastart} {hpdataend} {packetType}"
+            )
+        packet = self.packCompressedJSON(streamid, hpdatastart, hpdataend, jsonMessage, packetType)
+        r = await self._writeAckOrPipeline(*packet, pktid, wait)
         return r
 
+    async def writeZstdJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        """
+        Write a datalink packet with data that is JSON and compressed with
+        zstandard, much faster than bzip2 for small messages. Needs the
+        zstandard package.
+
+        Usually the streamid ends with /ZSTDJSON
+
+        If wait is False, returns a future for the server's response.
+        """
+        return await self.writeCompressedJSON(
+            streamid, hpdatastart, hpdataend, jsonMessage, ZSTD_JSON_TYPE, pktid=pktid, wait=wait
+        )
+
+    async def writeLZ4JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        """
+        Write a datalink packet with data that is JSON and compressed with
+        lz4. Needs the lz4 package.
+
+        Usually the streamid ends with /LZ4JSON
+
+        If wait is False, returns a future for the server's response.
+        """
+        return await self.writeCompressedJSON(
+            streamid, hpdatastart, hpdataend, jsonMessage, LZ4_JSON_TYPE, pktid=pktid, wait=wait
+        )
+
     async def writeCommand(self, command, dataString=None):
+        if self._pendingAcks:
+            await self.flushAcks()
         if self.verbose:
             print(f"writeCommand: cmd: {command} dataStr: {dataString}")
         dataBytes = None
@@ -269,6 +495,7 @@ class DataLink(ABC):
         Send an ID command. Returns the servers id and capabilities response.
         Also sets packet size and dlproto fields.
         """
+        self.idArgs = (programname, username, processid, architecture)
         header = f"ID {programname}:{username}:{processid}:{architecture}"
         r = await self.writeCommand(header, None)
         if "::" in r.message:
@@ -286,13 +513,17 @@ class DataLink(ABC):
 
     async def positionSet(self, packetId, packetTime=None):
         """
-        Send a POSITION SET command to the given packetId, optionally with a time.
+        Send a POSITION SET command to the given packetId, optionally with a
+        time, either a datetime or an integer hptime.
         """
         if packetTime is None:
             hpdatastart = ""
+        elif isinstance(packetTime, int):
+            hpdatastart = packetTime
         else:
             hpdatastart = int(packetTime.timestamp() * MICROS)
         r = await self.writeCommand(f"POSITION SET {packetId} {hpdatastart}", None)
+        self.positionArgs = ("positionSet", (packetId, packetTime))
         return r
 
     async def positionEarliest(self):
@@ -319,12 +550,14 @@ class DataLink(ABC):
 
     async def positionAfterHPTime(self, hpdatastart):
         r = await self.writeCommand(f"POSITION AFTER {hpdatastart}", None)
+        self.positionArgs = ("positionAfterHPTime", (hpdatastart,))
         return r
 
     async def match(self, pattern):
         """
         Send a MATCH command with the given regular expression pattern.
         """
+        self.matchPattern = pattern
         r = await self.writeCommand("MATCH", pattern)
         return r
 
@@ -332,6 +565,7 @@ class DataLink(ABC):
         """
         Send a REJECT command with the given regular expression pattern.
         """
+        self.rejectPattern = pattern
         r = await self.writeCommand("REJECT", pattern)
         return r
 
@@ -380,6 +614,8 @@ class DataLink(ABC):
         Switch to streaming mode. The server will begin sending packets based
         on the configuration previously set.
         """
+        if self._pendingAcks:
+            await self.flushAcks()
         if not self.isStreamMode():
             await self.startStream()
         try:
@@ -388,7 +624,105 @@ class DataLink(ABC):
                 yield daliPacket
         finally:
             if not self.isClosed():
-                await self.endStream()
+                try:
+                    await asyncio.wait_for(self._endStreamAndDrain(), self.endstream_timeout)
+                except asyncio.TimeoutError:
+                    # server never confirmed, the connection is not usable
+                    if self.verbose:
+                        print(f"no ENDSTREAM after {self.endstream_timeout} sec, closing")
+                    await self.close()
+
+    async def _endStreamAndDrain(self):
+        await self.endStream()
+        # discard packets already in flight until the server
+        # confirms with its own ENDSTREAM
+        while not self.isClosed():
+            r = await self.parseResponse()
+            if r.type == "ENDSTREAM":
+                break
+
+    async def streamResume(self, maxRetries=None, retryDelay=1, maxRetryDelay=60):
+        """
+        Like stream(), but if the connection is lost, reconnects and
+        continues from the last packet delivered instead of ending.
+
+        On reconnect the auth token, id, match and reject previously sent
+        are sent again, then the position is set to the packetId of the
+        last packet yielded, so streaming resumes with no gap. If that
+        packet is no longer in the ring, resumes after its data start time.
+        If no packet was yielded yet, the last position command is sent
+        again, ie positionEarliest() or a checkpoint.
+        Reconnect is retried with exponential backoff from retryDelay up to
+        maxRetryDelay seconds, giving up after maxRetries consecutive
+        failures, or never if None.
+        """
+        lastPacket = None
+        failures = 0
+        while True:
+            try:
+                if self.isClosed():
+                    await self.resumeConnection(lastPacket)
+                skipId = lastPacket.packetId if lastPacket is not None else None
+                async with aclosing(self.stream()) as packets:
+                    async for daliPacket in packets:
+                        if isinstance(daliPacket, DaliPacket):
+                            failures = 0
+                            if daliPacket.packetId == skipId:
+                                # already delivered before reconnect
+                                skipId = None
+                                continue
+                            lastPacket = daliPacket
+                        yield daliPacket
+                if not self.isClosed():
+                    # stream ended normally
+                    return
+            except (DaliClosed, OSError) as e:
+                if self.verbose:
+                    print(f"stream connection lost: {e}")
+            failures += 1
+            if maxRetries is not None and failures > maxRetries:
+                raise DaliClosed(f"Unable to reconnect after {maxRetries} retries")
+            await asyncio.sleep(min(retryDelay * 2 ** (failures - 1), maxRetryDelay))
+
+    async def resumeConnection(self, lastPacket=None):
+        """
+        Reconnect and resend the auth token, id, match and reject that were
+        previously sent, then position after lastPacket if given, otherwise
+        resend the last position command, if any.
+        """
+        await self.reconnect()
+        if self.idArgs is not None:
+            await self.id(*self.idArgs)
+        if self.matchPattern is not None:
+            await self.match(self.matchPattern)
+        if self.rejectPattern is not None:
+            await self.reject(self.rejectPattern)
+        if lastPacket is not None:
+            await self.positionAfterPacket(
+                lastPacket.packetId, lastPacket.packetHPTime, lastPacket.dataStartHPTime
+            )
+        elif self.positionArgs is not None:
+            # nothing received yet, so start where first asked
+            name, args = self.positionArgs
+            await getattr(self, name)(*args)
+
+    async def positionAfterPacket(self, packetId, packetHPTime, dataStartHPTime):
+        """
+        Position so streaming continues with the packet after packetId. If
+        that packet is no longer in the ring, position after its data start
+        time instead.
+        """
+        try:
+            r = await self.positionSet(packetId, packetHPTime)
+        except DaliException as e:
+            if self.isClosed():
+                raise
+            if self.verbose:
+                print(f"packet {packetId} not in ring, position after time: {e}")
+            r = await self.positionAfterHPTime(dataStartHPTime)
+        # replayed with the same fallback
+        self.positionArgs = ("positionAfterPacket", (packetId, packetHPTime, dataStartHPTime))
+        return r
 
     async def startStream(self):
         header = "STREAM"
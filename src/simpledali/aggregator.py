@@ -0,0 +1,229 @@
+import asyncio
+from collections import deque
+import json
+import time
+
+from simplemseed import mseed3merge, FIXED_HEADER_SIZE
+
+from .dalipacket import DaliException
+
+DEFAULT_PACKET_SIZE = 512
+DEFAULT_MAX_LATENCY = 1.0
+
+# bytes per sample of the primitive encodings that records can be merged in
+PRIMITIVE_SAMPLE_SIZE = {
+    1: 2,  # int16
+    3: 4,  # int32
+    4: 4,  # float32
+    5: 8,  # float64
+}
+
+
+def dataSize(ms3):
+    """
+    Size of the data of a MSeed3Record with primitive encoding.
+    """
+    return ms3.header.numSamples * PRIMITIVE_SAMPLE_SIZE[ms3.header.encoding]
+
+
+def recordSize(ms3):
+    """
+    Packed size of a MSeed3Record with primitive encoding, without packing.
+    """
+    size = FIXED_HEADER_SIZE + len(str(ms3.identifier).encode("utf-8"))
+    if ms3.hasExtraHeaders():
+        eh = ms3.eh
+        size += len((eh if isinstance(eh, str) else json.dumps(eh)).encode("utf-8"))
+    return size + dataSize(ms3)
+
+
+class _Pending:
+    __slots__ = ("record", "size", "lastDataSize", "deadline")
+
+    def __init__(self, record, deadline):
+        self.record = record
+        self.size = recordSize(record)
+        self.lastDataSize = dataSize(record)
+        self.deadline = deadline
+
+
+class MSeed3Aggregator:
+    """
+    Buffers small MSeed3Records per source id, merging contiguous samples
+    into records up to the DataLink's packet_size, so fewer, fuller packets
+    are written to the ring.
+
+    A source id's buffered record is written when the next record would not
+    fit, is not contiguous, or maxLatency seconds after its first sample
+    arrived. Only records with primitive encodings, ie int32 or float32,
+    can be merged, others, like steim compressed, are written as is.
+
+    For example:
+
+        async with MSeed3Aggregator(dali, maxLatency=2) as agg:
+            for ms3 in records:
+                await agg.add(ms3)
+
+    Use after id(), so the server's packet_size is known. If wait is False,
+    writes are pipelined, see DataLink.writeAckPipelined(), and their acks
+    are checked as they arrive and by flush() and close(). A failed write,
+    including one by the latency flush, is raised by the next add(),
+    flush() or close(), and its record stays buffered.
+    """
+
+    def __init__(self, dali, maxLatency=DEFAULT_MAX_LATENCY, packetSize=None, wait=True):
+        self.dali = dali
+        self.maxLatency = maxLatency
+        self._packetSize = packetSize
+        self.wait = wait
+        self.pending = dict()
+        self.recordsIn = 0
+        self.packetsOut = 0
+        self.error = None
+        self._flushTask = None
+        self._acks = deque()
+        # the flush task and add() share the connection, so write one at a time
+        self._lock = asyncio.Lock()
+
+    @property
+    def packetSize(self):
+        if self._packetSize is not None:
+            return self._packetSize
+        if self.dali.packet_size is not None and self.dali.packet_size > 0:
+            return self.dali.packet_size
+        return DEFAULT_PACKET_SIZE
+
+    async def add(self, ms3):
+        """
+        Add a record, writing any buffered record it can not be merged with.
+        """
+        self._checkError()
+        async with self._lock:
+            await self._add(ms3)
+
+    async def _add(self, ms3):
+        self.recordsIn += 1
+        if self._flushTask is None or self._flushTask.done():
+            self._flushTask = asyncio.create_task(self._flushLoop())
+        if ms3.header.encoding not in PRIMITIVE_SAMPLE_SIZE:
+            await self._write(ms3)
+            return
+        key = str(ms3.identifier)
+        pending = self.pending.get(key)
+        if pending is not None:
+            merged = None
+            # merged record keeps the first's headers, so only data is added
+            addSize = dataSize(ms3)
+            if (
+                pending.size + addSize <= self.packetSize
+                and pending.record.header.sampleRatePeriod == ms3.header.sampleRatePeriod
+            ):
+                merged = mseed3merge(pending.record, ms3)
+            if merged is not None and len(merged) == 1:
+                pending.record = merged[0]
+                pending.size += addSize
+                pending.lastDataSize = addSize
+            else:
+                await self._flush(key)
+                pending = None
+        if pending is None:
+            if recordSize(ms3) >= self.packetSize:
+                await self._write(ms3)
+                return
+            pending = _Pending(ms3, time.monotonic() + self.maxLatency)
+            self.pending[key] = pending
+        if pending.size + pending.lastDataSize > self.packetSize:
+            # another record like the last one would not fit
+            await self._flush(key)
+
+    async def flush(self, key=None):
+        """
+        Write the buffered record for a source id, or all if key is None,
+        and wait for the acks of pipelined writes.
+        """
+        self._checkError()
+        async with self._lock:
+            await self._flush(key)
+        await self._waitAcks()
+
+    async def _flush(self, key=None):
+        keys = [key] if key is not None else list(self.pending.keys())
+        for k in keys:
+            pending = self.pending.get(k)
+            if pending is not None:
+                await self._write(pending.record)
+                # only dropped once written, so a failed write keeps it
+                del self.pending[k]
+
+    async def flushExpired(self, now=None):
+        """
+        Write buffered records past their maxLatency deadline.
+        """
+        async with self._lock:
+            if now is None:
+                now = time.monotonic()
+            for key in [k for k, p in self.pending.items() if p.deadline <= now]:
+                await self._flush(key)
+
+    async def _flushLoop(self):
+        try:
+            while True:
+                await asyncio.sleep(max(self.maxLatency / 4, 0.01))
+                await self.flushExpired()
+        except Exception as e:
+            # nobody awaits this task, so keep the error for add()
+            self.error = e
+
+    def _checkError(self):
+        # acks arrive in order, so check those already done, which also
+        # keeps the list short
+        while self._acks and self._acks[0].done() and self.error is None:
+            self._ackDone(self._acks.popleft())
+        if self.error is not None:
+            raise self.error
+
+    def _ackDone(self, future):
+        # a pipelined record is already unbuffered, so its failure is kept
+        try:
+            self._checkAck(future.result())
+        except Exception as e:
+            self.error = e
+
+    @staticmethod
+    def _checkAck(r):
+        if r.type != "OK":
+            raise DaliException(f"write failed: {r.message}", r)
+
+    async def _write(self, ms3):
+        if self.wait:
+            self._checkAck(await self.dali.writeMSeed3(ms3))
+        else:
+            self._checkError()
+            self._acks.append(await self.dali.writeMSeed3(ms3, wait=False))
+        self.packetsOut += 1
+
+    async def _waitAcks(self):
+        while self._acks and self.error is None:
+            future = self._acks.popleft()
+            await asyncio.wait([future])
+            self._ackDone(future)
+        self._checkError()
+
+    async def close(self):
+        """
+        Write all buffered records.
+        """
+        async with self._lock:
+            # with the lock held the flush task is not part way through a write
+            if self._flushTask is not None:
+                self._flushTask.cancel()
+                self._flushTask = None
+            self._checkError()
+            await self._flush()
+        await self._waitAcks()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
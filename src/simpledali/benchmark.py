@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the DataLink read and write hot paths.
+
+Runs against an in-process DaliServer, so no ringserver is needed, and
+prints results as JSON so runs can be compared between releases:
+
+    python -m simpledali.benchmark --packets 20000 -o bench.json
+"""
+
+import argparse
+import asyncio
+from contextlib import aclosing
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+from simplemseed import MSeed3Header, MSeed3Record, FDSNSourceId
+
+from . import __version__
+from .dali2jsonl import Dali2Jsonl
+from .dalipacket import DaliPacket, JSON_TYPE, BZ2_JSON_TYPE, MSEED3_TYPE
+from .jsoncodec import JSON_CODECS, jsonCodec
+from .jsonencoder import (
+    encodeJSON, setJsonBackend, orjson, JSON_BACKEND_ORJSON, JSON_BACKEND_STDLIB
+)
+from .daliserver import DaliServer, MemoryRing
+from .socketdali import SocketDataLink, DaliFrameProtocol, encodeFrame
+from .util import datetimeToHPTime, utcnowWithTz, asyncioRun, eventLoopName
+from .websocketdali import WebSocketDataLink
+
+SOCKET = "socket"
+SOCKET_BUFFERED = "socket-buffered"
+WEBSOCKET = "websocket"
+
+PAYLOAD_TYPES = [JSON_TYPE, BZ2_JSON_TYPE, MSEED3_TYPE]
+
+
+def makeMessage():
+    return {
+        "time": utcnowWithTz(),
+        "station": "BENCH",
+        "values": [i * 0.5 for i in range(20)],
+    }
+
+
+def makePayload(payloadType):
+    """
+    A typical payload of the given type, returns streamid and data bytes.
+    """
+    if payloadType == MSEED3_TYPE:
+        header = MSeed3Header()
+        header.starttime = utcnowWithTz()
+        header.sampleRatePeriod = 100
+        sid = FDSNSourceId.parse("FDSN:XX_BENCH_00_H_H_Z")
+        ms3 = MSeed3Record(header, sid, list(range(100)))
+        return f"{sid}/{MSEED3_TYPE}", ms3.pack()
+    data = encodeJSON(makeMessage())
+    codec = jsonCodec(payloadType)
+    if codec is not None:
+        return f"FDSN:XX_BENCH_00_H_H_Z/{payloadType}", codec.compress(data)
+    return f"FDSN:XX_BENCH_00_H_H_Z/{JSON_TYPE}", data
+
+
+def result(name, transport, payloadType, packets, numBytes, seconds):
+    return {
+        "name": name,
+        "transport": transport,
+        "payload": payloadType,
+        "packets": packets,
+        "bytes": numBytes,
+        "seconds": round(seconds, 6),
+        "packetsPerSec": round(packets / seconds, 1) if seconds > 0 else None,
+        "bytesPerSec": round(numBytes / seconds, 1) if seconds > 0 else None,
+        "usecPerPacket": round(seconds * 1e6 / packets, 3) if packets > 0 else None,
+    }
+
+
+def createDali(server, transport, **kwargs):
+    if transport == WEBSOCKET:
+        return WebSocketDataLink(server.websocketurl, **kwargs)
+    return SocketDataLink(
+        server.host, server.port, buffered=(transport == SOCKET_BUFFERED), **kwargs
+    )
+
+
+async def benchStreamRead(transport, payloadType, numPackets):
+    streamid, data = makePayload(payloadType)
+    ring = MemoryRing(maxPackets=numPackets)
+    now = datetimeToHPTime(utcnowWithTz())
+    for i in range(numPackets):
+        ring.add(streamid, now, now, data)
+    async with DaliServer(ring=ring, websocket=(transport == WEBSOCKET)) as server:
+        async with createDali(server, transport) as dali:
+            await dali.id("benchmark", "simpledali", 0, "python")
+            await dali.positionEarliest()
+            count = 0
+            numBytes = 0
+            start = time.perf_counter()
+            async with aclosing(dali.stream()) as packets:
+                async for daliPacket in packets:
+                    count += 1
+                    numBytes += daliPacket.dSize
+                    if count == numPackets:
+                        break
+            seconds = time.perf_counter() - start
+    return result("stream_read", transport, payloadType, count, numBytes, seconds)
+
+
+async def benchWriteAck(transport, payloadType, numPackets, pipelined):
+    streamid, data = makePayload(payloadType)
+    ring = MemoryRing(maxPackets=numPackets, packet_size=max(512, len(data)))
+    async with DaliServer(ring=ring, websocket=(transport == WEBSOCKET)) as server:
+        async with createDali(server, transport) as dali:
+            await dali.id("benchmark", "simpledali", 0, "python")
+            now = datetimeToHPTime(utcnowWithTz())
+            start = time.perf_counter()
+            if pipelined:
+                for i in range(numPackets):
+                    await dali.writeAckPipelined(streamid, now, now, data, pktid=i)
+                await dali.flushAcks()
+            else:
+                for i in range(numPackets):
+                    await dali.writeAck(streamid, now, now, data, pktid=i)
+            seconds = time.perf_counter() - start
+    name = "write_ack_pipelined" if pipelined else "write_ack"
+    return result(name, transport, payloadType, numPackets, numPackets * len(data), seconds)
+
+
+async def benchWriteNoAck(transport, payloadType, numPackets, flush_bytes):
+    streamid, data = makePayload(payloadType)
+    ring = MemoryRing(maxPackets=numPackets, packet_size=max(512, len(data)))
+    async with DaliServer(ring=ring, websocket=(transport == WEBSOCKET)) as server:
+        kwargs = {"flush_bytes": flush_bytes} if transport != WEBSOCKET else {}
+        async with createDali(server, transport, **kwargs) as dali:
+            await dali.id("benchmark", "simpledali", 0, "python")
+            now = datetimeToHPTime(utcnowWithTz())
+            start = time.perf_counter()
+            for i in range(numPackets):
+                await dali.write(streamid, now, now, "N", data)
+            await dali.flush()
+            # done once the server has them all
+            while ring.rxPackets < numPackets:
+                await asyncio.sleep(0.001)
+            seconds = time.perf_counter() - start
+    name = "write_noack_bulk" if flush_bytes > 0 else "write_noack"
+    return result(name, transport, payloadType, numPackets, numPackets * len(data), seconds)
+
+
+class _OpenWriter:
+    """Stands in for a StreamWriter so parseResponse sees an open connection."""
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+async def benchParseResponse(payloadType, numPackets, buffered):
+    streamid, data = makePayload(payloadType)
+    frame = encodeFrame(f"PACKET {streamid} 1 0 0 0 {len(data)}", data)
+    allFrames = frame * numPackets
+    if buffered:
+        protocol = DaliFrameProtocol()
+        protocol.connection_made(None)
+        start = time.perf_counter()
+        pos = 0
+        count = 0
+        while pos < len(allFrames):
+            buf = protocol.get_buffer(-1)
+            n = min(len(buf), len(allFrames) - pos)
+            buf[:n] = allFrames[pos : pos + n]
+            del buf
+            pos += n
+            protocol.buffer_updated(n)
+            while protocol.hasFrames():
+                await protocol.nextFrame()
+                count += 1
+        seconds = time.perf_counter() - start
+    else:
+        dali = SocketDataLink("localhost", 0)
+        dali.reader = asyncio.StreamReader(limit=len(allFrames) + 1)
+        dali.reader.feed_data(allFrames)
+        dali.writer = _OpenWriter()
+        start = time.perf_counter()
+        for count in range(1, numPackets + 1):
+            await dali.parseResponse()
+        seconds = time.perf_counter() - start
+    transport = SOCKET_BUFFERED if buffered else SOCKET
+    return result("parse_response", transport, payloadType, count, count * len(data), seconds)
+
+
+def benchSaveToJSONL(payloadType, numPackets, numStations=10):
+    streamid, data = makePayload(payloadType)
+    now = str(datetimeToHPTime(utcnowWithTz()))
+    packets = [
+        DaliPacket(
+            "PACKET",
+            f"FDSN:XX_B{i % numStations:04d}_00_H_H_Z/{JSON_TYPE}",
+            str(i),
+            now,
+            now,
+            now,
+            len(data),
+            data,
+        )
+        for i in range(numPackets)
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pattern = str(pathlib.Path(tmpdir) / "%n/%s/%Y/%j/%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        d2j = Dali2Jsonl(".*", pattern)
+        start = time.perf_counter()
+        for daliPacket in packets:
+            d2j.saveToJSONL(daliPacket)
+        d2j.fileCache.closeAll()
+        seconds = time.perf_counter() - start
+    return result("save_jsonl", "file", payloadType, numPackets, numPackets * len(data), seconds)
+
+
+def benchJsonCodec(payloadType, numPackets):
+    """
+    Compress and decompress JSON messages, bytes is the compressed size.
+    """
+    codec = jsonCodec(payloadType)
+    streamid, data = makePayload(JSON_TYPE)
+    start = time.perf_counter()
+    numBytes = 0
+    for i in range(numPackets):
+        compressed = codec.compress(data)
+        codec.decompress(compressed)
+        numBytes += len(compressed)
+    seconds = time.perf_counter() - start
+    return result("json_codec", "cpu", payloadType, numPackets, numBytes, seconds)
+
+
+def benchJsonEncode(backend, numPackets):
+    """
+    Encode JSON messages, with a datetime, as writeJSON() does.
+    """
+    message = makeMessage()
+    previous = setJsonBackend(backend)
+    try:
+        start = time.perf_counter()
+        numBytes = 0
+        for i in range(numPackets):
+            numBytes += len(encodeJSON(message))
+        seconds = time.perf_counter() - start
+    finally:
+        setJsonBackend(previous)
+    return result("json_encode", "cpu", backend, numPackets, numBytes, seconds)
+
+
+async def runAll(numPackets, only=None):
+    """
+    Run the benchmarks, returns the name of the event loop and the results.
+    """
+    benches = []
+    for transport in [SOCKET, SOCKET_BUFFERED, WEBSOCKET]:
+        for payloadType in PAYLOAD_TYPES:
+            benches.append(("stream_read", lambda t=transport, p=payloadType: benchStreamRead(t, p, numPackets)))
+    for transport in [SOCKET, WEBSOCKET]:
+        benches.append(("write_ack", lambda t=transport: benchWriteAck(t, MSEED3_TYPE, numPackets, False)))
+        benches.append(("write_ack_pipelined", lambda t=transport: benchWriteAck(t, MSEED3_TYPE, numPackets, True)))
+    benches.append(("write_noack", lambda: benchWriteNoAck(SOCKET, MSEED3_TYPE, numPackets, 0)))
+    benches.append(("write_noack_bulk", lambda: benchWriteNoAck(SOCKET, MSEED3_TYPE, numPackets, 64 * 1024)))
+    for payloadType in PAYLOAD_TYPES:
+        for buffered in [False, True]:
+            benches.append(("parse_response", lambda p=payloadType, b=buffered: benchParseResponse(p, numPackets, b)))
+    results = []
+    for name, bench in benches:
+        if only is not None and only not in name:
+            continue
+        results.append(await bench())
+    if only is None or only in "save_jsonl":
+        results.append(benchSaveToJSONL(JSON_TYPE, numPackets))
+    if only is None or only in "json_encode":
+        results.append(benchJsonEncode(JSON_BACKEND_STDLIB, numPackets))
+        if orjson is not None:
+            results.append(benchJsonEncode(JSON_BACKEND_ORJSON, numPackets))
+    if only is None or only in "json_codec":
+        for payloadType, codec in JSON_CODECS.items():
+            if codec.isAvailable():
+                results.append(benchJsonCodec(payloadType, numPackets))
+    return eventLoopName(), results
+
+
+def do_parseargs():
+    parser = argparse.ArgumentParser(
+        description=f"""
+        Benchmark simpledali read and write paths against an in-process server.
+        Version={__version__}"""
+    )
+    parser.add_argument(
+        "-n", "--packets", help="number of packets per benchmark", type=int, default=10000
+    )
+    parser.add_argument(
+        "--only", help="only run benchmarks whose name contains this string"
+    )
+    parser.add_argument(
+        "-o", "--output", help="write JSON results to file instead of stdout"
+    )
+    parser.add_argument(
+        "--uvloop", help="run on the uvloop event loop, if installed", action="store_true"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = do_parseargs()
+    loopName, results = asyncioRun(runAll(args.packets, only=args.only), use_uvloop=args.uvloop)
+    out = {
+        "simpledali": __version__,
+        "python": platform.python_version(),
+        "eventLoop": loopName,
+        "platform": platform.platform(),
+        "timestamp": utcnowWithTz().isoformat(),
+        "packetsPerBenchmark": args.packets,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
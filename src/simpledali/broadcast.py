@@ -0,0 +1,189 @@
+import asyncio
+from collections import deque
+from contextlib import aclosing
+
+from .dalipacket import DaliException
+
+# what to do when a subscriber's queue is full
+# with OVERFLOW_BLOCK a subscriber that stops reading without close()
+# blocks the broadcaster for good, so use it with async with
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DISCONNECT = "disconnect"
+
+OVERFLOW_POLICIES = [OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_DISCONNECT]
+
+
+class Subscription:
+    """
+    A subscriber's bounded queue of packets from a DaliBroadcaster, used as
+    an async iterator. Create with DaliBroadcaster.subscribe().
+
+    When the queue is full, the overflow policy either blocks the
+    broadcaster, and so all other subscribers, until there is room, drops
+    the oldest packet in the queue, drops the new packet, or disconnects
+    this subscriber. After a disconnect, iterating raises DaliException
+    once the queue is empty.
+
+    Breaking out of async for does not end the subscription, so a
+    subscriber that stops reading must close() it, else with OVERFLOW_BLOCK
+    the broadcaster waits on it forever. Using async with closes it on
+    leaving the block:
+
+        async with broadcaster.subscribe() as sub:
+            async for daliPacket in sub:
+                ...
+    """
+
+    def __init__(self, broadcaster, maxsize, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}: {overflow}")
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1: {maxsize}")
+        self.broadcaster = broadcaster
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.ended = False
+        self.disconnected = False
+        self._items = deque()
+        self._getter = None
+        self._putter = None
+
+    def qsize(self):
+        return len(self._items)
+
+    def __aiter__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __anext__(self):
+        while not self._items:
+            if self.disconnected:
+                raise DaliException("Subscriber disconnected, too slow to keep up")
+            if self.ended:
+                raise StopAsyncIteration
+            self._getter = asyncio.get_running_loop().create_future()
+            await self._getter
+        item = self._items.popleft()
+        self._wake(self._putter)
+        return item
+
+    async def put(self, daliPacket):
+        """
+        Add a packet, applying the overflow policy if full.
+        """
+        if self.ended:
+            return
+        if len(self._items) >= self.maxsize:
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._items.popleft()
+                self.dropped += 1
+            elif self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+                return
+            elif self.overflow == OVERFLOW_DISCONNECT:
+                self.disconnect()
+                return
+            else:
+                while len(self._items) >= self.maxsize and not self.ended:
+                    self._putter = asyncio.get_running_loop().create_future()
+                    await self._putter
+                if self.ended:
+                    return
+        self._items.append(daliPacket)
+        self._wake(self._getter)
+
+    def disconnect(self):
+        """
+        Drop queued packets and end this subscription with an error.
+        """
+        self.dropped += len(self._items)
+        self._items.clear()
+        self.disconnected = True
+        self.close()
+
+    def close(self):
+        """
+        Stop receiving packets. Packets already queued can still be read.
+        """
+        self.ended = True
+        self.broadcaster.unsubscribe(self)
+        self._wake(self._getter)
+        self._wake(self._putter)
+
+    async def aclose(self):
+        """
+        close(), for contextlib.aclosing().
+        """
+        self.close()
+
+    @staticmethod
+    def _wake(waiter):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class DaliBroadcaster:
+    """
+    Reads packets from a single DataLink stream and gives each one to
+    every subscriber, so one connection can serve many consumers.
+
+    For example:
+
+        broadcaster = DaliBroadcaster(dali)
+        archive = broadcaster.subscribe(maxsize=1000)
+        latency = broadcaster.subscribe(maxsize=10, overflow=OVERFLOW_DROP_OLDEST)
+        task = asyncio.create_task(broadcaster.run())
+        async for daliPacket in latency:
+            ...
+
+    The DataLink should already be configured, ie id, match, position.
+    If resume is True, streamResume() is used instead of stream().
+    """
+
+    def __init__(self, dali, resume=False):
+        self.dali = dali
+        self.resume = resume
+        self.subscribers = []
+        self.packetCount = 0
+
+    def subscribe(self, maxsize=1000, overflow=OVERFLOW_BLOCK):
+        """
+        Add a subscriber with a queue of at most maxsize packets.
+        """
+        sub = Subscription(self, maxsize, overflow)
+        self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub in self.subscribers:
+            self.subscribers.remove(sub)
+
+    async def publish(self, daliPacket):
+        """
+        Give a packet to all current subscribers.
+        """
+        self.packetCount += 1
+        for sub in list(self.subscribers):
+            await sub.put(daliPacket)
+
+    async def run(self):
+        """
+        Stream packets to subscribers until the stream ends. All
+        subscriptions are ended when this returns.
+        """
+        packetStream = self.dali.streamResume() if self.resume else self.dali.stream()
+        try:
+            async with aclosing(packetStream) as packets:
+                async for daliPacket in packets:
+                    await self.publish(daliPacket)
+        finally:
+            for sub in list(self.subscribers):
+                sub.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import pathlib
+import time
+
+DEFAULT_CHECKPOINT_PACKETS = 1000
+DEFAULT_CHECKPOINT_SECONDS = 10
+
+
+class Checkpoint:
+    """
+    The last archived packet, saved to a small JSON state file so a
+    restart can continue from there instead of the live edge or the
+    start of the ring.
+
+    Call update() for each packet once it is handed to the writer, and when
+    isDue(), make sure the output is written and then save(). The file is
+    replaced atomically, so after a crash it holds either the previous or
+    the new checkpoint, never a partial one.
+    """
+
+    def __init__(
+        self, path, everyPackets=DEFAULT_CHECKPOINT_PACKETS, everySeconds=DEFAULT_CHECKPOINT_SECONDS,
+        verbose=False
+    ):
+        self.path = pathlib.Path(path)
+        self.verbose = verbose
+        self.everyPackets = everyPackets
+        self.everySeconds = everySeconds
+        self.last = None
+        self.unsaved = 0
+        self.lastSave = time.monotonic()
+
+    def update(self, daliPacket):
+        """
+        Record the packet as the latest archived.
+        """
+        self.last = {
+            "packetId": daliPacket.packetId,
+            "packetTime": daliPacket.packetHPTime,
+            "dataStartTime": daliPacket.dataStartHPTime,
+            "streamId": daliPacket.streamId,
+        }
+        self.unsaved += 1
+
+    def isDue(self, now=None):
+        if self.unsaved == 0:
+            return False
+        if self.everyPackets > 0 and self.unsaved >= self.everyPackets:
+            return True
+        if now is None:
+            now = time.monotonic()
+        return now - self.lastSave >= self.everySeconds
+
+    def save(self):
+        """
+        Atomically write the latest packet to the state file, if any
+        updates since the last save.
+        """
+        if self.last is None or self.unsaved == 0:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.last, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # fsync the directory so the rename itself survives a crash
+        dirfd = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dirfd)
+        finally:
+            os.close(dirfd)
+        self.unsaved = 0
+        self.lastSave = time.monotonic()
+
+    def load(self):
+        """
+        The saved checkpoint as a dict, or None if there is no usable state
+        file.
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            # check needed values are present
+            state["packetId"], state["packetTime"], state["dataStartTime"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            if self.verbose:
+                print(f"ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        return state
+
+    async def position(self, dali):
+        """
+        Position the DataLink after the saved packet. Returns False if
+        there is no checkpoint, leaving the position unchanged.
+        """
+        state = self.load()
+        if state is None:
+            return False
+        await dali.positionAfterPacket(state["packetId"], state["packetTime"], state["dataStartTime"])
+        return True
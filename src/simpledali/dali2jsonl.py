@@ -2,10 +2,8 @@
 """Archive JSON Datalink records as JSON Lines."""
 
 import argparse
-import bz2
 import asyncio
-import pathlib
-import re
+from concurrent.futures import ThreadPoolExecutor
 import sys
 
 # tomllib is std in python > 3.11 so do conditional import
@@ -14,34 +12,224 @@ try:
 except ModuleNotFoundError:
     import tomli as tomllib
 
-from .dalipacket import JSON_TYPE, BZ2_JSON_TYPE
+from .dalipacket import JSON_TYPE, BZ2_JSON_TYPE, ZSTD_JSON_TYPE, LZ4_JSON_TYPE
+from .jsoncodec import ZstdJsonCodec, jsonCodec, registerJsonCodec
 from .socketdali import SocketDataLink
 from .websocketdali import WebSocketDataLink
-from .util import hptimeToDatetime
+from .util import asyncioRun
+from .checkpoint import Checkpoint, DEFAULT_CHECKPOINT_PACKETS, DEFAULT_CHECKPOINT_SECONDS
+from .filecache import (
+    FileHandleCache,
+    FlushPolicy,
+    checkCompression,
+    COMPRESSION_NONE,
+    COMPRESSION_SUFFIX,
+    DEFAULT_MAX_OPEN,
+    DEFAULT_MAX_IDLE,
+)
+from .writepattern import PatternPaths, WritePattern, Allowed_Flags, checkPattern
 from . import __version__
-from simplemseed import FDSNSourceId, FDSN_PREFIX
+from simplemseed import FDSNSourceId
 
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 16000
+DEFAULT_PIPELINE_WORKERS = 4
+DEFAULT_PIPELINE_QUEUE_SIZE = 1000
 
-Allowed_Flags = ["n", "s", "l", "c", "Y", "j", "H"]
+
+class PipelineLane:
+    """
+    One ordered lane of a JsonlPipeline, a bounded queue of records and
+    the output files only this lane writes to.
+    """
+
+    def __init__(self, d2j, queueSize):
+        self.queue = asyncio.Queue(maxsize=queueSize)
+        self.fileCache = FileHandleCache(
+            maxOpen=d2j.fileCache.maxOpen,
+            maxIdle=d2j.fileCache.maxIdle,
+            flushPolicy=d2j.fileCache.flushPolicy,
+            compression=d2j.fileCache.compression,
+            compressionLevel=d2j.fileCache.compressionLevel,
+            binary=d2j.fileCache.binary,
+            verbose=d2j.verbose,
+        )
+        self.fileCache.syncToDisk = d2j.fileCache.syncToDisk
+        self.currentFiles = dict()
+
+
+class JsonlPipeline:
+    """
+    Moves BZJSON decompression and file writes off the event loop, so the
+    DataLink connection keeps being read while the disk is slow.
+
+    Records go to one of several lanes by the channel's output file
+    pattern before the time is filled in, so all files of a channel, and
+    of channels sharing files, are in the same lane and the previous hour's
+    file is closed when the channel rolls over. Each lane has a bounded
+    queue and is written by at most one pool thread at a time, so records
+    for a file stay in order. When all queues are full, put()
+    waits, applying back pressure to the stream. A thread pool is used
+    as bz2 and file writes release the GIL, and lanes keep their open
+    files, which could not be shared with a process pool.
+    """
+
+    def __init__(self, d2j, workers=DEFAULT_PIPELINE_WORKERS, queueSize=DEFAULT_PIPELINE_QUEUE_SIZE):
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1: {workers}")
+        self.d2j = d2j
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dali2jsonl")
+        self.lanes = [PipelineLane(d2j, queueSize) for i in range(workers)]
+        self.error = None
+        # lane for each channel, from its output file pattern
+        self.channelLanes = dict()
+        self.tasks = [asyncio.create_task(self._runLane(lane)) for lane in self.lanes]
+
+    async def put(self, daliPacket):
+        """
+        Queue a packet for writing, waiting if its lane is full.
+        """
+        if self.error is not None:
+            raise self.error
+        d2j = self.d2j
+        packetType = daliPacket.streamIdType()
+        if not d2j.isArchived(packetType):
+            if d2j.verbose:
+                print(f"    Skip {packetType} packet")
+            return
+        outfile = d2j.paths.pathForPacket(daliPacket)
+        if outfile is None:
+            if d2j.verbose:
+                print(f"   unable to parse stream id {daliPacket.streamIdChannel()}, skipping")
+            return
+        channel = daliPacket.streamIdChannel()
+        lane = self.channelLanes.get(channel)
+        if lane is None:
+            base = d2j.fillBaseSidPattern(daliPacket.sourceId())
+            lane = self.lanes[hash(base) % len(self.lanes)]
+            self.channelLanes[channel] = lane
+        record = (channel, outfile, packetType, bytes(daliPacket.data))
+        await lane.queue.put(record)
+
+    async def _runLane(self, lane):
+        loop = asyncio.get_running_loop()
+        flushInterval = max(lane.fileCache.flushPolicy.checkInterval(), 0.01)
+        # close or flush marker read while collecting a batch
+        pending = []
+        try:
+            while True:
+                if pending:
+                    record = pending.pop()
+                else:
+                    try:
+                        record = await asyncio.wait_for(lane.queue.get(), flushInterval)
+                    except asyncio.TimeoutError:
+                        await loop.run_in_executor(self.executor, lane.fileCache.flushExpired)
+                        continue
+                if record is None:
+                    break
+                if isinstance(record, asyncio.Future):
+                    # flush marker from flush()
+                    await loop.run_in_executor(self.executor, lane.fileCache.flushAll, True)
+                    record.set_result(None)
+                    continue
+                batch = [record]
+                while not lane.queue.empty():
+                    record = lane.queue.get_nowait()
+                    if record is None or isinstance(record, asyncio.Future):
+                        pending.append(record)
+                        break
+                    batch.append(record)
+                await loop.run_in_executor(self.executor, self._writeBatch, lane, batch)
+        except Exception as e:
+            self.error = e
+            # unblock a waiting put, records are lost after an error
+            while not lane.queue.empty():
+                record = lane.queue.get_nowait()
+                if isinstance(record, asyncio.Future) and not record.done():
+                    record.set_exception(e)
+        finally:
+            await loop.run_in_executor(self.executor, lane.fileCache.closeAll)
+
+    def _writeBatch(self, lane, batch):
+        d2j = self.d2j
+        for channel, outfile, packetType, data in batch:
+            d2j.writeRecord(channel, outfile, d2j.decodeData(packetType, data), lane)
+        lane.fileCache.flushExpired()
+
+    async def flush(self):
+        """
+        Wait until all records queued so far are written and flushed.
+        """
+        if self.error is not None:
+            raise self.error
+        loop = asyncio.get_running_loop()
+        markers = []
+        for lane in self.lanes:
+            marker = loop.create_future()
+            await lane.queue.put(marker)
+            markers.append(marker)
+        await asyncio.gather(*markers)
+
+    async def close(self):
+        """
+        Write all queued records and close the output files.
+        """
+        for lane, task in zip(self.lanes, self.tasks):
+            if not task.done():
+                await lane.queue.put(None)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown()
+        if self.error is not None:
+            raise self.error
 
 
 class Dali2Jsonl:
     """
     Archive JSON Datalink records as JSONL.
+
+    Subclasses may archive other packet types by overriding the class
+    attributes and formatRecord(), see Dali2MSeed.
     """
 
+    # section of the configuration toml for output
+    CONFIG_SECTION = "jsonl"
+    PROGRAM_NAME = "dali2jsonl"
+    # packet types archived, others are skipped
+    PACKET_TYPES = (JSON_TYPE, BZ2_JSON_TYPE, ZSTD_JSON_TYPE, LZ4_JSON_TYPE)
+    # output files are binary instead of utf-8 text
+    BINARY = False
+
     def __init__(
-        self, match, writePattern, bandPatterns=dict(), host=DEFAULT_HOST, port=DEFAULT_PORT, websocketurl=None, verbose=False
+        self, match, writePattern, bandPatterns=dict(), host=DEFAULT_HOST, port=DEFAULT_PORT, websocketurl=None, verbose=False,
+        maxOpenFiles=DEFAULT_MAX_OPEN, maxIdle=DEFAULT_MAX_IDLE, flushPolicy=None,
+        pipelineWorkers=DEFAULT_PIPELINE_WORKERS, pipelineQueueSize=DEFAULT_PIPELINE_QUEUE_SIZE,
+        compression=COMPRESSION_NONE, compressionLevel=None
     ):
         self.checkPattern(writePattern)
         for key, pat in bandPatterns.items():
             self.checkPattern(pat)
+        checkCompression(compression)
+        # compressed files get the suffix, ie .gz, unless pattern has it
+        suffix = COMPRESSION_SUFFIX[compression]
+        if suffix and not writePattern.endswith(suffix):
+            writePattern = writePattern + suffix
+        bandPatterns = {
+            band: pat if not suffix or pat.endswith(suffix) else pat + suffix
+            for band, pat in bandPatterns.items()
+        }
         self.do_earliest = False
+        self.do_reconnect = False
+        self.do_pipeline = False
+        self.checkpoint = None
+        # counts of packets and data bytes received
+        self.stats = {"packets": 0, "bytes": 0}
+        self.pipelineWorkers = pipelineWorkers
+        self.pipelineQueueSize = pipelineQueueSize
         self.match = match
         self.writePattern = writePattern
         self.bandPatterns = bandPatterns
+        self.paths = PatternPaths(writePattern, bandPatterns)
         self.websocketurl = websocketurl
 
         if host is not None:
@@ -53,9 +241,16 @@ class Dali2Jsonl:
         else:
             self.port = DEFAULT_PORT
         self.verbose = verbose
+        self.fileCache = FileHandleCache(
+            maxOpen=maxOpenFiles, maxIdle=maxIdle, flushPolicy=flushPolicy,
+            compression=compression, compressionLevel=compressionLevel, binary=self.BINARY,
+            verbose=verbose
+        )
+        # last output file per channel, to close it when the hour rolls over
+        self.currentFiles = dict()
 
         self.programname = "simpleDali"
-        self.username = "Dali2Jsonl"
+        self.username = type(self).__name__
         self.processid = 0
         self.architecture = "python"
         if self.verbose:
@@ -72,8 +267,9 @@ class Dali2Jsonl:
         Configured Dali2Jsonl using dict, eg from .toml config file.
         """
         cls.configure_defaults(conf)
+        out_conf = conf[cls.CONFIG_SECTION]
         bandwrite=dict()
-        for band, pat in conf["jsonl"]["bandwrite"].items():
+        for band, pat in out_conf["bandwrite"].items():
             if len(band) > 1:
                 raise ValueError(
                     f"band {band} not allowed for write pattern {pat}"
@@ -81,22 +277,44 @@ class Dali2Jsonl:
             if len(pat) == 1:
                 # assume reuse previously define band
                 if pat in bandwrite:
-                    bandwrite[band] = conf["jsonl"]["bandwrite"][pat]
+                    bandwrite[band] = out_conf["bandwrite"][pat]
                 else:
                     raise ValueError(
                         f"band {band} references {pat} not previously defined"
                     )
             else:
                 bandwrite[band] = pat
-        return cls(
+        d2j = cls(
             conf["datalink"]["match"],
-            conf["jsonl"]["write"],
+            out_conf["write"],
             bandPatterns=bandwrite,
             host=conf["datalink"]["host"],
             port=conf["datalink"]["port"],
             websocketurl=conf["datalink"]["websocket"],
             verbose=verbose,
+            maxOpenFiles=out_conf["max_open_files"],
+            maxIdle=out_conf["max_idle"],
+            flushPolicy=FlushPolicy.from_config(out_conf),
+            pipelineWorkers=out_conf["workers"],
+            pipelineQueueSize=out_conf["queue_size"],
+            compression=out_conf["compression"],
+            compressionLevel=out_conf["compression_level"],
         )
+        if out_conf.get("zstd_dictionary") is not None:
+            # packets are compressed with a shared dictionary
+            with open(out_conf["zstd_dictionary"], "rb") as f:
+                registerJsonCodec(ZstdJsonCodec(dictionary=f.read()))
+        d2j.do_earliest = conf["datalink"]["earliest"]
+        d2j.do_reconnect = conf["datalink"]["reconnect"]
+        d2j.do_pipeline = out_conf["pipeline"]
+        if out_conf["checkpoint"] is not None:
+            d2j.checkpoint = Checkpoint(
+                out_conf["checkpoint"],
+                everyPackets=out_conf["checkpoint_packets"],
+                everySeconds=out_conf["checkpoint_seconds"],
+                verbose=verbose,
+            )
+        return d2j
 
     async def run(self):
         if self.websocketurl:
@@ -119,7 +337,10 @@ class Dali2Jsonl:
             print(f"Id: {serverId}")
 
         await dali.match(self.match)
-        if self.do_earliest:
+        if self.checkpoint is not None and await self.checkpoint.position(dali):
+            if self.verbose:
+                print(f"Resume after checkpoint in {self.checkpoint.path}")
+        elif self.do_earliest:
             await dali.positionEarliest()
         await self.stream_data(dali)
 
@@ -129,71 +350,157 @@ class Dali2Jsonl:
     async def stream_data(self, dali):
         if self.verbose:
             print("Stream")
+        if self.do_reconnect:
+            packetStream = dali.streamResume()
+        else:
+            packetStream = dali.stream()
+        # the checkpoint is fsynced, so the data it refers to must be too
+        self.fileCache.syncToDisk = self.checkpoint is not None
+        if self.do_pipeline:
+            pipeline = JsonlPipeline(self, self.pipelineWorkers, self.pipelineQueueSize)
+            flushTask = None
+        else:
+            pipeline = None
+            flushTask = asyncio.create_task(self.flushLoop())
         try:
-            async for daliPacket in dali.stream():
+            async for daliPacket in packetStream:
                 if self.verbose:
                     print(f"Got Dali packet: {daliPacket}")
-                if daliPacket.streamIdType() == JSON_TYPE:
-                    if self.verbose:
-                        print(f"    JSON: {daliPacket.data.decode('utf-8')}")
-                    self.saveToJSONL(daliPacket)
-                elif daliPacket.streamIdType() == BZ2_JSON_TYPE:
-                    daliPacket.data = bz2.decompress(daliPacket.data)
-                    daliPacket.dSize = len(daliPacket.data)
-                    if self.verbose:
-                        print(f"    BZ2 JSON: {daliPacket.data.decode('utf-8')}")
-                    self.saveToJSONL(daliPacket)
+                self.stats["packets"] += 1
+                self.stats["bytes"] += daliPacket.dSize
+                if pipeline is not None:
+                    await pipeline.put(daliPacket)
                 else:
-                    if self.verbose:
-                        print(f"    Not JSON packet: {daliPacket.streamIdType()}")
+                    self.handlePacket(daliPacket)
+                if self.checkpoint is not None:
+                    self.checkpoint.update(daliPacket)
+                    if self.checkpoint.isDue():
+                        await self.saveCheckpoint(pipeline)
         except asyncio.exceptions.CancelledError:
             if self.verbose:
                 print("Dali task cancelled")
             return
+        finally:
+            if pipeline is not None:
+                await pipeline.close()
+            else:
+                flushTask.cancel()
+                self.fileCache.closeAll()
+                self.currentFiles.clear()
+            # files all closed, so everything handled so far is written
+            if self.checkpoint is not None:
+                self.checkpoint.save()
+
+    async def saveCheckpoint(self, pipeline=None):
+        """
+        Flush and fsync output files and then save the checkpoint, so it
+        never refers to a packet that is not yet on disk.
+        """
+        if pipeline is not None:
+            await pipeline.flush()
+        else:
+            self.fileCache.flushAll(sync=True)
+        self.checkpoint.save()
 
-    def saveToJSONL(self, daliPacket):
-        start = hptimeToDatetime(daliPacket.dataStartTime)
-        codesStr = daliPacket.streamId
-        # remove "type" like /JSON
-        codesStr = daliPacket.streamIdChannel()
-        sid = None
-        if (codesStr.startswith(FDSN_PREFIX)):
-            sid = FDSNSourceId.parse(codesStr)
-        elif len(codesStr.split('_')) == 4:
-            sid = FDSNSourceId.parseNslc(codesStr, '_')
-        if sid is not None:
-            outfile = self.fileFromSidPattern(sid, start)
-            outfile.parent.mkdir(parents=True, exist_ok=True)
-            with open(outfile, "a", encoding="utf-8") as out:
-                out.write(daliPacket.data.decode("utf-8") + "\n")
-                if self.verbose:
-                    print(f"   write to {outfile}")
+    def isArchived(self, packetType):
+        """
+        True if packets of the type are archived, ie JSON or a compressed
+        JSON type with a registered codec whose package is installed.
+        """
+        codec = jsonCodec(packetType)
+        if codec is not None:
+            return codec.isAvailable()
+        return packetType in self.PACKET_TYPES
+
+    def handlePacket(self, daliPacket):
+        """
+        Decompress if needed and save a JSON or compressed JSON packet,
+        ie BZJSON, others are skipped. Subclasses archiving other types
+        override this.
+        """
+        packetType = daliPacket.streamIdType()
+        if packetType == JSON_TYPE:
+            if self.verbose:
+                print(f"    JSON: {str(daliPacket.data, 'utf-8')}")
+            self.savePacket(daliPacket)
+        elif self.isArchived(packetType):
+            daliPacket.data = jsonCodec(packetType).decompress(daliPacket.data)
+            daliPacket.dSize = len(daliPacket.data)
+            if self.verbose:
+                print(f"    {packetType}: {str(daliPacket.data, 'utf-8')}")
+            self.savePacket(daliPacket)
+        else:
+            if self.verbose:
+                print(f"    Not JSON packet: {packetType}")
+
+    async def flushLoop(self):
+        """
+        Flush buffered records past their max age even when no packets
+        arrive for those files.
+        """
+        interval = max(self.fileCache.flushPolicy.checkInterval(), 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            self.fileCache.flushExpired()
+
+    def decodeData(self, packetType, data):
+        """
+        Packet data as it is to be archived, ie decompressed.
+        """
+        codec = jsonCodec(packetType)
+        if codec is not None:
+            return codec.decompress(data)
+        return data
+
+    def formatRecord(self, data):
+        """
+        The record written to the output file for the packet data.
+        """
+        return str(data, "utf-8") + "\n"
+
+    def savePacket(self, daliPacket):
+        """
+        Write the packet data to its output file from the write pattern.
+        """
+        outfile = self.paths.pathForPacket(daliPacket)
+        if outfile is not None:
+            self.writeRecord(daliPacket.streamIdChannel(), outfile, daliPacket.data)
         else:
             if self.verbose:
-                print(f"   unable to parse stream id {codesStr}, skipping")
+                print(f"   unable to parse stream id {daliPacket.streamIdChannel()}, skipping")
+
+    saveToJSONL = savePacket
+
+    def writeRecord(self, channel, outfile, data, lane=None):
+        """
+        Append the data as a record to outfile, using the files of the
+        pipeline lane if given.
+        """
+        files = lane if lane is not None else self
+        prevfile = files.currentFiles.get(channel)
+        if prevfile != outfile:
+            if prevfile is not None:
+                # rolled over to a new file, drain and close the old one
+                files.fileCache.close(prevfile)
+            files.currentFiles[channel] = outfile
+        out = files.fileCache.get(outfile)
+        out.write(self.formatRecord(data))
+        files.fileCache.flushExpired()
+        if self.verbose:
+            print(f"   write to {outfile}")
 
     def fileFromSidPattern(self, sid: FDSNSourceId, time):
-        outfile = self.fillBaseSidPattern(sid)
-        outfile = self.fillTimePattern(outfile, time)
-        return pathlib.Path(outfile)
+        return self.paths.path(sid, time)
 
     def fillBaseSidPattern(self, sid: FDSNSourceId):
-        pattern = self.writePattern
-        if sid.bandCode in self.bandPatterns:
-            pattern = self.bandPatterns[sid.bandCode]
-        return (
-            pattern.replace("%n", sid.networkCode)
-            .replace("%s", sid.stationCode)
-            .replace("%l", sid.locationCode)
-            .replace("%c", sid.shortChannelCode())
-        )
+        return self.paths.patternFor(sid).fillSid(sid)
 
     def fillTimePattern(self, base, time):
-        return (
-            base.replace("%Y", str(time.year).zfill(4))
-            .replace("%j", str(time.timetuple().tm_yday).zfill(3))
-            .replace("%H", str(time.hour).zfill(2))
-        )
+        """
+        Fill the time flags of a pattern already filled by
+        fillBaseSidPattern().
+        """
+        return WritePattern(base).fill(None, time)
 
     def checkPattern(self, p):
         """
@@ -211,26 +518,15 @@ class Dali2Jsonl:
         @returns true if all flags are allowed
 
         """
+        return checkPattern(p)
 
-        if len(p) == 0:
-            raise ValueError(f"write pattern is empty '{p}'")
-        regexp = re.compile("%[a-zA-Z]")
-        allFlags = regexp.findall(p)
-        for f in allFlags:
-            flag = f[1]
-            if flag not in Allowed_Flags:
-                raise ValueError(
-                    f"directory value {f} not allowed in write pattern {p}"
-                )
-        return True
-
-    @staticmethod
-    def configure_defaults(conf):
+    @classmethod
+    def configure_defaults(cls, conf):
         if "datalink" not in conf:
             raise ValueError("[datalink] is required in configuration toml")
         dali_conf = conf["datalink"]
         if "programname" not in dali_conf:
-            dali_conf["programname"] = "dali2jsonl"
+            dali_conf["programname"] = cls.PROGRAM_NAME
         if "username" not in dali_conf:
             dali_conf["username"] = "simpleDali"
         if "processid" not in dali_conf:
@@ -239,8 +535,21 @@ class Dali2Jsonl:
             dali_conf["architecture"] = "python"
         if "match" not in dali_conf:
             raise ValueError("match is required in configuration toml")
+        if "earliest" not in dali_conf:
+            dali_conf["earliest"] = False
+        if "reconnect" not in dali_conf:
+            dali_conf["reconnect"] = False
+        if "shards" not in dali_conf:
+            dali_conf["shards"] = 1
+        if "shard_by" not in dali_conf:
+            dali_conf["shard_by"] = "station"
+        if "shard_match" not in dali_conf:
+            dali_conf["shard_match"] = []
+        if "uvloop" not in dali_conf:
+            dali_conf["uvloop"] = False
         if "websocket" not in dali_conf:
             dali_conf["websocket"] = None
+        if dali_conf["websocket"] is None:
             if "host" not in dali_conf:
                 dali_conf["host"] = DEFAULT_HOST
             if "port" not in dali_conf:
@@ -248,17 +557,45 @@ class Dali2Jsonl:
         else:
             dali_conf["host"] = None
             dali_conf["port"] = None
-        if "jsonl" not in conf:
-            raise ValueError("[jsonl] is required in configuration toml")
-        jsonl_conf = conf["jsonl"]
+        if cls.CONFIG_SECTION not in conf:
+            raise ValueError(f"[{cls.CONFIG_SECTION}] is required in configuration toml")
+        jsonl_conf = conf[cls.CONFIG_SECTION]
         if "write" not in jsonl_conf:
-            raise ValueError("write is required in configuration [jsonl] toml")
-
-
-def do_parseargs():
+            raise ValueError(f"write is required in configuration [{cls.CONFIG_SECTION}] toml")
+        if "bandwrite" not in jsonl_conf:
+            jsonl_conf["bandwrite"] = {}
+        if "max_open_files" not in jsonl_conf:
+            jsonl_conf["max_open_files"] = DEFAULT_MAX_OPEN
+        if "max_idle" not in jsonl_conf:
+            jsonl_conf["max_idle"] = DEFAULT_MAX_IDLE
+        policy = FlushPolicy.from_config(jsonl_conf)
+        for key in ["flush_bytes", "flush_count", "flush_age", "durability", "fsync_interval"]:
+            if key not in jsonl_conf:
+                jsonl_conf[key] = getattr(policy, key)
+        if "pipeline" not in jsonl_conf:
+            jsonl_conf["pipeline"] = False
+        if "workers" not in jsonl_conf:
+            jsonl_conf["workers"] = DEFAULT_PIPELINE_WORKERS
+        if "queue_size" not in jsonl_conf:
+            jsonl_conf["queue_size"] = DEFAULT_PIPELINE_QUEUE_SIZE
+        if "compression" not in jsonl_conf:
+            jsonl_conf["compression"] = COMPRESSION_NONE
+        if "compression_level" not in jsonl_conf:
+            jsonl_conf["compression_level"] = None
+        if "zstd_dictionary" not in jsonl_conf:
+            jsonl_conf["zstd_dictionary"] = None
+        if "checkpoint" not in jsonl_conf:
+            jsonl_conf["checkpoint"] = None
+        if "checkpoint_packets" not in jsonl_conf:
+            jsonl_conf["checkpoint_packets"] = DEFAULT_CHECKPOINT_PACKETS
+        if "checkpoint_seconds" not in jsonl_conf:
+            jsonl_conf["checkpoint_seconds"] = DEFAULT_CHECKPOINT_SECONDS
+
+
+def do_parseargs(description="Archive JSON datalink packets as JSON Lines."):
     parser = argparse.ArgumentParser(
         description=f"""
-        Archive JSON datalink packets as JSON Lines.
+        {description}
         Version={__version__}"""
     )
     parser.add_argument(
@@ -274,20 +611,71 @@ def do_parseargs():
     parser.add_argument(
         "--earliest", help="start at earliest packet in server", action="store_true"
     )
+    parser.add_argument(
+        "--reconnect",
+        help="reconnect and resume after last packet if connection is lost",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="state file of last archived packet, resume after it on start",
+    )
+    parser.add_argument(
+        "--shards",
+        help="split match into this many shards, each archived by its own process",
+        type=int,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="decompress and write in worker threads, keeping the connection read",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--uvloop",
+        help="run on the uvloop event loop, if installed",
+        action="store_true",
+    )
     return parser.parse_args()
 
 
 def main():
+    runMain(Dali2Jsonl)
+
 
-    args = do_parseargs()
+def runMain(archiverClass, description=None):
+    """
+    Command line main for Dali2Jsonl or a subclass.
+    """
+    args = do_parseargs() if description is None else do_parseargs(description)
     conf = tomllib.load(args.conf)
     args.conf.close()
-    c = Dali2Jsonl.from_config(conf, verbose=args.verbose)
+    archiverClass.configure_defaults(conf)
+    section = archiverClass.CONFIG_SECTION
+    # command line overrides config, so sharded workers see it too
     if args.earliest:
-        c.do_earliest = True
+        conf["datalink"]["earliest"] = True
+    if args.reconnect:
+        conf["datalink"]["reconnect"] = True
+    if args.uvloop:
+        conf["datalink"]["uvloop"] = True
+    if args.shards is not None:
+        conf["datalink"]["shards"] = args.shards
+    if args.pipeline:
+        conf[section]["pipeline"] = True
+    if args.checkpoint:
+        conf[section]["checkpoint"] = args.checkpoint
+    if conf["datalink"]["shards"] > 1 or conf["datalink"]["shard_match"]:
+        # import here to avoid a circular import
+        from .sharding import ShardSupervisor
+
+        supervisor = ShardSupervisor(conf, verbose=args.verbose, archiverClass=archiverClass)
+        totals = supervisor.run()
+        print(f"Goodbye... {totals}")
+        sys.exit(0)
+    c = archiverClass.from_config(conf, verbose=args.verbose)
     try:
         debug = False
-        asyncio.run(c.run())
+        asyncioRun(c.run(), use_uvloop=conf["datalink"]["uvloop"], debug=debug, verbose=args.verbose)
     except KeyboardInterrupt:
         # cntrl-c
         print("Goodbye...")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Archive miniSEED Datalink records to files."""
+
+from .dalipacket import MSEED_TYPE, MSEED3_TYPE
+from .dali2jsonl import Dali2Jsonl, runMain
+
+
+class Dali2MSeed(Dali2Jsonl):
+    """
+    Archive MSEED and MSEED3 Datalink records by appending the raw packet
+    data to files from the write patterns.
+
+    Records are not parsed, the output file comes only from the stream id
+    and data start time in the DataLink header, so each packet costs
+    little more than a copy. Configured like Dali2Jsonl, but using the
+    [mseed] section of the toml instead of [jsonl].
+    """
+
+    CONFIG_SECTION = "mseed"
+    PROGRAM_NAME = "dali2mseed"
+    PACKET_TYPES = (MSEED_TYPE, MSEED3_TYPE)
+    BINARY = True
+
+    def isArchived(self, packetType):
+        return packetType in self.PACKET_TYPES
+
+    def handlePacket(self, daliPacket):
+        """
+        Save a MSEED or MSEED3 packet, others are skipped.
+        """
+        if self.isArchived(daliPacket.streamIdType()):
+            self.savePacket(daliPacket)
+        elif self.verbose:
+            print(f"    Not miniSEED packet: {daliPacket.streamIdType()}")
+
+    def decodeData(self, packetType, data):
+        return data
+
+    def formatRecord(self, data):
+        # data may be a view of the receive buffer, so copy
+        return bytes(data)
+
+
+def main():
+    runMain(Dali2MSeed, "Archive miniSEED datalink packets to files.")
+
+
+if __name__ == "__main__":
+    main()
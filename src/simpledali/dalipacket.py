@@ -1,12 +1,128 @@
 
+from functools import lru_cache
+
 from simplemseed import FDSNSourceId, FDSN_PREFIX
+from simplemseed.fdsnsourceid import FDSNSourceIdException
 
 JSON_TYPE = "JSON"
 BZ2_JSON_TYPE = "BZJSON"
+ZSTD_JSON_TYPE = "ZSTDJSON"
+LZ4_JSON_TYPE = "LZ4JSON"
 MSEED_TYPE = "MSEED"
 MSEED3_TYPE = "MSEED3"
 
+# number of distinct stream ids kept parsed, see parseStreamId()
+STREAMID_CACHE_SIZE = 16384
+
+class ParsedStreamId:
+    """
+    The channel and type parts of a streamId. The channel is only parsed
+    as a FDSNSourceId when sourceId is first used.
+    """
+    __slots__ = ("channel", "type", "_sourceId", "_sourceIdParsed")
+
+    def __init__(self, channel, idType):
+        self.channel = channel
+        self.type = idType
+        self._sourceId = None
+        self._sourceIdParsed = False
+
+    @property
+    def sourceId(self):
+        """
+        FDSNSourceId for the channel, which may be FDSN:NN_SSS_LL_B_S_S, or
+        NN_SSS_LL_B_S_S with FDSN: trimmed for datalink 1.0, or
+        NN_SSS_LL_CCC style. None if it is none of these or is not a valid
+        source id.
+        """
+        if not self._sourceIdParsed:
+            self._sourceId = parseChannelSourceId(self.channel)
+            self._sourceIdParsed = True
+        return self._sourceId
+
+
+def parseChannelSourceId(channel):
+    """
+    The channel part of a streamId as a FDSNSourceId, or None if it can not
+    be parsed.
+    """
+    try:
+        if channel.startswith(FDSN_PREFIX):
+            return FDSNSourceId.parse(channel)
+        numCodes = len(channel.split("_"))
+        if numCodes == 4:
+            return FDSNSourceId.parseNslc(channel, "_")
+        elif numCodes == 6:
+            return FDSNSourceId.parse(FDSN_PREFIX + channel)
+    except (FDSNSourceIdException, ValueError):
+        pass
+    return None
+
+
+@lru_cache(maxsize=STREAMID_CACHE_SIZE)
+def parseStreamId(streamId):
+    """
+    Split a streamId into channel and type. The channel is parsed as a
+    FDSNSourceId only when its sourceId is used, so a channel that is not a
+    valid source id does not stop packets being sorted by type.
+
+    Results are cached, as the same stream ids repeat for every packet,
+    so the same ParsedStreamId, and FDSNSourceId, is returned each time, do
+    not modify it. See streamIdCacheInfo() for how well the cache is doing.
+    """
+    s = streamId.split("/")
+    return ParsedStreamId(s[0], s[1] if len(s) > 1 else "")
+
+
+@lru_cache(maxsize=STREAMID_CACHE_SIZE)
+def nslcStreamId(net, sta, loc, chan, packettype, trimFDSN=False):
+    """
+    Cached streamid for a channel from its network, station, location and
+    channel codes, in old style NN_SSS_LL_CCC/TYPE if trimFDSN, otherwise
+    from the FDSNSourceId.
+    """
+    if trimFDSN:
+        return nslcToStreamId(net, sta, loc, chan, packettype)
+    sid = FDSNSourceId.fromNslc(net, sta, loc, chan)
+    return fdsnSourceIdToStreamId(sid, packettype)
+
+
+@lru_cache(maxsize=STREAMID_CACHE_SIZE)
+def sourceIdStreamId(sourceId, packettype, trimFDSN=False):
+    """
+    Cached streamid for a source id string, see fdsnSourceIdToStreamId().
+    """
+    return fdsnSourceIdToStreamId(sourceId, packettype, trimFDSN)
+
+
+def streamIdCacheInfo():
+    """
+    Hits, misses, size and hit rate of the stream id caches.
+    """
+    out = {}
+    for name, func in [
+        ("parse", parseStreamId), ("nslc", nslcStreamId), ("sourceId", sourceIdStreamId)
+    ]:
+        info = func.cache_info()
+        total = info.hits + info.misses
+        out[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hitRate": info.hits / total if total > 0 else None,
+        }
+    return out
+
+
+def clearStreamIdCache():
+    parseStreamId.cache_clear()
+    nslcStreamId.cache_clear()
+    sourceIdStreamId.cache_clear()
+
 class DaliResponse:
+    __slots__ = ("type", "value", "message")
+
     def __init__(self, packettype, value, message):
         self.type = packettype
         self.value = value
@@ -17,6 +133,30 @@ class DaliResponse:
 
 
 class DaliPacket:
+    """
+    A packet received from a DataLink server.
+
+    The packetId, packetTime, dataStartTime and dataEndTime are the raw
+    strings from the header. The integer hptimes, the parts of the streamId
+    and the FDSNSourceId are only calculated when first used and then cached,
+    so holding many packets stays cheap. The streamId parts come from the
+    shared cache of parseStreamId(), so are parsed once per stream id.
+    """
+    __slots__ = (
+        "type",
+        "packetId",
+        "dSize",
+        "data",
+        "_streamId",
+        "_packetTime",
+        "_dataStartTime",
+        "_dataEndTime",
+        "_packetHPTime",
+        "_dataStartHPTime",
+        "_dataEndHPTime",
+        "_parsed",
+    )
+
     def __init__(
         self,
         packettype,
@@ -36,13 +176,84 @@ class DaliPacket:
         self.dataEndTime = dataEndTime
         self.dSize = dSize
         self.data = data
+
+    @property
+    def streamId(self):
+        return self._streamId
+
+    @streamId.setter
+    def streamId(self, value):
+        self._streamId = value
+        self._parsed = None
+
+    @property
+    def packetTime(self):
+        return self._packetTime
+
+    @packetTime.setter
+    def packetTime(self, value):
+        self._packetTime = value
+        self._packetHPTime = None
+
+    @property
+    def dataStartTime(self):
+        return self._dataStartTime
+
+    @dataStartTime.setter
+    def dataStartTime(self, value):
+        self._dataStartTime = value
+        self._dataStartHPTime = None
+
+    @property
+    def dataEndTime(self):
+        return self._dataEndTime
+
+    @dataEndTime.setter
+    def dataEndTime(self, value):
+        self._dataEndTime = value
+        self._dataEndHPTime = None
+
+    @property
+    def packetHPTime(self):
+        """packetTime as integer hptime, microseconds since the epoch"""
+        if self._packetHPTime is None:
+            self._packetHPTime = int(self._packetTime)
+        return self._packetHPTime
+
+    @property
+    def dataStartHPTime(self):
+        """dataStartTime as integer hptime, microseconds since the epoch"""
+        if self._dataStartHPTime is None:
+            self._dataStartHPTime = int(self._dataStartTime)
+        return self._dataStartHPTime
+
+    @property
+    def dataEndHPTime(self):
+        """dataEndTime as integer hptime, microseconds since the epoch"""
+        if self._dataEndHPTime is None:
+            self._dataEndHPTime = int(self._dataEndTime)
+        return self._dataEndHPTime
+
+    def _parseStreamId(self):
+        if self._parsed is None:
+            self._parsed = parseStreamId(self._streamId)
+        return self._parsed
+
     def streamIdChannel(self):
-        return self.streamId.split("/")[0]
+        return self._parseStreamId().channel
+
     def streamIdType(self):
-        s = self.streamId.split("/")
-        if len(s)>1:
-            return s[1]
-        return ""
+        return self._parseStreamId().type
+
+    def sourceId(self):
+        """
+        The FDSNSourceId for the channel part of the streamId, None if it
+        can not be parsed, see parseStreamId().
+
+        The same object is returned on each call, so do not modify it.
+        """
+        return self._parseStreamId().sourceId
+
     def __str__(self):
         return f"{self.type} {self.streamId} {self.packetId} {self.packetTime} {self.dataStartTime} {self.dataEndTime} {self.dSize}"
 
@@ -0,0 +1,198 @@
+import asyncio
+import contextlib
+
+from .dalipacket import DaliException
+from .socketdali import SocketDataLink
+from .websocketdali import WebSocketDataLink
+
+# keyword arguments of DataLinkPool, the rest in forSocket() and
+# forWebSocket() are for the DataLinks
+POOL_ARGS = ("programname", "username", "processid", "architecture", "token")
+
+
+def _splitPoolArgs(kwargs):
+    poolArgs = {k: v for k, v in kwargs.items() if k in POOL_ARGS}
+    daliArgs = {k: v for k, v in kwargs.items() if k not in POOL_ARGS}
+    return poolArgs, daliArgs
+
+
+class DataLinkPool:
+    """
+    A bounded pool of connected DataLinks that can be shared by many tasks.
+
+    Connections are created as needed, up to size, and each is sent id()
+    and, if a token is given, auth() once when connected. A connection is
+    leased to one task at a time, and if it is found closed when next
+    leased it is reconnected, replaying the id and auth.
+
+    factory is a callable returning a new, unconnected, DataLink, see
+    forSocket() and forWebSocket() for the common cases.
+
+    For example:
+
+        async with DataLinkPool.forSocket(host, port, size=4) as pool:
+            async with pool.connection() as dali:
+                await dali.writeMSeed3(ms3)
+            # or lease just for a single write
+            await pool.writeMSeed3(ms3)
+    """
+
+    def __init__(
+        self,
+        factory,
+        size=4,
+        programname="simpleDali",
+        username="pool",
+        processid=0,
+        architecture="python",
+        token=None,
+        verbose=False,
+    ):
+        if size < 1:
+            raise ValueError(f"pool size must be at least 1: {size}")
+        self.factory = factory
+        self.size = size
+        self.programname = programname
+        self.username = username
+        self.processid = processid
+        self.architecture = architecture
+        self.token = token
+        self.verbose = verbose
+        self.connections = []
+        self._idle = asyncio.Queue()
+        self._creating = 0
+        self._closed = False
+
+    @classmethod
+    def forSocket(cls, host, port, size=4, packet_size=-1, verbose=False, **kwargs):
+        """
+        Pool of SocketDataLink connections to host and port. Keyword
+        arguments other than the pool's, ie buffered or ack_window, are
+        passed to each SocketDataLink.
+        """
+        poolArgs, daliArgs = _splitPoolArgs(kwargs)
+        return cls(
+            lambda: SocketDataLink(host, port, packet_size=packet_size, verbose=verbose, **daliArgs),
+            size=size,
+            verbose=verbose,
+            **poolArgs,
+        )
+
+    @classmethod
+    def forWebSocket(cls, uri, size=4, packet_size=-1, verbose=False, **kwargs):
+        """
+        Pool of WebSocketDataLink connections to uri. Keyword arguments
+        other than the pool's, ie ack_window, are passed to each
+        WebSocketDataLink.
+        """
+        poolArgs, daliArgs = _splitPoolArgs(kwargs)
+        return cls(
+            lambda: WebSocketDataLink(uri, packet_size=packet_size, verbose=verbose, **daliArgs),
+            size=size,
+            verbose=verbose,
+            **poolArgs,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def acquire(self):
+        """
+        Lease a connected DataLink from the pool, waiting if all are in use.
+        It must be given back with release(), prefer connection().
+        """
+        if self._closed:
+            raise DaliException("DataLinkPool is closed")
+        if self._idle.empty() and len(self.connections) + self._creating < self.size:
+            self._creating += 1
+            try:
+                dali = self.factory()
+                await self._connect(dali)
+            finally:
+                self._creating -= 1
+            self.connections.append(dali)
+            return dali
+        dali = await self._idle.get()
+        if dali.isClosed():
+            try:
+                await self._connect(dali)
+            except:
+                # keep the slot, next lease will try again
+                self._idle.put_nowait(dali)
+                raise
+        return dali
+
+    def release(self, dali):
+        """
+        Return a leased DataLink to the pool.
+        """
+        if dali.isStreamMode():
+            # not reusable for writes, reconnect on next lease
+            dali._force_close()
+        self._idle.put_nowait(dali)
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """
+        Lease a connected DataLink for the duration of an async with block.
+        """
+        dali = await self.acquire()
+        try:
+            yield dali
+        finally:
+            self.release(dali)
+
+    async def _connect(self, dali):
+        if self.verbose:
+            print("DataLinkPool connecting")
+        await dali.createDaliConnection()
+        if self.token is not None:
+            await dali.auth(self.token)
+        await dali.id(self.programname, self.username, self.processid, self.architecture)
+
+    async def writeAck(self, streamid, hpdatastart, hpdataend, data, pktid=None):
+        async with self.connection() as dali:
+            return await dali.writeAck(streamid, hpdatastart, hpdataend, data, pktid=pktid)
+
+    # with wait=False the write helpers return a future for the response,
+    # and the connection goes back to the pool without waiting for the ack
+
+    async def writeMSeed(self, msr, pktid=None, wait=True):
+        async with self.connection() as dali:
+            return await dali.writeMSeed(msr, pktid=pktid, wait=wait)
+
+    async def writeMSeed3(self, ms3, pktid=None, wait=True):
+        async with self.connection() as dali:
+            return await dali.writeMSeed3(ms3, pktid=pktid, wait=wait)
+
+    async def writeJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        async with self.connection() as dali:
+            return await dali.writeJSON(
+                streamid, hpdatastart, hpdataend, jsonMessage, pktid=pktid, wait=wait
+            )
+
+    async def writeBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        async with self.connection() as dali:
+            return await dali.writeBZ2JSON(
+                streamid, hpdatastart, hpdataend, jsonMessage, pktid=pktid, wait=wait
+            )
+
+    async def writeCompressedJSON(
+        self, streamid, hpdatastart, hpdataend, jsonMessage, packetType, pktid=None, wait=True
+    ):
+        async with self.connection() as dali:
+            return await dali.writeCompressedJSON(
+                streamid, hpdatastart, hpdataend, jsonMessage, packetType, pktid=pktid, wait=wait
+            )
+
+    async def close(self):
+        """
+        Close all connections. Leased connections are closed as well.
+        """
+        self._closed = True
+        for dali in self.connections:
+            await dali.close()
+        self.connections = []
@@ -0,0 +1,488 @@
+"""
+A small in-process DataLink server with an in memory ring, for tests,
+examples and benchmarks without a real ringserver.
+
+Implements enough of the protocol for the clients in this package: ID,
+INFO STATUS and STREAMS, MATCH, REJECT, AUTHORIZATION, POSITION SET and
+AFTER, READ, WRITE with optional ack, and STREAM/ENDSTREAM. Acknowledged
+writes reply with the client's pktid if one was given, otherwise the id
+assigned in the ring.
+"""
+
+import asyncio
+from collections import deque
+import re
+import xml.etree.ElementTree as ET
+
+import websockets
+
+from . import __version__
+from .dalipacket import DaliException
+from .socketdali import encodeFrame
+from .util import datetimeToHPTime, hptimeToDatetime, utcnowWithTz
+
+DEFAULT_MAX_PACKETS = 10000
+DEFAULT_PACKET_SIZE = 512
+
+
+class RingPacket:
+    """
+    A packet in a MemoryRing, with its PACKET frame encoded once when added.
+    """
+    __slots__ = ("pktid", "streamId", "packetTime", "dataStartTime", "dataEndTime", "frame")
+
+    def __init__(self, pktid, streamId, packetTime, dataStartTime, dataEndTime, data):
+        self.pktid = pktid
+        self.streamId = streamId
+        self.packetTime = packetTime
+        self.dataStartTime = dataStartTime
+        self.dataEndTime = dataEndTime
+        header = f"PACKET {streamId} {pktid} {packetTime} {dataStartTime} {dataEndTime} {len(data)}"
+        self.frame = encodeFrame(header, data)
+
+
+class MemoryRing:
+    """
+    Bounded in memory ring of packets, oldest are dropped once maxPackets
+    is reached. Packet ids start at 1 and increase by one for each packet.
+    """
+
+    def __init__(self, maxPackets=DEFAULT_MAX_PACKETS, packet_size=DEFAULT_PACKET_SIZE):
+        self.maxPackets = maxPackets
+        self.packet_size = packet_size
+        self.packets = deque(maxlen=maxPackets)
+        self.nextId = 1
+        self.startTime = utcnowWithTz()
+        self.rxPackets = 0
+        self.rxBytes = 0
+        self._arrival = None
+
+    def add(self, streamId, dataStartTime, dataEndTime, data):
+        """
+        Add a packet to the ring, returns the new RingPacket.
+        """
+        pkt = RingPacket(
+            self.nextId,
+            streamId,
+            datetimeToHPTime(utcnowWithTz()),
+            dataStartTime,
+            dataEndTime,
+            data,
+        )
+        self.nextId += 1
+        self.packets.append(pkt)
+        self.rxPackets += 1
+        self.rxBytes += len(data)
+        if self._arrival is not None:
+            self._arrival.set_result(None)
+            self._arrival = None
+        return pkt
+
+    def earliestId(self):
+        return self.packets[0].pktid if self.packets else None
+
+    def latestId(self):
+        return self.packets[-1].pktid if self.packets else None
+
+    def get(self, pktid):
+        """
+        The packet with the given id, or None if not in the ring.
+        """
+        if not self.packets:
+            return None
+        idx = pktid - self.packets[0].pktid
+        if 0 <= idx < len(self.packets):
+            return self.packets[idx]
+        return None
+
+    def after(self, hptime):
+        """
+        Id of first packet with data end time after hptime, or None.
+        """
+        for pkt in self.packets:
+            if pkt.dataEndTime > hptime:
+                return pkt.pktid
+        return None
+
+    async def waitForPacket(self, pktid):
+        """
+        Wait until a packet with at least the given id has been added.
+        """
+        while self.nextId <= pktid:
+            if self._arrival is None:
+                self._arrival = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._arrival)
+
+    def streams(self):
+        """
+        Dict of streamId to list of earliest and latest packets in the ring.
+        """
+        out = {}
+        for pkt in self.packets:
+            if pkt.streamId in out:
+                out[pkt.streamId][1] = pkt
+            else:
+                out[pkt.streamId] = [pkt, pkt]
+        return out
+
+
+def _timeStr(hptime):
+    if hptime is None:
+        return "-"
+    return hptimeToDatetime(hptime).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class DaliSession:
+    """
+    State of one client connection to a DaliServer. The send coroutine
+    writes one encoded frame to the client.
+    """
+
+    def __init__(self, server, send):
+        self.server = server
+        self.ring = server.ring
+        self._send = send
+        self.clientId = None
+        self.matchRE = None
+        self.rejectRE = None
+        self.nextId = None
+        self.streamTask = None
+        self._selected = {}
+
+    async def send(self, header, data=None):
+        await self._send(encodeFrame(header, data))
+
+    async def reply(self, packettype, value, message=""):
+        m = message.encode("utf-8")
+        await self.send(f"{packettype} {value} {len(m)}", m)
+
+    def isSelected(self, streamId):
+        ans = self._selected.get(streamId)
+        if ans is None:
+            ans = (self.matchRE is None or self.matchRE.search(streamId) is not None) and (
+                self.rejectRE is None or self.rejectRE.search(streamId) is None
+            )
+            self._selected[streamId] = ans
+        return ans
+
+    def startId(self):
+        if self.nextId is not None:
+            return self.nextId
+        # default is to start with new packets
+        return self.ring.nextId
+
+    async def handle(self, header, data):
+        s = header.split(" ")
+        cmd = s[0]
+        if self.server.verbose:
+            print(f"DaliServer: {header}")
+        if self.streamTask is not None and cmd != "ENDSTREAM":
+            # only ENDSTREAM allowed while streaming
+            return
+        if cmd == "ID":
+            self.clientId = header[3:]
+            await self.send(f"ID DataLink simpledali-{__version__} :: {self.server.capabilities()}")
+        elif cmd == "INFO":
+            await self.handleInfo(s[1] if len(s) > 1 else "")
+        elif cmd == "MATCH" or cmd == "REJECT":
+            pattern = str(data, "utf-8") if data else ""
+            try:
+                regex = re.compile(pattern) if len(pattern) > 0 else None
+            except re.error as e:
+                await self.reply("ERROR", 0, f"Error with {cmd} expression: {e}")
+                return
+            if cmd == "MATCH":
+                self.matchRE = regex
+            else:
+                self.rejectRE = regex
+            self._selected = {}
+            count = sum(1 for sid in self.ring.streams() if self.isSelected(sid))
+            await self.reply("OK", count, f"{count} streams selected after {cmd.lower()}")
+        elif cmd == "AUTHORIZATION":
+            await self.reply("OK", 0, "Authorization accepted")
+        elif cmd == "POSITION":
+            await self.handlePosition(s)
+        elif cmd == "READ":
+            pkt = self.ring.get(int(s[1])) if len(s) > 1 and s[1].isdigit() else None
+            if pkt is None:
+                await self.reply("ERROR", 0, f"Packet {' '.join(s[1:])} not found in ring")
+            else:
+                await self._send(pkt.frame)
+        elif cmd == "WRITE":
+            await self.handleWrite(s, data)
+        elif cmd == "STREAM":
+            self.streamTask = asyncio.create_task(self.streamPackets())
+        elif cmd == "ENDSTREAM":
+            await self.stopStream()
+            await self.send("ENDSTREAM")
+        else:
+            await self.reply("ERROR", 0, f"Unrecognized command: {cmd}")
+
+    async def handleInfo(self, infotype):
+        root = ET.Element(
+            "DataLink",
+            Version=f"simpledali {__version__}",
+            ServerID="simpledali DaliServer",
+            Capabilities=self.server.capabilities(),
+        )
+        root.append(self.statusElement())
+        if infotype == "STREAMS":
+            streams = self.ring.streams()
+            selected = [sid for sid in streams if self.isSelected(sid)]
+            streamList = ET.SubElement(
+                root,
+                "StreamList",
+                TotalStreams=str(len(streams)),
+                SelectedStreams=str(len(selected)),
+            )
+            now = datetimeToHPTime(utcnowWithTz())
+            for sid in selected:
+                earliest, latest = streams[sid]
+                ET.SubElement(
+                    streamList,
+                    "Stream",
+                    Name=sid,
+                    EarliestPacketID=str(earliest.pktid),
+                    EarliestPacketDataStartTime=_timeStr(earliest.dataStartTime),
+                    EarliestPacketDataEndTime=_timeStr(earliest.dataEndTime),
+                    LatestPacketID=str(latest.pktid),
+                    LatestPacketDataStartTime=_timeStr(latest.dataStartTime),
+                    LatestPacketDataEndTime=_timeStr(latest.dataEndTime),
+                    DataLatency=f"{(now - latest.dataEndTime) / 1000000:.1f}",
+                )
+        elif infotype != "STATUS":
+            await self.reply("ERROR", 0, f"Unrecognized INFO request type: {infotype}")
+            return
+        xml = ET.tostring(root, encoding="utf-8")
+        await self.send(f"INFO {infotype} {len(xml)}", xml)
+
+    def statusElement(self):
+        ring = self.ring
+        earliest = ring.packets[0] if ring.packets else None
+        latest = ring.packets[-1] if ring.packets else None
+        return ET.Element(
+            "Status",
+            StartTime=ring.startTime.strftime("%Y-%m-%d %H:%M:%S"),
+            RingVersion="1",
+            RingSize=str(ring.maxPackets * ring.packet_size),
+            PacketSize=str(ring.packet_size),
+            MaximumPacketID=str(2**63 - 1),
+            MaximumPackets=str(ring.maxPackets),
+            MemoryMappedRing="FALSE",
+            VolatileRing="TRUE",
+            TotalConnections=str(len(self.server.sessions)),
+            TotalStreams=str(len(ring.streams())),
+            TXPacketRate="0.0",
+            TXByteRate="0.0",
+            RXPacketRate="0.0",
+            RXByteRate="0.0",
+            EarliestPacketID=str(earliest.pktid) if earliest else "-",
+            EarliestPacketCreationTime=_timeStr(earliest.packetTime if earliest else None),
+            EarliestPacketDataStartTime=_timeStr(earliest.dataStartTime if earliest else None),
+            EarliestPacketDataEndTime=_timeStr(earliest.dataEndTime if earliest else None),
+            LatestPacketID=str(latest.pktid) if latest else "-",
+            LatestPacketCreationTime=_timeStr(latest.packetTime if latest else None),
+            LatestPacketDataStartTime=_timeStr(latest.dataStartTime if latest else None),
+            LatestPacketDataEndTime=_timeStr(latest.dataEndTime if latest else None),
+        )
+
+    async def handlePosition(self, s):
+        ring = self.ring
+        if len(s) < 3 or s[1] not in ("SET", "AFTER"):
+            await self.reply("ERROR", 0, f"Unrecognized POSITION request: {' '.join(s)}")
+            return
+        value = s[2]
+        if s[1] == "AFTER":
+            pktid = ring.after(int(value)) if value.isdigit() else None
+            if pktid is None:
+                await self.reply("ERROR", 0, f"No packet after {value}")
+                return
+            self.nextId = pktid
+        elif value == "EARLIEST" or value == "LATEST":
+            pktid = ring.earliestId() if value == "EARLIEST" else ring.latestId()
+            if pktid is None:
+                await self.reply("ERROR", 0, "Ring is empty")
+                return
+            self.nextId = pktid
+        else:
+            pkt = ring.get(int(value)) if value.isdigit() else None
+            if pkt is None or (len(s) > 3 and len(s[3]) > 0 and int(s[3]) != pkt.packetTime):
+                await self.reply("ERROR", 0, f"Packet {value} not found in ring")
+                return
+            pktid = pkt.pktid
+            # streaming continues after the positioned packet
+            self.nextId = pktid + 1
+        await self.reply("OK", pktid, f"Positioned to packet ID {pktid}")
+
+    async def handleWrite(self, s, data):
+        # WRITE streamid hpdatastart hpdataend flags size [pktid]
+        streamId, flags = s[1], s[4]
+        # a zero size WRITE has no payload
+        data = data or b""
+        if self.ring.packet_size > 0 and len(data) > self.ring.packet_size:
+            if "A" in flags:
+                await self.reply(
+                    "ERROR", 0, f"Packet size {len(data)} larger than {self.ring.packet_size}"
+                )
+            return
+        pkt = self.ring.add(streamId, int(s[2]), int(s[3]), bytes(data))
+        if "A" in flags:
+            # like ringserver, the value is the ring's packet id, not pktid
+            await self.reply("OK", pkt.pktid)
+
+    async def streamPackets(self):
+        ring = self.ring
+        nextId = self.startId()
+        while True:
+            if ring.packets and nextId < ring.packets[0].pktid:
+                # fell behind, oldest packets already gone
+                nextId = ring.packets[0].pktid
+            pkt = ring.get(nextId)
+            if pkt is None:
+                await ring.waitForPacket(nextId)
+                continue
+            nextId += 1
+            self.nextId = nextId
+            if self.isSelected(pkt.streamId):
+                await self._send(pkt.frame)
+
+    async def stopStream(self):
+        if self.streamTask is not None:
+            self.streamTask.cancel()
+            try:
+                await self.streamTask
+            except asyncio.CancelledError:
+                pass
+            self.streamTask = None
+
+
+class DaliServer:
+    """
+    In-process DataLink server backed by a MemoryRing, serving over a
+    regular socket and, if websocket is True, over a websocket at path
+    /datalink. Port zero picks a free port, see port and websocketPort
+    after start().
+
+    For example:
+
+        async with DaliServer(websocket=True) as server:
+            async with SocketDataLink(server.host, server.port) as dali:
+                ...
+            async with WebSocketDataLink(server.websocketurl) as dali:
+                ...
+    """
+
+    def __init__(
+        self,
+        ring=None,
+        host="127.0.0.1",
+        port=0,
+        websocket=False,
+        websocketPort=0,
+        verbose=False,
+    ):
+        self.ring = ring if ring is not None else MemoryRing()
+        self.host = host
+        self.port = port
+        self.websocket = websocket
+        self.websocketPort = websocketPort
+        self.verbose = verbose
+        self.sessions = []
+        self._handlers = {}
+        self._server = None
+        self._wsServer = None
+
+    @property
+    def websocketurl(self):
+        return f"ws://{self.host}:{self.websocketPort}/datalink"
+
+    def capabilities(self):
+        return f"DLPROTO:1.0 PACKETSIZE:{self.ring.packet_size} WRITE"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handleSocket, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.websocket:
+            self._wsServer = await websockets.serve(
+                self._handleWebSocket, self.host, self.websocketPort
+            )
+            self.websocketPort = list(self._wsServer.sockets)[0].getsockname()[1]
+        if self.verbose:
+            print(f"DaliServer listening on {self.host}:{self.port}")
+
+    async def close(self):
+        for session in list(self.sessions):
+            await session.stopStream()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        # let client handlers finish instead of being cancelled at shutdown
+        for writer in self._handlers.values():
+            writer.close()
+        if self._handlers:
+            await asyncio.wait(list(self._handlers.keys()), timeout=1)
+        if self._wsServer is not None:
+            self._wsServer.close()
+            await self._wsServer.wait_closed()
+            self._wsServer = None
+
+    async def _handleSocket(self, reader, writer):
+        async def send(frame):
+            writer.write(frame)
+            await writer.drain()
+
+        session = DaliSession(self, send)
+        self.sessions.append(session)
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        try:
+            while True:
+                pre = await reader.readexactly(3)
+                if pre[0] != 68 or pre[1] != 76:
+                    raise DaliException(f"did not receive DL from read pre {pre[0]:d}{pre[1]:d}{pre[2]:d}")
+                header = (await reader.readexactly(pre[2])).decode("utf-8")
+                size = _commandPayloadSize(header)
+                data = await reader.readexactly(size) if size > 0 else None
+                await session.handle(header, data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except DaliException as e:
+            if self.verbose:
+                print(f"DaliServer: {e}")
+        finally:
+            await session.stopStream()
+            self.sessions.remove(session)
+            del self._handlers[task]
+            writer.close()
+
+    async def _handleWebSocket(self, ws, path=None):
+        session = DaliSession(self, ws.send)
+        self.sessions.append(session)
+        try:
+            async for message in ws:
+                if len(message) < 3 or message[0] != 68 or message[1] != 76:
+                    break
+                hSize = message[2]
+                header = bytes(message[3 : 3 + hSize]).decode("utf-8")
+                await session.handle(header, message[3 + hSize :])
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            await session.stopStream()
+            self.sessions.remove(session)
+
+
+def _commandPayloadSize(header):
+    s = header.split(" ")
+    if s[0] == "WRITE":
+        return int(s[5])
+    if s[0] in ("MATCH", "REJECT", "AUTHORIZATION") and len(s) > 1:
+        return int(s[1])
+    return 0
@@ -0,0 +1,315 @@
+from collections import OrderedDict
+import gzip
+import os
+import time
+
+DEFAULT_MAX_OPEN = 256
+DEFAULT_MAX_IDLE = 300
+
+# what a flush of buffered records does
+# none: hand to the python file object, which writes when its buffer fills
+DURABILITY_NONE = "none"
+# flush: also flush the file object, so other processes see the records
+DURABILITY_FLUSH = "flush"
+# fsync: also flush and fsync to disk, at most once per fsync_interval
+DURABILITY_FSYNC = "fsync"
+
+DURABILITY_POLICIES = [DURABILITY_NONE, DURABILITY_FLUSH, DURABILITY_FSYNC]
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+# needs the zstandard package, pip install simpledali[zstd]
+COMPRESSION_ZSTD = "zstd"
+
+# file name suffix for each compression
+COMPRESSION_SUFFIX = {
+    COMPRESSION_NONE: "",
+    COMPRESSION_GZIP: ".gz",
+    COMPRESSION_ZSTD: ".zst",
+}
+COMPRESSIONS = list(COMPRESSION_SUFFIX.keys())
+
+
+def checkCompression(compression):
+    """
+    Raises ValueError if the compression is unknown or its package is not
+    installed.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {COMPRESSIONS}: {compression}")
+    if compression == COMPRESSION_ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression needs zstandard, pip install simpledali[zstd]")
+    return True
+
+
+def openAppend(path, compression=COMPRESSION_NONE, level=None, binary=False):
+    """
+    Open a text, or binary, file for append, optionally as a compressed
+    stream. Each open of an existing compressed file appends a new gzip
+    member or zstd frame, and standard tools read these as one continuous
+    file.
+    """
+    mode = "ab" if binary else "at"
+    encoding = None if binary else "utf-8"
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(path, mode, compresslevel=6 if level is None else level, encoding=encoding)
+    if compression == COMPRESSION_ZSTD:
+        import zstandard
+
+        cctx = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return zstandard.open(path, mode, cctx=cctx, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+# seconds between checks for idle files when there is no flush_age
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+class FlushPolicy:
+    """
+    When buffered records are written to an output file, and how durably.
+
+    Records for a file are held until flush_bytes or flush_count is reached,
+    or the oldest is flush_age seconds old. A value of zero disables that
+    limit, so flush_count=1 writes each record immediately.
+    """
+
+    def __init__(
+        self,
+        flush_bytes=64 * 1024,
+        flush_count=1000,
+        flush_age=1.0,
+        durability=DURABILITY_FLUSH,
+        fsync_interval=10.0,
+    ):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"durability must be one of {DURABILITY_POLICIES}: {durability}")
+        self.flush_bytes = flush_bytes
+        self.flush_count = flush_count
+        self.flush_age = flush_age
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+
+    @classmethod
+    def from_config(cls, conf):
+        """
+        FlushPolicy from a dict, ie a toml section, missing keys use defaults.
+        """
+        keys = ["flush_bytes", "flush_count", "flush_age", "durability", "fsync_interval"]
+        return cls(**{k: conf[k] for k in keys if k in conf})
+
+    def checkInterval(self):
+        """
+        Seconds between checks for records past flush_age, and idle files.
+        """
+        if self.flush_age > 0:
+            return self.flush_age / 2
+        return DEFAULT_CHECK_INTERVAL
+
+
+class BufferedAppendFile:
+    """
+    A text, or binary, file open for append that buffers whole records,
+    writing them together according to a FlushPolicy. If compressed, the
+    compression stream stays open across writes and is finished on close.
+    """
+
+    def __init__(self, path, policy, compression=COMPRESSION_NONE, level=None, binary=False):
+        self.path = path
+        self.policy = policy
+        self.out = openAppend(path, compression, level, binary)
+        self.empty = b"" if binary else ""
+        self.records = []
+        self.size = 0
+        self.firstTime = None
+        self.lastSync = time.monotonic()
+
+    def write(self, record, now=None):
+        """
+        Add a record, already including any line ending if text.
+        """
+        if now is None:
+            now = time.monotonic()
+        if not self.records:
+            self.firstTime = now
+        self.records.append(record)
+        self.size += len(record)
+        policy = self.policy
+        if (
+            (policy.flush_count > 0 and len(self.records) >= policy.flush_count)
+            or (policy.flush_bytes > 0 and self.size >= policy.flush_bytes)
+        ):
+            self.flush(now)
+
+    def isExpired(self, now):
+        return (
+            self.policy.flush_age > 0
+            and self.records
+            and now - self.firstTime >= self.policy.flush_age
+        )
+
+    def flush(self, now=None, sync=False, fsync=False):
+        """
+        Write buffered records, then flush and fsync per the durability
+        policy. If sync is True, always flush the file object, and if the
+        policy is fsync, fsync now regardless of the interval. If fsync is
+        True, always flush and fsync, whatever the policy.
+        """
+        if self.records:
+            self.out.write(self.empty.join(self.records))
+            self.records = []
+            self.size = 0
+        durability = self.policy.durability
+        if durability == DURABILITY_NONE and not sync and not fsync:
+            return
+        self.out.flush()
+        if fsync:
+            os.fsync(self.out.fileno())
+            self.lastSync = time.monotonic() if now is None else now
+        elif durability == DURABILITY_FSYNC:
+            if now is None:
+                now = time.monotonic()
+            if sync or now - self.lastSync >= self.policy.fsync_interval:
+                os.fsync(self.out.fileno())
+                self.lastSync = now
+
+    def close(self, fsync=False):
+        try:
+            self.flush(sync=True, fsync=fsync)
+        finally:
+            self.out.close()
+
+    @property
+    def closed(self):
+        return self.out.closed
+
+
+class FileHandleCache:
+    """
+    Bounded LRU cache of files open for append, keyed by path.
+
+    Keeps at most maxOpen files open, closing the least recently used when
+    more are needed, and closes any file unused for more than maxIdle
+    seconds. Parent directories are created once and remembered, so a file
+    that is already open, or in a directory already seen, costs no
+    filesystem metadata calls. Files buffer records per the FlushPolicy,
+    see flushExpired(), and are flushed when closed. Files may be
+    compressed, see openAppend(), and text or binary.
+
+    If syncToDisk is True, flushAll(sync=True) and closing a file also
+    fsync, whatever the durability, so a checkpoint saved afterwards
+    never refers to records that are not on disk.
+    """
+
+    def __init__(
+        self, maxOpen=DEFAULT_MAX_OPEN, maxIdle=DEFAULT_MAX_IDLE, flushPolicy=None,
+        compression=COMPRESSION_NONE, compressionLevel=None, binary=False, verbose=False
+    ):
+        if maxOpen < 1:
+            raise ValueError(f"maxOpen must be at least 1: {maxOpen}")
+        checkCompression(compression)
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        self.binary = binary
+        self.maxOpen = maxOpen
+        self.maxIdle = maxIdle
+        self.flushPolicy = flushPolicy if flushPolicy is not None else FlushPolicy()
+        self.syncToDisk = False
+        self.verbose = verbose
+        self.handles = OrderedDict()
+        self.createdDirs = set()
+        self._lastFlushCheck = time.monotonic()
+
+    def get(self, path):
+        """
+        The open file for path, opening it, and creating directories, if
+        needed.
+        """
+        now = time.monotonic()
+        entry = self.handles.get(path)
+        if entry is not None:
+            self.handles.move_to_end(path)
+            entry[1] = now
+            return entry[0]
+        out = self.open(path)
+        self.handles[path] = [out, now]
+        self.evict(now)
+        return out
+
+    def open(self, path):
+        parent = path.parent
+        if parent not in self.createdDirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            self.createdDirs.add(parent)
+        try:
+            return BufferedAppendFile(
+                path, self.flushPolicy, self.compression, self.compressionLevel, self.binary
+            )
+        except FileNotFoundError:
+            # directory removed since created, ie by archive cleanup
+            parent.mkdir(parents=True, exist_ok=True)
+            return BufferedAppendFile(
+                path, self.flushPolicy, self.compression, self.compressionLevel, self.binary
+            )
+
+    def evict(self, now=None):
+        """
+        Close least recently used files beyond maxOpen and files idle for
+        more than maxIdle seconds.
+        """
+        if now is None:
+            now = time.monotonic()
+        while len(self.handles) > self.maxOpen:
+            path, entry = self.handles.popitem(last=False)
+            self._close(path, entry[0])
+        while self.handles:
+            path, entry = next(iter(self.handles.items()))
+            if now - entry[1] <= self.maxIdle:
+                break
+            del self.handles[path]
+            self._close(path, entry[0])
+
+    def flushExpired(self, now=None):
+        """
+        Flush files whose oldest buffered record is older than flush_age,
+        and close idle files, see evict(), so they are closed even when no
+        new file is opened. Cheap to call often, only checks all files
+        every flushPolicy.checkInterval() seconds.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - self._lastFlushCheck < self.flushPolicy.checkInterval():
+            return
+        self._lastFlushCheck = now
+        self.evict(now)
+        for out, lastUsed in self.handles.values():
+            if out.isExpired(now):
+                out.flush(now)
+
+    def flushAll(self, sync=False):
+        for out, lastUsed in self.handles.values():
+            out.flush(sync=sync, fsync=sync and self.syncToDisk)
+
+    def close(self, path):
+        """
+        Close the file for path if open.
+        """
+        entry = self.handles.pop(path, None)
+        if entry is not None:
+            self._close(path, entry[0])
+
+    def closeAll(self):
+        while self.handles:
+            path, entry = self.handles.popitem(last=False)
+            self._close(path, entry[0])
+
+    def _close(self, path, out):
+        if self.verbose:
+            print(f"   close {path}")
+        out.close(fsync=self.syncToDisk)
+
+    def __len__(self):
+        return len(self.handles)
@@ -0,0 +1,185 @@
+"""
+Compression of JSON packet data, by stream id type. New types are added
+with registerJsonCodec(), and are then written by DataLink.writeCompressedJSON()
+and decompressed by Dali2Jsonl.
+"""
+
+from abc import ABC, abstractmethod
+import bz2
+import threading
+
+from .dalipacket import BZ2_JSON_TYPE, ZSTD_JSON_TYPE, LZ4_JSON_TYPE
+from .jsonencoder import encodeJSON
+
+
+class JsonCodec(ABC):
+    """
+    Compresses and decompresses the data of one JSON packet type.
+    """
+
+    def __init__(self, packetType):
+        self.packetType = packetType
+        self._available = None
+
+    @abstractmethod
+    def compress(self, data):
+        pass
+
+    @abstractmethod
+    def decompress(self, data):
+        pass
+
+    def isAvailable(self):
+        """
+        False if a package the codec needs is not installed.
+        """
+        if self._available is None:
+            self._available = self._checkAvailable()
+        return self._available
+
+    def _checkAvailable(self):
+        return True
+
+
+class Bz2JsonCodec(JsonCodec):
+    def __init__(self, packetType=BZ2_JSON_TYPE, level=9):
+        super().__init__(packetType)
+        self.level = level
+
+    def compress(self, data):
+        return bz2.compress(data, self.level)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+
+class ZstdJsonCodec(JsonCodec):
+    """
+    Zstandard compression, needs the zstandard package,
+    pip install simpledali[zstd]
+
+    Small messages compress much better with a dictionary trained on
+    typical messages, see trainZstdDictionary(). Writers and readers must
+    use the same dictionary, so share it as a file and register a codec
+    with it on both sides.
+    """
+
+    def __init__(self, packetType=ZSTD_JSON_TYPE, level=3, dictionary=None):
+        super().__init__(packetType)
+        self.level = level
+        self.dictionary = dictionary
+        # built once here, as compress() and decompress() may be called
+        # from many threads
+        self._zstdDict = None
+        if dictionary is not None and self.isAvailable():
+            import zstandard
+
+            if isinstance(dictionary, zstandard.ZstdCompressionDict):
+                self._zstdDict = dictionary
+            else:
+                self._zstdDict = zstandard.ZstdCompressionDict(bytes(dictionary))
+        # zstandard contexts are not thread safe, so one per thread
+        self._local = threading.local()
+
+    def _checkAvailable(self):
+        try:
+            import zstandard
+        except ImportError:
+            return False
+        return True
+
+    def compress(self, data):
+        cctx = getattr(self._local, "cctx", None)
+        if cctx is None:
+            import zstandard
+
+            cctx = zstandard.ZstdCompressor(level=self.level, dict_data=self._zstdDict)
+            self._local.cctx = cctx
+        return cctx.compress(data)
+
+    def decompress(self, data):
+        dctx = getattr(self._local, "dctx", None)
+        if dctx is None:
+            import zstandard
+
+            dctx = zstandard.ZstdDecompressor(dict_data=self._zstdDict)
+            self._local.dctx = dctx
+        # frames written by compress() hold the content size
+        return dctx.decompress(bytes(data))
+
+
+class Lz4JsonCodec(JsonCodec):
+    """
+    LZ4 frame compression, needs the lz4 package, pip install simpledali[lz4]
+
+    Compresses less than zstd, but is faster still.
+    """
+
+    def __init__(self, packetType=LZ4_JSON_TYPE, level=0):
+        super().__init__(packetType)
+        self.level = level
+
+    def _checkAvailable(self):
+        try:
+            import lz4.frame
+        except ImportError:
+            return False
+        return True
+
+    def compress(self, data):
+        import lz4.frame
+
+        return lz4.frame.compress(data, compression_level=self.level, store_size=True)
+
+    def decompress(self, data):
+        import lz4.frame
+
+        return lz4.frame.decompress(data)
+
+
+def trainZstdDictionary(samples, size=16 * 1024):
+    """
+    Train a zstd dictionary from sample messages, as bytes or JSON
+    encodable objects, returns the dictionary as bytes to save to a file.
+    Needs a few hundred samples at least.
+    """
+    import zstandard
+
+    samples = [s if isinstance(s, bytes) else encodeJSON(s) for s in samples]
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+JSON_CODECS = {}
+
+
+def registerJsonCodec(codec):
+    """
+    Add, or replace, the codec for its packet type.
+    """
+    JSON_CODECS[codec.packetType] = codec
+
+
+def jsonCodec(packetType):
+    """
+    The codec for a compressed JSON packet type, None if not compressed
+    JSON.
+    """
+    return JSON_CODECS.get(packetType)
+
+
+def checkJsonCodec(packetType):
+    """
+    The codec for a compressed JSON packet type, raises ValueError if
+    there is none or its package is not installed.
+    """
+    codec = JSON_CODECS.get(packetType)
+    if codec is None:
+        raise ValueError(f"packet type must be one of {list(JSON_CODECS.keys())}: {packetType}")
+    if not codec.isAvailable():
+        raise ValueError(f"{packetType} compression needs a package that is not installed")
+    return codec
+
+
+registerJsonCodec(Bz2JsonCodec())
+registerJsonCodec(ZstdJsonCodec())
+registerJsonCodec(Lz4JsonCodec())
@@ -1,6 +1,18 @@
 import json
+import math
 from datetime import datetime
 
+# orjson is optional, pip install simpledali[orjson], and is used if installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND_STDLIB = "json"
+JSON_BACKEND_ORJSON = "orjson"
+
+_backend = JSON_BACKEND_ORJSON if orjson is not None else JSON_BACKEND_STDLIB
+
 
 class JsonEncoder(json.JSONEncoder):
     def default(self, o):
@@ -8,5 +20,96 @@ class JsonEncoder(json.JSONEncoder):
             s = o.isoformat(sep="T")
             if s.endswith("+00:00"):
                 return s[:-6] + "Z"
+            return s
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, o)
+
+
+def _hasNonFinite(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_hasNonFinite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_hasNonFinite(v) for v in obj)
+    return False
+
+
+def _orjsonDumps(obj, option):
+    """
+    orjson encoding, or None if orjson can not encode obj the same as the
+    json module would.
+    """
+    try:
+        out = orjson.dumps(obj, option=option)
+    except TypeError:
+        return None
+    # orjson writes NaN and inf as null, json as NaN and Infinity
+    if b"null" in out and _hasNonFinite(obj):
+        return None
+    return out
+
+
+def jsonBackend():
+    """
+    Name of the JSON backend used by encodeJSON() and dumpJSON().
+    """
+    return _backend
+
+
+def setJsonBackend(backend):
+    """
+    Use orjson, if installed, or the standard library json module.
+    Returns the previous backend.
+    """
+    global _backend
+    if backend == JSON_BACKEND_ORJSON and orjson is None:
+        raise ValueError("orjson is not installed, pip install simpledali[orjson]")
+    if backend not in (JSON_BACKEND_ORJSON, JSON_BACKEND_STDLIB):
+        raise ValueError(f"JSON backend must be {JSON_BACKEND_ORJSON} or {JSON_BACKEND_STDLIB}: {backend}")
+    previous = _backend
+    _backend = backend
+    return previous
+
+
+def encodeJSON(obj):
+    """
+    Encode as UTF-8 JSON bytes, with datetimes as ISO8601 strings, UTC as Z,
+    like JsonEncoder. Uses orjson if installed, many times faster than the
+    json module, falling back to json for anything orjson can not encode
+    the same way, like integers larger than 64 bits, or NaN and infinity,
+    which are written as NaN and Infinity whatever the backend. Output is
+    compact and not ASCII escaped, like orjson, so the bytes are the same
+    with either backend.
+    """
+    if _backend == JSON_BACKEND_ORJSON:
+        out = _orjsonDumps(obj, orjson.OPT_UTC_Z)
+        if out is not None:
+            return out
+    return json.dumps(
+        obj, cls=JsonEncoder, separators=(",", ":"), ensure_ascii=False
+    ).encode("UTF-8")
+
+
+def dumpJSON(obj, indent=False, sort_keys=False):
+    """
+    JSON string, like encodeJSON(), optionally indented and with sorted
+    keys for display, ie parsedInfoStatus() output.
+    """
+    if _backend == JSON_BACKEND_ORJSON:
+        option = orjson.OPT_UTC_Z
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        out = _orjsonDumps(obj, option)
+        if out is not None:
+            return out.decode("UTF-8")
+    return json.dumps(
+        obj,
+        cls=JsonEncoder,
+        indent=2 if indent else None,
+        separators=(",", ": ") if indent else (",", ":"),
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+    )
@@ -0,0 +1,183 @@
+import asyncio
+from collections import deque
+
+from .broadcast import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DROP_NEWEST,
+)
+
+WRITER_OVERFLOW_POLICIES = [OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST]
+
+DEFAULT_MAX_PACKETS = 10000
+
+
+class QueuedWriter:
+    """
+    Bounded queue in front of one or more DataLinks, so producers are not
+    held up by the server's round trip time. Writes are packed and queued,
+    and a background task per DataLink sends them, with pipelined acks.
+
+    When the queue holds maxPackets packets, or maxBytes of data, the
+    overflow policy either blocks the producer until there is room, drops
+    the oldest queued packet, or drops the new packet. Drops are counted,
+    see stats().
+
+    For example:
+
+        async with QueuedWriter(dali, maxPackets=1000, overflow=OVERFLOW_DROP_OLDEST) as writer:
+            await writer.writeMSeed3(ms3)
+
+    The DataLinks should already be connected and sent id(). If ack is
+    False, packets are written without acknowledgement. After a write
+    fails, ie the connection is lost, queuing raises the error.
+    """
+
+    def __init__(
+        self, dali, maxPackets=DEFAULT_MAX_PACKETS, maxBytes=None, overflow=OVERFLOW_BLOCK, ack=True
+    ):
+        if overflow not in WRITER_OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {WRITER_OVERFLOW_POLICIES}: {overflow}")
+        if maxPackets < 1:
+            raise ValueError(f"maxPackets must be at least 1: {maxPackets}")
+        self.dalis = list(dali) if isinstance(dali, (list, tuple)) else [dali]
+        if len(self.dalis) == 0:
+            raise ValueError("need at least one DataLink")
+        self.maxPackets = maxPackets
+        self.maxBytes = maxBytes
+        self.overflow = overflow
+        self.ack = ack
+        self.queuedBytes = 0
+        self.maxDepth = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.error = None
+        self.closing = False
+        self._items = deque()
+        self._changed = asyncio.Condition()
+        self._workers = []
+
+    def qsize(self):
+        return len(self._items)
+
+    def stats(self):
+        """
+        Queue depth and bytes, the most ever queued, and counts of packets
+        dropped, written and with failed acks.
+        """
+        return {
+            "depth": len(self._items),
+            "queuedBytes": self.queuedBytes,
+            "maxDepth": self.maxDepth,
+            "dropped": self.dropped,
+            "written": self.written,
+            "errors": self.errors,
+        }
+
+    def _isFull(self, size):
+        if len(self._items) >= self.maxPackets:
+            return True
+        # a single packet larger than maxBytes is allowed into an empty queue
+        return (
+            self.maxBytes is not None
+            and len(self._items) > 0
+            and self.queuedBytes + size > self.maxBytes
+        )
+
+    async def write(self, streamid, hpdatastart, hpdataend, data, pktid=None):
+        """
+        Queue a packet, returns False if dropped as the queue is full.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.closing:
+            raise ValueError("QueuedWriter is closed")
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._drain(dali)) for dali in self.dalis]
+        size = len(data)
+        async with self._changed:
+            if self._isFull(size):
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    while self._items and self._isFull(size):
+                        old = self._items.popleft()
+                        self.queuedBytes -= len(old[3])
+                        self.dropped += 1
+                else:
+                    await self._changed.wait_for(lambda: not self._isFull(size) or self.error is not None)
+                    if self.error is not None:
+                        raise self.error
+            self._items.append((streamid, hpdatastart, hpdataend, data, pktid))
+            self.queuedBytes += size
+            self.maxDepth = max(self.maxDepth, len(self._items))
+            self._changed.notify_all()
+        return True
+
+    async def writeMSeed(self, msr, pktid=None):
+        return await self.write(*self.dalis[0].packMSeed(msr), pktid=pktid)
+
+    async def writeMSeed3(self, ms3, pktid=None):
+        return await self.write(*self.dalis[0].packMSeed3(ms3), pktid=pktid)
+
+    async def writeJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None):
+        packet = self.dalis[0].packJSON(streamid, hpdatastart, hpdataend, jsonMessage)
+        return await self.write(*packet, pktid=pktid)
+
+    async def writeBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None):
+        packet = self.dalis[0].packBZ2JSON(streamid, hpdatastart, hpdataend, jsonMessage)
+        return await self.write(*packet, pktid=pktid)
+
+    async def writeCompressedJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, packetType, pktid=None):
+        packet = self.dalis[0].packCompressedJSON(streamid, hpdatastart, hpdataend, jsonMessage, packetType)
+        return await self.write(*packet, pktid=pktid)
+
+    async def _drain(self, dali):
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self._items or self.closing)
+                    if not self._items:
+                        break
+                    streamid, hpdatastart, hpdataend, data, pktid = self._items.popleft()
+                    self.queuedBytes -= len(data)
+                    self._changed.notify_all()
+                if self.ack:
+                    future = await dali.writeAckPipelined(streamid, hpdatastart, hpdataend, data, pktid=pktid)
+                    future.add_done_callback(self._ackDone)
+                else:
+                    await dali.write(streamid, hpdatastart, hpdataend, "N", data, pktid=pktid)
+                self.written += 1
+            if self.ack:
+                await dali.flushAcks()
+            else:
+                await dali.flush()
+        except Exception as e:
+            self.error = e
+            async with self._changed:
+                self._changed.notify_all()
+
+    def _ackDone(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.errors += 1
+        elif future.result().type == "ERROR":
+            self.errors += 1
+
+    async def close(self):
+        """
+        Write all queued packets and wait for their acks.
+        """
+        async with self._changed:
+            self.closing = True
+            self._changed.notify_all()
+        await asyncio.gather(*self._workers)
+        if self.error is not None:
+            raise self.error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
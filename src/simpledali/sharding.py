@@ -0,0 +1,273 @@
+"""
+Run Dali2Jsonl as several worker processes, each archiving a disjoint
+shard of the match, to use more than one core and connection.
+"""
+
+import asyncio
+import copy
+import multiprocessing
+import queue
+import time
+
+from .dali2jsonl import Dali2Jsonl
+from .util import asyncioRun
+
+SHARD_BY_NETWORK = "network"
+SHARD_BY_STATION = "station"
+SHARD_BY = [SHARD_BY_NETWORK, SHARD_BY_STATION]
+
+# first characters of network or station codes, split between shards
+SHARD_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+DEFAULT_STATS_INTERVAL = 10
+DEFAULT_RESTART_DELAY = 5
+
+
+def shardMatches(match, numShards, shardBy=SHARD_BY_STATION):
+    """
+    Split a match regular expression into numShards disjoint ones by the
+    first character of the network or station code. Each is the original
+    match behind a lookahead for that shard's characters, so the server
+    must support lookahead, as PCRE in ringserver does. Stream ids with
+    codes starting with a character outside SHARD_CHARS go to the last
+    shard.
+
+    Note codes are not evenly spread over first characters, use explicit
+    shard_match patterns in the configuration to balance load by hand.
+    """
+    if numShards < 1:
+        raise ValueError(f"numShards must be at least 1: {numShards}")
+    if numShards > len(SHARD_CHARS):
+        raise ValueError(f"numShards must be at most {len(SHARD_CHARS)}: {numShards}")
+    if shardBy not in SHARD_BY:
+        raise ValueError(f"shardBy must be one of {SHARD_BY}: {shardBy}")
+    if numShards == 1:
+        return [match]
+    # FDSN: prefix is optional, but must not be skipped when present
+    prefix = "(?:FDSN:|(?!FDSN:))"
+    if shardBy == SHARD_BY_STATION:
+        prefix += "[^_]*_"
+    out = []
+    for i in range(numShards):
+        chars = SHARD_CHARS[i::numShards]
+        charClass = f"[{chars}{chars.lower()}]"
+        if i == numShards - 1:
+            others = SHARD_CHARS + SHARD_CHARS.lower()
+            charClass = f"(?:{charClass}|[^{others}])"
+        # all in the lookahead, then .* keeps an unanchored match unanchored
+        out.append(f"^(?={prefix}{charClass}).*(?:{match})")
+    return out
+
+
+def shardConfigs(conf, numShards=None, archiverClass=Dali2Jsonl):
+    """
+    Configuration for each shard, copies of conf with the shard's match
+    and, if checkpointing, its own checkpoint file. Explicit patterns in
+    [datalink] shard_match are used as is, otherwise the match is split
+    into shards, default count from [datalink] shards.
+    """
+    archiverClass.configure_defaults(conf)
+    section = archiverClass.CONFIG_SECTION
+    dali_conf = conf["datalink"]
+    if dali_conf["shard_match"]:
+        matches = list(dali_conf["shard_match"])
+    else:
+        if numShards is None:
+            numShards = dali_conf["shards"]
+        matches = shardMatches(dali_conf["match"], numShards, dali_conf["shard_by"])
+    if len(matches) > 1:
+        checkShardedPatterns(conf[section], dali_conf["shard_by"])
+    out = []
+    for i, match in enumerate(matches):
+        shardConf = copy.deepcopy(conf)
+        shardConf["datalink"]["match"] = match
+        if shardConf[section]["checkpoint"] is not None:
+            shardConf[section]["checkpoint"] = f"{conf[section]['checkpoint']}.{i}"
+        out.append(shardConf)
+    return out
+
+
+def checkShardedPatterns(out_conf, shardBy):
+    """
+    Shards must not write to the same files, so write patterns need the
+    code the shards are split by.
+    """
+    flag = "%n" if shardBy == SHARD_BY_NETWORK else "%s"
+    patterns = [out_conf["write"]] + list(out_conf["bandwrite"].values())
+    for p in patterns:
+        if len(p) > 1 and flag not in p:
+            raise ValueError(
+                f"write pattern {p} must include {flag} when sharded by {shardBy}, so shards write different files"
+            )
+
+
+def runShard(
+    shard, conf, statsQueue, stopEvent, verbose=False, statsInterval=DEFAULT_STATS_INTERVAL,
+    archiverClass=Dali2Jsonl
+):
+    """
+    Worker process entry, archive one shard until stopEvent is set.
+    """
+    try:
+        d2j = archiverClass.from_config(conf, verbose=verbose)
+        asyncioRun(
+            _runShard(d2j, shard, statsQueue, stopEvent, statsInterval),
+            use_uvloop=conf["datalink"]["uvloop"],
+            verbose=verbose,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+async def _runShard(d2j, shard, statsQueue, stopEvent, statsInterval):
+    task = asyncio.create_task(d2j.run())
+    lastReport = time.monotonic()
+    try:
+        while not task.done():
+            await asyncio.wait([task], timeout=0.2)
+            if stopEvent.is_set():
+                task.cancel()
+            now = time.monotonic()
+            if now - lastReport >= statsInterval:
+                statsQueue.put((shard, dict(d2j.stats)))
+                lastReport = now
+        await task
+    finally:
+        statsQueue.put((shard, dict(d2j.stats)))
+
+
+class ShardSupervisor:
+    """
+    Runs one Dali2Jsonl, or subclass, worker process per shard, each with its own
+    DataLink connection and output files, restarting any that exit and
+    collecting their stats.
+
+    For example:
+
+        supervisor = ShardSupervisor(conf, numShards=4)
+        supervisor.run()
+    """
+
+    def __init__(
+        self, conf, numShards=None, verbose=False,
+        statsInterval=DEFAULT_STATS_INTERVAL, restartDelay=DEFAULT_RESTART_DELAY,
+        archiverClass=Dali2Jsonl
+    ):
+        self.archiverClass = archiverClass
+        self.shardConfs = shardConfigs(conf, numShards, archiverClass)
+        self.verbose = verbose
+        self.statsInterval = statsInterval
+        self.restartDelay = restartDelay
+        # spawn so workers do not inherit the parent's event loop or files
+        self.context = multiprocessing.get_context("spawn")
+        self.statsQueue = self.context.Queue()
+        self.stopEvent = self.context.Event()
+        self.processes = [None] * len(self.shardConfs)
+        self.restarts = [0] * len(self.shardConfs)
+        # latest stats from the current worker of each shard
+        self.stats = {i: {} for i in range(len(self.shardConfs))}
+        # summed stats from previous workers of each shard, before restarts
+        self.pastStats = {i: {} for i in range(len(self.shardConfs))}
+
+    @property
+    def numShards(self):
+        return len(self.shardConfs)
+
+    def start(self):
+        for shard in range(self.numShards):
+            self.startShard(shard)
+
+    def startShard(self, shard):
+        if self.verbose:
+            print(f"start shard {shard} match {self.shardConfs[shard]['datalink']['match']}")
+        p = self.context.Process(
+            target=runShard,
+            args=(
+                shard, self.shardConfs[shard], self.statsQueue, self.stopEvent, self.verbose,
+                self.statsInterval, self.archiverClass,
+            ),
+            name=f"dali2jsonl-shard{shard}",
+            daemon=False,
+        )
+        p.start()
+        self.processes[shard] = p
+
+    def run(self, duration=None):
+        """
+        Start the workers and supervise them until stopped, interrupted or
+        duration seconds have passed.
+        """
+        start = time.monotonic()
+        self.start()
+        exited = {}
+        try:
+            while not self.stopEvent.is_set():
+                if duration is not None and time.monotonic() - start >= duration:
+                    break
+                self.collectStats(timeout=0.5)
+                now = time.monotonic()
+                for shard, p in enumerate(self.processes):
+                    if p.is_alive():
+                        continue
+                    if shard not in exited:
+                        exited[shard] = now
+                        if self.verbose:
+                            print(f"shard {shard} exited with code {p.exitcode}, restart in {self.restartDelay} sec")
+                    elif now - exited[shard] >= self.restartDelay:
+                        del exited[shard]
+                        self.restarts[shard] += 1
+                        self.collectStats()
+                        self.pastStats[shard] = sumStats([self.pastStats[shard], self.stats[shard]])
+                        self.stats[shard] = {}
+                        self.startShard(shard)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return self.totals()
+
+    def stop(self, timeout=10):
+        """
+        Ask workers to finish, writing their output and checkpoints, and
+        wait for them, terminating any that do not exit within timeout.
+        """
+        self.stopEvent.set()
+        deadline = time.monotonic() + timeout
+        for p in self.processes:
+            if p is not None:
+                p.join(max(deadline - time.monotonic(), 0))
+        for p in self.processes:
+            if p is not None and p.is_alive():
+                if self.verbose:
+                    print(f"terminate {p.name}")
+                p.terminate()
+                p.join()
+        self.collectStats()
+
+    def collectStats(self, timeout=0):
+        """
+        Read stats sent by workers, waiting up to timeout for the first.
+        """
+        try:
+            shard, stats = self.statsQueue.get(timeout=timeout) if timeout > 0 else self.statsQueue.get_nowait()
+            while True:
+                self.stats[shard] = stats
+                if self.verbose:
+                    print(f"shard {shard}: {stats}")
+                shard, stats = self.statsQueue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def totals(self):
+        """
+        Stats summed over all shards, including restarted workers.
+        """
+        return sumStats(list(self.stats.values()) + list(self.pastStats.values()))
+
+
+def sumStats(statsList):
+    out = {}
+    for stats in statsList:
+        for k, v in stats.items():
+            out[k] = out.get(k, 0) + v
+    return out
@@ -1,8 +1,234 @@
 import asyncio
+from collections import deque
 
-from .abstractdali import DataLink, QUERY_MODE, DLPROTO_1_0
+from .abstractdali import DataLink, DLPROTO_1_0, DEFAULT_ACK_WINDOW
 from .dalipacket import DaliPacket, DaliResponse, DaliException, DaliClosed
 
+# initial size of the receive buffer in buffered mode, grows if a single
+# frame is larger
+DEFAULT_BUFFER_SIZE = 64 * 1024
+# pause reading from the socket when this many parsed frames are waiting
+MAX_QUEUED_FRAMES = 1024
+# default max seconds an unacknowledged write waits in the bulk send buffer
+DEFAULT_FLUSH_LATENCY = 0.05
+
+
+def encodeFrame(header, data):
+    """
+    Encode a DataLink frame, preamble, header and data, as a single bytes.
+    The header may be str or already encoded bytes.
+    """
+    h = header if isinstance(header, bytes) else header.encode("UTF-8")
+    if len(h) > 255:
+        raise DaliException(f"header lengh must be <= 255, {len(h)}")
+    if data:
+        return b"".join((b"DL", len(h).to_bytes(1, byteorder="big", signed=False), h, data))
+    return b"".join((b"DL", len(h).to_bytes(1, byteorder="big", signed=False), h))
+
+
+def payloadSize(header):
+    """
+    Size of the payload that follows a DataLink header, from the size field
+    of PACKET, INFO, OK and ERROR headers. ID and ENDSTREAM have no payload.
+    """
+    if header.startswith("PACKET "):
+        return int(header.split(" ")[6])
+    if (
+        header.startswith("INFO ")
+        or header.startswith("OK ")
+        or header.startswith("ERROR ")
+    ):
+        return int(header.split(" ")[2])
+    return 0
+
+
+def frameToResponse(header, payload):
+    """
+    Create a DaliPacket or DaliResponse from a parsed header string and its
+    payload. PACKET data is kept as given, so may be a memoryview.
+    """
+    if header.startswith("PACKET "):
+        s = header.split(" ")
+        return DaliPacket(s[0], s[1], s[2], s[3], s[4], s[5], int(s[6]), payload)
+    if header.startswith("ID "):
+        return DaliResponse("ID", "", header[3:])
+    if (
+        header.startswith("INFO ")
+        or header.startswith("OK ")
+        or header.startswith("ERROR ")
+    ):
+        s = header.split(" ")
+        return DaliResponse(s[0], s[1], str(payload, "utf-8"))
+    if header == "ENDSTREAM":
+        return DaliResponse(header, None, None)
+    raise DaliException(
+        f"Header does not start with INFO, ID, PACKET, ENDSTREAM, OK or ERROR: {header}"
+    )
+
+
+class DaliFrameProtocol(asyncio.BufferedProtocol):
+    """
+    Protocol that receives directly into one buffer and parses whole
+    DataLink frames out of it, without an await per frame.
+
+    Packet data is handed out as a memoryview into the receive buffer, so
+    no per packet copy is made. The buffer is compacted and reused once no
+    payload views into it remain, otherwise a new buffer is allocated and
+    the old one is left to the views that still refer to it.
+    """
+    def __init__(self, bufsize=DEFAULT_BUFFER_SIZE):
+        self.buffer = bytearray(bufsize)
+        self.start = 0
+        self.end = 0
+        self.frames = deque()
+        self.transport = None
+        self.closed = False
+        self.exception = None
+        self._waiter = None
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.closed = True
+        if exc is not None and self.exception is None:
+            self.exception = exc
+        self._wakeup()
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    def eof_received(self):
+        self.closed = True
+        self._wakeup()
+        return False
+
+    def get_buffer(self, sizehint):
+        needed = self._frameSizeNeeded()
+        free = len(self.buffer) - self.end
+        if free < 512 or self.end - self.start + free < needed:
+            self._makeRoom(max(needed, 512))
+        return memoryview(self.buffer)[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        try:
+            self._parseFrames()
+        except Exception as e:
+            self.exception = e
+            self.closed = True
+            self.transport.close()
+        self._wakeup()
+        if len(self.frames) >= MAX_QUEUED_FRAMES and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        if self._drain_waiter is not None and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    async def drain(self):
+        if self.closed:
+            raise DaliClosed("Connection is closed")
+        if self._writing_paused:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+            await self._drain_waiter
+            self._drain_waiter = None
+
+    async def nextFrame(self):
+        """
+        Wait for and return the next parsed DaliPacket or DaliResponse.
+        """
+        while not self.frames:
+            if self.exception is not None:
+                if isinstance(self.exception, DaliException):
+                    raise self.exception
+                raise DaliClosed("Connection is closed") from self.exception
+            if self.closed:
+                raise DaliClosed("Connection is closed")
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        frame = self.frames.popleft()
+        if self._reading_paused and len(self.frames) < MAX_QUEUED_FRAMES // 2:
+            self._reading_paused = False
+            if not self.closed:
+                self.transport.resume_reading()
+        return frame
+
+    def hasFrames(self):
+        return len(self.frames) > 0
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _frameSizeNeeded(self):
+        """
+        Total size of the partial frame at start of the unparsed data, or 0
+        if not yet known.
+        """
+        avail = self.end - self.start
+        if avail < 3:
+            return 3
+        hSize = self.buffer[self.start + 2]
+        if avail < 3 + hSize:
+            return 3 + hSize
+        h = self.buffer[self.start + 3 : self.start + 3 + hSize].decode("utf-8")
+        return 3 + hSize + payloadSize(h)
+
+    def _makeRoom(self, needed):
+        pending = self.end - self.start
+        size = len(self.buffer)
+        while size < needed + 512:
+            size *= 2
+        try:
+            # resize fails with BufferError if any payload view is alive
+            self.buffer.extend(b"\0")
+            del self.buffer[-1]
+            inUse = False
+        except BufferError:
+            inUse = True
+        if inUse or size > len(self.buffer):
+            newBuffer = bytearray(size)
+            newBuffer[0:pending] = self.buffer[self.start : self.end]
+            self.buffer = newBuffer
+        else:
+            self.buffer[0:pending] = self.buffer[self.start : self.end]
+        self.start = 0
+        self.end = pending
+
+    def _parseFrames(self):
+        buf = self.buffer
+        view = memoryview(buf)
+        pos = self.start
+        end = self.end
+        while end - pos >= 3:
+            # D ==> 68, L ==> 76
+            if buf[pos] != 68 or buf[pos + 1] != 76:
+                raise DaliException(
+                    f"did not receive DL from read pre {buf[pos]:d}{buf[pos+1]:d}{buf[pos+2]:d}"
+                )
+            hSize = buf[pos + 2]
+            if end - pos < 3 + hSize:
+                break
+            header = str(view[pos + 3 : pos + 3 + hSize], "utf-8")
+            dStart = pos + 3 + hSize
+            dEnd = dStart + payloadSize(header)
+            if dEnd > end:
+                break
+            self.frames.append(frameToResponse(header, view[dStart:dEnd]))
+            pos = dEnd
+        self.start = pos
+
 class SocketDataLink(DataLink):
     """
     A DataLink over a normal socket.
@@ -10,44 +236,118 @@ class SocketDataLink(DataLink):
     This uses a port number often specified in ringservers's conf as a
     DataLinkPort, but can also be specified as a ListenPort as long as it
     includes all or DataLink as the type.
+
+    If buffered is True, frames are parsed by a DaliFrameProtocol out of a
+    single receive buffer instead of with several reads per packet, and
+    the data of each DaliPacket is a memoryview instead of bytes.
+
+    If flush_bytes is greater than zero, unacknowledged writes are collected
+    and sent together once flush_bytes is reached or after flush_latency
+    seconds, whichever is first. Any other command sends them first.
     """
-    def __init__(self, host, port, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False):
-        super().__init__(packet_size=packet_size, dlproto=dlproto, verbose=verbose)
+    def __init__(self, host, port, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False, buffered=False,
+                 ack_window=DEFAULT_ACK_WINDOW, flush_bytes=0, flush_latency=DEFAULT_FLUSH_LATENCY):
+        super().__init__(packet_size=packet_size, dlproto=dlproto, verbose=verbose, ack_window=ack_window)
         self.host = host
         self.port = port
+        self.buffered = buffered
+        self.flush_bytes = flush_bytes
+        self.flush_latency = flush_latency
         self.reader = None
         self.writer = None
+        self.transport = None
+        self.protocol = None
+        self._sendBuffer = []
+        self._sendBufferSize = 0
+        self._flushHandle = None
 
     async def createDaliConnection(self):
         await self.close()
         if self.verbose:
             print(f"connecting {self.host}:{self.port}")
-        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.buffered:
+            loop = asyncio.get_running_loop()
+            self.transport, self.protocol = await loop.create_connection(
+                DaliFrameProtocol, self.host, self.port
+            )
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
 
     async def send(self, header, data):
-        h = header.encode("UTF-8")
-        pre = "DL"
         if self.isClosed():
             self._force_close()
             raise DaliClosed("Connection is closed")
         try:
-            self.writer.write(pre.encode("UTF-8"))
-            lenByte = len(h).to_bytes(1, byteorder="big", signed=False)
-            self.writer.write(lenByte)
-            self.writer.write(h)
-            if data:
-                self.writer.write(data)
-            out = await self.writer.drain()
+            # previously buffered writes go out first, in the same syscall
+            self._writePending(encodeFrame(header, data))
+            out = await self._drain()
             self.updateMode(header)
             return out
         except:
             await self.close()
             raise
 
+    async def sendBuffered(self, header, data):
+        """
+        Send a frame that does not expect a reply. If flush_bytes is set the
+        frame is held to be sent along with others, see flush().
+        """
+        if self.flush_bytes <= 0:
+            return await self.send(header, data)
+        if self.isClosed():
+            self._force_close()
+            raise DaliClosed("Connection is closed")
+        frame = encodeFrame(header, data)
+        self._sendBuffer.append(frame)
+        self._sendBufferSize += len(frame)
+        if self._sendBufferSize >= self.flush_bytes:
+            await self.flush()
+        elif self._flushHandle is None:
+            self._flushHandle = asyncio.get_running_loop().call_later(
+                self.flush_latency, self._writePending
+            )
+
+    async def flush(self):
+        """
+        Send any buffered frames and wait for the socket to drain.
+        """
+        if self.isClosed():
+            self._force_close()
+            raise DaliClosed("Connection is closed")
+        try:
+            self._writePending()
+            await self._drain()
+        except:
+            await self.close()
+            raise
+
+    def _writePending(self, frame=None):
+        if self._flushHandle is not None:
+            self._flushHandle.cancel()
+            self._flushHandle = None
+        chunks = self._sendBuffer
+        if frame is not None:
+            chunks.append(frame)
+        if not chunks:
+            return
+        self._sendBuffer = []
+        self._sendBufferSize = 0
+        if self.protocol is not None:
+            self.transport.writelines(chunks)
+        elif self.writer is not None:
+            self.writer.writelines(chunks)
+
+    async def _drain(self):
+        if self.protocol is not None:
+            return await self.protocol.drain()
+        return await self.writer.drain()
+
     async def parseResponse(self):
         try:
             if self.isClosed():
                 raise DaliClosed("Connection is closed")
+            if self.protocol is not None:
+                return await self.protocol.nextFrame()
             pre = await self.reader.readexactly(3)
             # D ==> 68, L ==> 76
             if pre[0] == 68 and pre[1] == 76:
@@ -111,14 +411,23 @@ class SocketDataLink(DataLink):
             raise
 
     def isClosed(self):
-        ans = self.writer is None or self.writer.is_closing() or \
-            self.reader is None or self.reader.at_eof()
+        if self.protocol is not None:
+            # frames already received can still be read after server closes
+            ans = self.transport.is_closing() and not self.protocol.hasFrames()
+        else:
+            ans = self.writer is None or self.writer.is_closing() or \
+                self.reader is None or self.reader.at_eof()
         if ans:
             # is socket is closed, make sure other state is updated
             self._force_close()
         return ans
 
     async def close(self):
+        if self._sendBuffer and not self.isClosed():
+            # closing the transport still sends what was already written
+            self._writePending()
+        if self.transport is not None:
+            self.transport.close()
         if self.writer is not None:
             try:
                 self.writer.close()
@@ -130,4 +439,12 @@ class SocketDataLink(DataLink):
     def _force_close(self):
         self.writer = None
         self.reader = None
-        self.__mode = QUERY_MODE
+        self.transport = None
+        self.protocol = None
+        if self._flushHandle is not None:
+            self._flushHandle.cancel()
+            self._flushHandle = None
+        self._sendBuffer = []
+        self._sendBufferSize = 0
+        # connection gone, so no longer streaming
+        self.updateMode("ENDSTREAM")
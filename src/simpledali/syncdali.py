@@ -0,0 +1,243 @@
+import asyncio
+import threading
+
+from .socketdali import SocketDataLink
+from .util import newEventLoop
+from .websocketdali import WebSocketDataLink
+
+DEFAULT_MAX_PENDING = 1000
+
+# keyword arguments of SyncDataLink, the rest in forSocket() and
+# forWebSocket() are for the DataLink
+SYNC_ARGS = ("timeout", "maxPending", "use_uvloop")
+
+
+def _splitSyncArgs(kwargs):
+    syncArgs = {k: v for k, v in kwargs.items() if k in SYNC_ARGS}
+    daliArgs = {k: v for k, v in kwargs.items() if k not in SYNC_ARGS}
+    return syncArgs, daliArgs
+
+
+class SyncDataLink:
+    """
+    Blocking DataLink for threaded code that is not async.
+
+    The DataLink runs on one event loop in a background thread, kept for
+    the life of the connection, so each call costs a hand off between
+    threads instead of starting a new event loop. Methods may be called
+    from any thread, commands are sent one at a time in the order they
+    arrive.
+
+    factory is a callable returning a new, unconnected, DataLink, see
+    forSocket() and forWebSocket() for the common cases.
+
+    For example:
+
+        with SyncDataLink.forSocket(host, port) as dali:
+            dali.id("prog", "user", 0, "python")
+            dali.writeMSeed3(ms3)
+            # or without waiting for the ack, returns a
+            # concurrent.futures.Future for the response
+            future = dali.writeMSeed3(ms3, wait=False)
+
+    Up to maxPending writes with wait=False may be outstanding, beyond
+    that the write blocks until the oldest is acknowledged.
+    """
+
+    def __init__(self, factory, timeout=None, maxPending=DEFAULT_MAX_PENDING, use_uvloop=False):
+        self.timeout = timeout
+        self._pending = threading.BoundedSemaphore(maxPending)
+        self.loop = newEventLoop(use_uvloop)
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="SyncDataLink", daemon=True
+        )
+        self._thread.start()
+        try:
+            self.dali = self._run(self._connect(factory))
+        except:
+            self._stopLoop()
+            raise
+
+    @classmethod
+    def forSocket(cls, host, port, packet_size=-1, verbose=False, **kwargs):
+        """
+        SyncDataLink with a SocketDataLink connection to host and port.
+        Keyword arguments other than SyncDataLink's, ie buffered or
+        ack_window, are passed to the SocketDataLink.
+        """
+        syncArgs, daliArgs = _splitSyncArgs(kwargs)
+        return cls(
+            lambda: SocketDataLink(host, port, packet_size=packet_size, verbose=verbose, **daliArgs),
+            **syncArgs,
+        )
+
+    @classmethod
+    def forWebSocket(cls, uri, packet_size=-1, verbose=False, **kwargs):
+        """
+        SyncDataLink with a WebSocketDataLink connection to uri. Keyword
+        arguments other than SyncDataLink's, ie ack_window, are passed to
+        the WebSocketDataLink.
+        """
+        syncArgs, daliArgs = _splitSyncArgs(kwargs)
+        return cls(
+            lambda: WebSocketDataLink(uri, packet_size=packet_size, verbose=verbose, **daliArgs),
+            **syncArgs,
+        )
+
+    async def _connect(self, factory):
+        # created on the loop, as DataLinks hold asyncio objects
+        self._lock = asyncio.Lock()
+        dali = factory()
+        await dali.createDaliConnection()
+        return dali
+
+    def _run(self, coro):
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("SyncDataLink can not be called from its own event loop")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(self.timeout)
+
+    async def _locked(self, method, args, kwargs):
+        async with self._lock:
+            return await method(*args, **kwargs)
+
+    def call(self, name, *args, **kwargs):
+        """
+        Call the named async method of the DataLink, ie
+        dali.call("info", "STATUS"), blocking until it returns.
+        """
+        return self._run(self._locked(getattr(self.dali, name), args, kwargs))
+
+    def _writeMaybeWait(self, name, args, kwargs, wait):
+        if wait:
+            return self.call(name, *args, **kwargs)
+        self._pending.acquire()
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._sendAndWait(getattr(self.dali, name), args, kwargs), self.loop
+            )
+        except:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda f: self._pending.release())
+        return future
+
+    async def _sendAndWait(self, method, args, kwargs):
+        async with self._lock:
+            ack = await method(*args, wait=False, **kwargs)
+        # lock is free while waiting, so later writes are pipelined
+        return await ack
+
+    def id(self, programname, username, processid, architecture):
+        return self.call("id", programname, username, processid, architecture)
+
+    def auth(self, token):
+        return self.call("auth", token)
+
+    def info(self, infotype):
+        return self.call("info", infotype)
+
+    def parsedInfoStatus(self):
+        return self.call("parsedInfoStatus")
+
+    def parsedInfoStreams(self):
+        return self.call("parsedInfoStreams")
+
+    def match(self, pattern):
+        return self.call("match", pattern)
+
+    def reject(self, pattern):
+        return self.call("reject", pattern)
+
+    def positionEarliest(self):
+        return self.call("positionEarliest")
+
+    def positionLatest(self):
+        return self.call("positionLatest")
+
+    def positionAfter(self, time):
+        return self.call("positionAfter", time)
+
+    def positionSet(self, packetId, packetTime=None):
+        return self.call("positionSet", packetId, packetTime)
+
+    def read(self, packetId):
+        return self.call("read", packetId)
+
+    def writeAck(self, streamid, hpdatastart, hpdataend, data, pktid=None):
+        return self.call("writeAck", streamid, hpdatastart, hpdataend, data, pktid=pktid)
+
+    def writeMSeed(self, msr, pktid=None, wait=True):
+        return self._writeMaybeWait("writeMSeed", (msr,), {"pktid": pktid}, wait)
+
+    def writeMSeed3(self, ms3, pktid=None, wait=True):
+        return self._writeMaybeWait("writeMSeed3", (ms3,), {"pktid": pktid}, wait)
+
+    def writeJSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        return self._writeMaybeWait(
+            "writeJSON",
+            (streamid, hpdatastart, hpdataend, jsonMessage), {"pktid": pktid}, wait
+        )
+
+    def writeBZ2JSON(self, streamid, hpdatastart, hpdataend, jsonMessage, pktid=None, wait=True):
+        return self._writeMaybeWait(
+            "writeBZ2JSON",
+            (streamid, hpdatastart, hpdataend, jsonMessage), {"pktid": pktid}, wait
+        )
+
+    def writeCompressedJSON(
+        self, streamid, hpdatastart, hpdataend, jsonMessage, packetType, pktid=None, wait=True
+    ):
+        return self._writeMaybeWait(
+            "writeCompressedJSON",
+            (streamid, hpdatastart, hpdataend, jsonMessage, packetType), {"pktid": pktid}, wait
+        )
+
+    def flushAcks(self):
+        """
+        Wait until all writes with wait=False have been acknowledged.
+        """
+        return self.call("flushAcks")
+
+    def stream(self):
+        """
+        Generator of packets streamed from the server, as DataLink.stream().
+        Other commands must not be sent until streaming is ended by
+        closing the generator, so iterate in a single thread.
+        """
+        packets = self.dali.stream()
+        try:
+            while True:
+                try:
+                    daliPacket = self._run(anext(packets))
+                except StopAsyncIteration:
+                    return
+                yield daliPacket
+        finally:
+            if not self.loop.is_closed():
+                self._run(packets.aclose())
+
+    def isClosed(self):
+        return self.dali.isClosed()
+
+    def close(self):
+        """
+        Close the connection and stop the background event loop.
+        """
+        if self.loop.is_closed():
+            return
+        try:
+            self.call("close")
+        finally:
+            self._stopLoop()
+
+    def _stopLoop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
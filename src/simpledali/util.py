@@ -1,4 +1,6 @@
+import asyncio
 from datetime import datetime, timezone
+import sys
 import jwt  # pip3 install pyjwt (not jwt!!!)
 
 MICROS = 1000000
@@ -20,6 +22,54 @@ def hptimeToDatetime(hptime):
     return dt
 
 
+def asyncioRun(main, use_uvloop=False, debug=False, verbose=False):
+    """
+    Run the coroutine like asyncio.run(), but if use_uvloop is True and
+    uvloop is installed, run it on a uvloop event loop. Falls back to the
+    default asyncio loop, saying so if verbose, if uvloop cannot be imported.
+    """
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            if verbose:
+                print("uvloop not installed, using default asyncio event loop")
+            use_uvloop = False
+    if not use_uvloop:
+        return asyncio.run(main, debug=debug)
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop, debug=debug) as runner:
+            return runner.run(main)
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    try:
+        return asyncio.run(main, debug=debug)
+    finally:
+        asyncio.set_event_loop_policy(None)
+
+
+def newEventLoop(use_uvloop=False, verbose=False):
+    """
+    A new event loop, uvloop if use_uvloop is True and it is installed,
+    otherwise the default asyncio loop.
+    """
+    if use_uvloop:
+        try:
+            import uvloop
+
+            return uvloop.new_event_loop()
+        except ImportError:
+            if verbose:
+                print("uvloop not installed, using default asyncio event loop")
+    return asyncio.new_event_loop()
+
+
+def eventLoopName():
+    """
+    Name of the module of the running event loop, ie asyncio or uvloop.
+    """
+    return type(asyncio.get_running_loop()).__module__.split(".")[0]
+
+
 def utcnowWithTz():
     """
     Create a datetime to the current time with the timezone set to utc.
@@ -1,8 +1,9 @@
 import logging
 import websockets
 
-from .abstractdali import DataLink, QUERY_MODE, STREAM_MODE, DLPROTO_1_0
+from .abstractdali import DataLink, DLPROTO_1_0, DEFAULT_ACK_WINDOW
 from .dalipacket import DaliPacket, DaliResponse, DaliException, DaliClosed
+from .socketdali import encodeFrame
 
 class WebSocketDataLink(DataLink):
     """
@@ -13,8 +14,9 @@ class WebSocketDataLink(DataLink):
     This uses a port number often specified in ringservers's conf as a
     ListenPort as long as it includes all or HTTP as the type.
     """
-    def __init__(self, uri, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False, ping_interval=None):
-        super().__init__(packet_size=packet_size, dlproto=dlproto, verbose=verbose)
+    def __init__(self, uri, packet_size=-1, dlproto=DLPROTO_1_0, verbose=False, ping_interval=None,
+                 ack_window=DEFAULT_ACK_WINDOW):
+        super().__init__(packet_size=packet_size, dlproto=dlproto, verbose=verbose, ack_window=ack_window)
         self.uri = uri
         self.ws = None
         self.ping_interval = ping_interval
@@ -32,21 +34,7 @@ class WebSocketDataLink(DataLink):
             self._force_close()
             raise DaliClosed("Connection is closed")
         try:
-            h = header.encode("UTF-8")
-            if len(h) > 255:
-                raise DaliException(f"header lengh must be <= 255, {len(h)}")
-            pre = "DL"
-            sendBytesLen = 3 + len(h)
-            if data:
-                sendBytesLen += len(data)
-            sendBytes = bytearray(sendBytesLen)
-            sendBytes[0:2] = pre.encode("UTF-8")
-            lenByte = len(h).to_bytes(1, byteorder="big", signed=False)
-            sendBytes[2] = lenByte[0]
-            sendBytes[3 : len(h) + 3] = h
-            if data:
-                sendBytes[len(h) + 3 :] = data
-            out = await self.ws.send(bytes(sendBytes))
+            out = await self.ws.send(encodeFrame(header, data))
             self.updateMode(header)
             return out
         except:
@@ -145,4 +133,5 @@ class WebSocketDataLink(DataLink):
         close() as it does the websocket close handshake.
         """
         self.ws = None
-        self.__mode = QUERY_MODE
+        # connection gone, so no longer streaming
+        self.updateMode("ENDSTREAM")
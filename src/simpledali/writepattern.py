@@ -0,0 +1,127 @@
+import pathlib
+import re
+
+from simplemseed import FDSNSourceId
+
+from .util import hptimeToDatetime, MICROS
+
+# hptime length of the smallest time unit a pattern flag can resolve
+HOUR_HPTIME = 3600 * MICROS
+
+# value of each allowed flag from the source id and time, add entries here
+# for more ringserver flags, time flags must not be finer than an hour
+FLAG_VALUES = {
+    "n": lambda sid, time: sid.networkCode,
+    "s": lambda sid, time: sid.stationCode,
+    "l": lambda sid, time: sid.locationCode,
+    "c": lambda sid, time: sid.shortChannelCode(),
+    "Y": lambda sid, time: f"{time.year:04d}",
+    "j": lambda sid, time: f"{time.timetuple().tm_yday:03d}",
+    "H": lambda sid, time: f"{time.hour:02d}",
+}
+SID_FLAGS = ["n", "s", "l", "c"]
+
+Allowed_Flags = list(FLAG_VALUES.keys())
+
+FLAG_RE = re.compile("%[a-zA-Z]")
+
+DEFAULT_MEMO_SIZE = 10000
+
+
+def checkPattern(p):
+    """
+    checks pattern for allowed flags as not all that are supported
+    by ringserver are supported here. See Allowed_Flags.
+
+    @param p mseed archive pattern string
+    @returns true if all flags are allowed
+    """
+    if len(p) == 0:
+        raise ValueError(f"write pattern is empty '{p}'")
+    for f in FLAG_RE.findall(p):
+        if f[1] not in Allowed_Flags:
+            raise ValueError(
+                f"directory value {f} not allowed in write pattern {p}"
+            )
+    return True
+
+
+class WritePattern:
+    """
+    A write pattern, like MSeedWrite in ringserver, compiled once into a
+    format string so filling it is a single str.format call.
+    """
+
+    def __init__(self, pattern):
+        checkPattern(pattern)
+        self.pattern = pattern
+        self.flags = []
+        fmt = []
+        pos = 0
+        for m in FLAG_RE.finditer(pattern):
+            fmt.append(pattern[pos : m.start()].replace("{", "{{").replace("}", "}}"))
+            flag = m.group()[1]
+            fmt.append("{" + flag + "}")
+            if flag not in self.flags:
+                self.flags.append(flag)
+            pos = m.end()
+        fmt.append(pattern[pos:].replace("{", "{{").replace("}", "}}"))
+        self._format = "".join(fmt).format
+        self._getters = [(f, FLAG_VALUES[f]) for f in self.flags]
+
+    def fill(self, sid: FDSNSourceId, time):
+        """
+        Pattern with all flags replaced from the source id and time.
+        """
+        return self._format(**{f: getter(sid, time) for f, getter in self._getters})
+
+    def fillSid(self, sid: FDSNSourceId):
+        """
+        Pattern with only the source id flags replaced, time flags are kept.
+        """
+        values = {f: f"%{f}" for f in self.flags}
+        for f, getter in self._getters:
+            if f in SID_FLAGS:
+                values[f] = getter(sid, None)
+        return self._format(**values)
+
+    def __str__(self):
+        return self.pattern
+
+
+class PatternPaths:
+    """
+    Output paths from a default write pattern and per band code patterns,
+    memoized by stream id and hour so repeat packets cost a dict lookup.
+    """
+
+    def __init__(self, writePattern, bandPatterns=dict(), memoSize=DEFAULT_MEMO_SIZE):
+        self.writePattern = WritePattern(writePattern)
+        self.bandPatterns = {band: WritePattern(p) for band, p in bandPatterns.items()}
+        self.memoSize = memoSize
+        self._memo = {}
+
+    def patternFor(self, sid: FDSNSourceId):
+        return self.bandPatterns.get(sid.bandCode, self.writePattern)
+
+    def path(self, sid: FDSNSourceId, time):
+        return pathlib.Path(self.patternFor(sid).fill(sid, time))
+
+    def pathForPacket(self, daliPacket):
+        """
+        Output path for the packet based on its stream id and data start
+        time, or None if the stream id is not a source id.
+        """
+        hptime = daliPacket.dataStartHPTime
+        key = (daliPacket.streamIdChannel(), hptime // HOUR_HPTIME)
+        out = self._memo.get(key)
+        if out is None:
+            sid = daliPacket.sourceId()
+            if sid is None:
+                return None
+            out = self.path(sid, hptimeToDatetime(hptime))
+            if len(self._memo) >= self.memoSize:
+                # mostly previous hours, cheaper to start over than track age
+                self._memo.clear()
+            self._memo[key] = out
+        return out
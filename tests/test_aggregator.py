@@ -0,0 +1,136 @@
+import asyncio
+from contextlib import aclosing
+from datetime import timedelta
+
+from simplemseed import MSeed3Header, MSeed3Record, FDSNSourceId, unpackMSeed3Record
+
+import pytest
+
+from simpledali import DaliException, DaliServer, SocketDataLink
+from simpledali.aggregator import MSeed3Aggregator, recordSize
+from simpledali.util import utcnowWithTz
+
+START = utcnowWithTz()
+
+
+def makeRecord(i, numSamples=10, sid="FDSN:XX_ABC_00_H_H_Z", offset=0):
+    header = MSeed3Header()
+    header.starttime = START + timedelta(seconds=(i * numSamples + offset) / 100)
+    header.sampleRatePeriod = 100
+    return MSeed3Record(header, FDSNSourceId.parse(sid), [i] * numSamples)
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def aggregateAndRead(records, maxLatency=10, sleep=0):
+    async with DaliServer() as server:
+        async with SocketDataLink(server.host, server.port) as dali:
+            await dali.id("test", "user", 0, "python")
+            async with MSeed3Aggregator(dali, maxLatency=maxLatency) as agg:
+                for ms3 in records:
+                    await agg.add(ms3)
+                if sleep > 0:
+                    await asyncio.sleep(sleep)
+                    flushedBeforeClose = agg.packetsOut
+            await dali.positionEarliest()
+            out = []
+            async with aclosing(dali.stream()) as packets:
+                async for daliPacket in packets:
+                    out.append(unpackMSeed3Record(bytes(daliPacket.data)))
+                    if len(out) == agg.packetsOut:
+                        break
+    if sleep > 0:
+        return agg, out, flushedBeforeClose
+    return agg, out
+
+
+class TestMSeed3Aggregator:
+    def test_record_size(self):
+        ms3 = makeRecord(0)
+        assert recordSize(ms3) == len(ms3.pack())
+
+    def test_merge_to_packet_size(self):
+        agg, out = run(aggregateAndRead([makeRecord(i) for i in range(100)]))
+        assert agg.recordsIn == 100
+        assert agg.packetsOut == len(out) == 10
+        assert all(len(ms3.pack()) <= 512 for ms3 in out)
+        values = [v for ms3 in out for v in ms3.decompress().tolist()]
+        assert values == [i for i in range(100) for _ in range(10)]
+
+    def test_gap_not_merged(self):
+        records = [makeRecord(0), makeRecord(1), makeRecord(2, offset=50)]
+        agg, out = run(aggregateAndRead(records))
+        assert [ms3.header.numSamples for ms3 in out] == [20, 10]
+
+    def test_separate_channels(self):
+        records = []
+        for i in range(4):
+            records.append(makeRecord(i))
+            records.append(makeRecord(i, sid="FDSN:XX_ABC_00_H_H_N"))
+        agg, out = run(aggregateAndRead(records))
+        assert sorted(str(ms3.identifier) for ms3 in out) == ["FDSN:XX_ABC_00_H_H_N", "FDSN:XX_ABC_00_H_H_Z"]
+        assert all(ms3.header.numSamples == 40 for ms3 in out)
+
+    def test_latency_deadline(self):
+        agg, out, flushedBeforeClose = run(aggregateAndRead([makeRecord(0), makeRecord(1)], maxLatency=0.1, sleep=0.3))
+        assert flushedBeforeClose == 1
+        assert out[0].header.numSamples == 20
+
+    def test_latency_flush_with_slow_server(self, monkeypatch):
+        from simpledali.daliserver import DaliSession
+
+        handleWrite = DaliSession.handleWrite
+
+        async def slowWrite(self, s, data):
+            await asyncio.sleep(0.005)
+            await handleWrite(self, s, data)
+
+        monkeypatch.setattr(DaliSession, "handleWrite", slowWrite)
+
+        async def go():
+            async with DaliServer() as server:
+                async with SocketDataLink(server.host, server.port) as dali:
+                    await dali.id("test", "user", 0, "python")
+                    async with MSeed3Aggregator(dali, maxLatency=0.01) as agg:
+                        # big records are written by add() while small
+                        # ones wait for the latency flush
+                        for i in range(40):
+                            await agg.add(makeRecord(i, numSamples=2))
+                            await agg.add(makeRecord(i, numSamples=110, sid="FDSN:XX_DEF_00_H_H_Z"))
+                            await asyncio.sleep(0.002)
+                    return agg, server.ring.rxPackets
+
+        agg, rxPackets = run(go())
+        assert agg.recordsIn == 80
+        assert rxPackets == agg.packetsOut
+
+    @pytest.mark.parametrize("wait", [True, False])
+    def test_write_error(self, monkeypatch, wait):
+        from simpledali.daliserver import DaliSession
+
+        async def refuseWrite(self, s, data):
+            await self.reply("ERROR", 0, "ring is read only")
+
+        monkeypatch.setattr(DaliSession, "handleWrite", refuseWrite)
+
+        async def go():
+            async with DaliServer() as server:
+                async with SocketDataLink(server.host, server.port) as dali:
+                    await dali.id("test", "user", 0, "python")
+                    agg = MSeed3Aggregator(dali, maxLatency=0.01, wait=wait)
+                    await agg.add(makeRecord(0))
+                    # the latency flush fails in the background
+                    await asyncio.sleep(0.1)
+                    with pytest.raises(DaliException):
+                        await agg.add(makeRecord(1))
+                    with pytest.raises(DaliException):
+                        await agg.close()
+                    return agg
+
+        agg = run(go())
+        assert agg.packetsOut == (0 if wait else 1)
+        if wait:
+            # not written, so still buffered
+            assert len(agg.pending) == 1
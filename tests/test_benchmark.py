@@ -0,0 +1,14 @@
+import asyncio
+
+from simpledali.benchmark import runAll
+
+
+class TestBenchmark:
+    def test_small_run(self):
+        loopName, results = asyncio.run(runAll(50, only="parse_response"))
+        assert loopName == "asyncio"
+        assert len(results) == 6
+        for r in results:
+            assert r["name"] == "parse_response"
+            assert r["packets"] == 50
+            assert r["packetsPerSec"] > 0
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+
+from simpledali import (
+    DaliBroadcaster,
+    DaliException,
+    DaliPacket,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DISCONNECT,
+)
+
+
+class FakeDataLink:
+    def __init__(self, numPackets):
+        self.numPackets = numPackets
+
+    async def stream(self):
+        for i in range(self.numPackets):
+            yield DaliPacket("PACKET", "XX_A_00_HHZ/JSON", str(i), "0", "0", "0", 0, b"")
+            await asyncio.sleep(0)
+
+
+class TestDaliBroadcaster:
+    def test_policies(self):
+        numPackets = 100
+
+        async def consume(sub, out, delay=0):
+            try:
+                async for p in sub:
+                    out.append(int(p.packetId))
+                    if delay:
+                        await asyncio.sleep(delay)
+            except DaliException:
+                out.append("disconnected")
+
+        async def run():
+            b = DaliBroadcaster(FakeDataLink(numPackets))
+            blocking = b.subscribe(maxsize=2, overflow=OVERFLOW_BLOCK)
+            dropping = b.subscribe(maxsize=5, overflow=OVERFLOW_DROP_OLDEST)
+            slow = b.subscribe(maxsize=5, overflow=OVERFLOW_DISCONNECT)
+            blockOut, slowOut = [], []
+            tasks = [
+                asyncio.create_task(consume(blocking, blockOut)),
+                asyncio.create_task(consume(slow, slowOut, delay=0.2)),
+            ]
+            await b.run()
+            dropOut = []
+            await consume(dropping, dropOut)
+            await asyncio.gather(*tasks)
+            return b, blocking, dropping, slow, blockOut, dropOut, slowOut
+
+        b, blocking, dropping, slow, blockOut, dropOut, slowOut = asyncio.run(
+            asyncio.wait_for(run(), 5)
+        )
+        assert b.packetCount == numPackets
+        assert blockOut == list(range(numPackets))
+        assert blocking.dropped == 0
+        assert dropOut == list(range(numPackets - 5, numPackets))
+        assert dropping.dropped == numPackets - 5
+        assert slow.disconnected
+        assert slowOut[-1] == "disconnected"
+        assert b.subscribers == []
+
+    def test_abandoned_subscriber(self):
+        numPackets = 20
+
+        async def consume(b, out):
+            async with b.subscribe(maxsize=2, overflow=OVERFLOW_BLOCK) as sub:
+                async for p in sub:
+                    out.append(int(p.packetId))
+                    if len(out) == 3:
+                        break
+
+        async def run():
+            b = DaliBroadcaster(FakeDataLink(numPackets))
+            out = []
+            task = asyncio.create_task(consume(b, out))
+            await asyncio.sleep(0)
+            # returns even though the subscriber stopped reading
+            await b.run()
+            await task
+            return b, out
+
+        b, out = asyncio.run(asyncio.wait_for(run(), 5))
+        assert b.packetCount == numPackets
+        assert out == [0, 1, 2]
+        assert b.subscribers == []
+
+    def test_bad_policy(self):
+        b = DaliBroadcaster(FakeDataLink(0))
+        with pytest.raises(ValueError):
+            b.subscribe(overflow="ignore")
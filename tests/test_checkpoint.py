@@ -0,0 +1,36 @@
+from simpledali import DaliPacket
+from simpledali.checkpoint import Checkpoint
+
+
+def makePacket(packetId):
+    return DaliPacket("PACKET", "FDSN:XX_ABC_00_H_H_Z/JSON", packetId, "100", "200", "300", 2, b"{}")
+
+
+class TestCheckpoint:
+    def test_save_load(self, tmp_path):
+        path = tmp_path / "d2j.state"
+        checkpoint = Checkpoint(path, everyPackets=2, everySeconds=1000)
+        assert checkpoint.load() is None
+        checkpoint.update(makePacket("5"))
+        assert not checkpoint.isDue()
+        checkpoint.update(makePacket("6"))
+        assert checkpoint.isDue()
+        checkpoint.save()
+        assert not checkpoint.isDue()
+        assert not (tmp_path / "d2j.state.tmp").exists()
+        state = Checkpoint(path).load()
+        assert state["packetId"] == "6"
+        assert state["packetTime"] == 100
+        assert state["dataStartTime"] == 200
+
+    def test_due_by_time(self, tmp_path):
+        checkpoint = Checkpoint(tmp_path / "d2j.state", everyPackets=0, everySeconds=10)
+        assert not checkpoint.isDue(now=checkpoint.lastSave + 11)
+        checkpoint.update(makePacket("1"))
+        assert not checkpoint.isDue(now=checkpoint.lastSave + 1)
+        assert checkpoint.isDue(now=checkpoint.lastSave + 11)
+
+    def test_unreadable(self, tmp_path):
+        path = tmp_path / "d2j.state"
+        path.write_text("{not json")
+        assert Checkpoint(path).load() is None
@@ -1,4 +1,5 @@
 import pytest
+from datetime import datetime, timezone
 
 # tomllib is std in python > 3.11 so do conditional import
 try:
@@ -7,7 +8,12 @@ except ModuleNotFoundError:
     import tomli as tomllib
 
 
-from simpledali import Dali2Jsonl
+import asyncio
+
+from simpledali import Dali2Jsonl, DaliPacket
+from simpledali.dali2jsonl import JsonlPipeline
+from simpledali.filecache import FlushPolicy
+from simpledali.util import datetimeToHPTime
 from simplemseed import FDSNSourceId
 
 
@@ -60,3 +66,58 @@ class TestDali2jsonl:
         h_sid = FDSNSourceId.parse("FDSN:CO_BIRD_00_H_H_Z")
         
         w_sid = FDSNSourceId.parse("FDSN:CO_BIRD_00_W_K_Z")
+        time = datetime(2024, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+        assert str(d2j.fileFromSidPattern(h_sid, time)) == "/tmp/jsonl/CO/BIRD/2024/034/CO.BIRD.00.HHZ.2024.034.04.jsonl"
+        assert str(d2j.fileFromSidPattern(w_sid, time)) == "/tmp/jsonl/CO/BIRD/2024/034/CO.BIRD.00.WKZ.2024.034.jsonl"
+        assert d2j.fillBaseSidPattern(h_sid) == "/tmp/jsonl/CO/BIRD/%Y/%j/CO.BIRD.00.HHZ.%Y.%j.%H.jsonl"
+        base = d2j.fillBaseSidPattern(h_sid)
+        assert d2j.fillTimePattern(base, time) == str(d2j.fileFromSidPattern(h_sid, time))
+
+    def test_rollover_drains(self, tmp_path):
+        pattern = str(tmp_path / "%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        d2j = Dali2Jsonl(".*", pattern, flushPolicy=FlushPolicy(flush_count=100, flush_age=100))
+        first = datetime(2024, 2, 3, 4, 59, 59, tzinfo=timezone.utc)
+        second = datetime(2024, 2, 3, 5, 0, 1, tzinfo=timezone.utc)
+        for t, data in [(first, b'{"a":1}'), (second, b'{"a":2}')]:
+            hptime = str(datetimeToHPTime(t))
+            daliPacket = DaliPacket(
+                "PACKET", "FDSN:CO_BIRD_00_H_H_Z/JSON", "1", hptime, hptime, hptime, len(data), data
+            )
+            d2j.saveToJSONL(daliPacket)
+        # earlier hour file closed, and so written, when next hour started
+        assert (tmp_path / "CO.BIRD.00.HHZ.2024.034.04.jsonl").read_text() == '{"a":1}\n'
+        assert (tmp_path / "CO.BIRD.00.HHZ.2024.034.05.jsonl").read_text() == ""
+        d2j.fileCache.closeAll()
+        assert (tmp_path / "CO.BIRD.00.HHZ.2024.034.05.jsonl").read_text() == '{"a":2}\n'
+
+    def test_pipeline_rollover(self, tmp_path):
+        pattern = str(tmp_path / "%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        d2j = Dali2Jsonl(".*", pattern, flushPolicy=FlushPolicy(flush_count=100, flush_age=100))
+
+        async def go():
+            pipeline = JsonlPipeline(d2j, workers=4)
+            openFiles = []
+            for hour in range(2, 6):
+                t = datetime(2024, 2, 3, hour, 30, tzinfo=timezone.utc)
+                hptime = str(datetimeToHPTime(t))
+                data = f'{{"h":{hour}}}'.encode()
+                await pipeline.put(DaliPacket(
+                    "PACKET", "FDSN:CO_BIRD_00_H_H_Z/JSON", "1", hptime, hptime, hptime, len(data), data
+                ))
+                await pipeline.flush()
+                openFiles.append([p for lane in pipeline.lanes for p in lane.fileCache.handles])
+            await pipeline.close()
+            return openFiles
+
+        openFiles = asyncio.run(go())
+        # previous hour closed on rollover, even with several lanes
+        assert [len(files) for files in openFiles] == [1, 1, 1, 1]
+        for hour in range(2, 6):
+            f = tmp_path / f"CO.BIRD.00.HHZ.2024.034.{hour:02d}.jsonl"
+            assert f.read_text() == f'{{"h":{hour}}}\n'
+
+    def test_gzip_suffix(self, tmp_path):
+        d2j = Dali2Jsonl(".*", str(tmp_path / "%n.%s.%l.%c.%Y.%j.%H.jsonl"), compression="gzip")
+        sid = FDSNSourceId.parse("FDSN:CO_BIRD_00_H_H_Z")
+        time = datetime(2024, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+        assert d2j.fileFromSidPattern(sid, time).name == "CO.BIRD.00.HHZ.2024.034.04.jsonl.gz"
@@ -0,0 +1,57 @@
+import asyncio
+
+from simplemseed import MSeed3Header, MSeed3Record, FDSNSourceId
+from simplemseed import readMSeed3Records
+
+from simpledali import DaliServer, Dali2MSeed, SocketDataLink, DLPROTO_1_0
+from simpledali.util import utcnowWithTz
+
+
+def makeRecord(sid, start, values):
+    header = MSeed3Header()
+    header.starttime = start
+    header.sampleRatePeriod = 100
+    return MSeed3Record(header, FDSNSourceId.parse(sid), values)
+
+
+class TestDali2MSeed:
+    def test_config(self):
+        conf = {
+            "datalink": {"match": ".*/MSEED3"},
+            "mseed": {"write": "/tmp/mseed/%n.%s.%l.%c.%Y.%j.%H.ms3"},
+        }
+        d2m = Dali2MSeed.from_config(conf)
+        assert conf["datalink"]["programname"] == "dali2mseed"
+        assert d2m.fileCache.binary
+
+    def test_archive(self, tmp_path):
+        pattern = str(tmp_path / "%n/%s/%n.%s.%l.%c.%Y.%j.%H.ms3")
+        start = utcnowWithTz().replace(minute=0, second=0, microsecond=0)
+        records = [makeRecord("FDSN:XX_ABC_00_H_H_Z", start, list(range(i, i + 10))) for i in range(5)]
+        other = makeRecord("FDSN:XX_DEF_00_H_H_Z", start, [1, 2, 3])
+
+        async def go():
+            async with DaliServer() as server:
+                d2m = Dali2MSeed(".*/MSEED3", pattern, host=server.host, port=server.port)
+                d2m.do_earliest = True
+                async with SocketDataLink(server.host, server.port) as dali:
+                    for ms3 in records:
+                        await dali.writeMSeed3(ms3)
+                    await dali.writeJSON("FDSN:XX_ABC_00_H_H_Z/JSON", 0, 0, {"skip": True})
+                async with SocketDataLink(server.host, server.port, dlproto=DLPROTO_1_0) as dali:
+                    # stream id without FDSN:
+                    await dali.writeMSeed3(other)
+                task = asyncio.create_task(d2m.run())
+                await asyncio.sleep(0.2)
+                task.cancel()
+                await task
+
+        asyncio.run(go())
+        yjh = start.strftime("%Y.%j.%H")
+        outfile = tmp_path / f"XX/ABC/XX.ABC.00.HHZ.{yjh}.ms3"
+        assert outfile.read_bytes() == b"".join(ms3.pack() for ms3 in records)
+        with open(outfile, "rb") as f:
+            assert [ms3.decompress().tolist() for ms3 in readMSeed3Records(f)] == [
+                list(range(i, i + 10)) for i in range(5)
+            ]
+        assert (tmp_path / f"XX/DEF/XX.DEF.00.HHZ.{yjh}.ms3").read_bytes() == other.pack()
@@ -0,0 +1,88 @@
+import pytest
+
+from simpledali import DaliPacket, hptimeToDatetime, parseStreamId, streamIdCacheInfo
+from simpledali.dalipacket import nslcStreamId, clearStreamIdCache
+
+
+def makePacket(streamId="FDSN:CO_BIRD_00_H_H_Z/JSON"):
+    return DaliPacket(
+        "PACKET",
+        streamId,
+        "1234",
+        "1700000002000000",
+        "1700000000000000",
+        "1700000001500000",
+        2,
+        b"{}",
+    )
+
+
+class TestDaliPacket:
+    def test_hptimes(self):
+        p = makePacket()
+        assert p.packetHPTime == 1700000002000000
+        assert p.dataStartHPTime == 1700000000000000
+        assert p.dataEndHPTime == 1700000001500000
+        assert hptimeToDatetime(p.dataStartHPTime) == hptimeToDatetime(p.dataStartTime)
+        p.dataStartTime = "1700000000500000"
+        assert p.dataStartHPTime == 1700000000500000
+
+    def test_streamid_parts(self):
+        p = makePacket()
+        assert p.streamIdChannel() == "FDSN:CO_BIRD_00_H_H_Z"
+        assert p.streamIdType() == "JSON"
+        sid = p.sourceId()
+        assert sid.networkCode == "CO"
+        assert sid.stationCode == "BIRD"
+        assert sid is p.sourceId()
+        p.streamId = "CO_JSC_00_HHZ/MSEED"
+        assert p.streamIdType() == "MSEED"
+        assert p.sourceId().stationCode == "JSC"
+        assert p.sourceId().shortChannelCode() == "HHZ"
+
+    def test_unparseable(self):
+        p = makePacket("notasourceid")
+        assert p.streamIdType() == ""
+        assert p.sourceId() is None
+
+    def test_slots(self):
+        p = makePacket()
+        with pytest.raises(AttributeError):
+            p.other = 1
+
+    def test_sourceId_trimmed_fdsn(self):
+        daliPacket = makePacket("XX_ABC_00_H_H_Z/MSEED3")
+        assert str(daliPacket.sourceId()) == "FDSN:XX_ABC_00_H_H_Z"
+
+
+class TestStreamIdCache:
+    def test_shared(self):
+        clearStreamIdCache()
+        a = makePacket("FDSN:XX_CACHE_00_H_H_Z/JSON")
+        b = makePacket("FDSN:XX_CACHE_00_H_H_Z/JSON")
+        assert a.sourceId() is b.sourceId()
+        info = streamIdCacheInfo()["parse"]
+        assert info["misses"] == 1
+        assert info["hits"] == 1
+        assert info["hitRate"] == 0.5
+
+    def test_parse(self):
+        parsed = parseStreamId("CO_JSC_00_HHZ/MSEED")
+        assert parsed.channel == "CO_JSC_00_HHZ"
+        assert parsed.type == "MSEED"
+        assert parsed.sourceId.stationCode == "JSC"
+
+    def test_bad_source_id(self):
+        for streamId in [
+            "FDSN:XX_ABC_00_HHZ/JSON", "XX_ABC_00_H/JSON", "FDSN:XX_ABC_00_H_H_Z_Q/JSON"
+        ]:
+            daliPacket = makePacket(streamId)
+            assert daliPacket.streamIdType() == "JSON"
+            assert daliPacket.streamIdChannel() == streamId[:-5]
+            assert daliPacket.sourceId() is None
+            # failure is cached too
+            assert parseStreamId(streamId).sourceId is None
+
+    def test_nslc(self):
+        assert nslcStreamId("CO", "JSC", "00", "HHZ", "MSEED", True) == "CO_JSC_00_HHZ/MSEED"
+        assert nslcStreamId("CO", "JSC", "00", "HHZ", "MSEED") == "FDSN:CO_JSC_00_H_H_Z/MSEED"
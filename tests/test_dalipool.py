@@ -0,0 +1,86 @@
+import asyncio
+
+from simpledali import DaliServer, DataLinkPool
+
+
+def frame(header, data=b""):
+    h = header.encode("utf-8")
+    return b"DL" + len(h).to_bytes(1, "big") + h + data
+
+
+class TestDataLinkPool:
+    def test_concurrent_writers(self):
+        numTasks = 20
+        poolSize = 3
+        connections = []
+        idCommands = []
+        writes = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            try:
+                while True:
+                    pre = await reader.readexactly(3)
+                    header = (await reader.readexactly(pre[2])).decode("utf-8")
+                    s = header.split(" ")
+                    if s[0] == "ID":
+                        idCommands.append(header)
+                        writer.write(frame("ID DataLink test :: DLPROTO:1.0 PACKETSIZE:512 WRITE"))
+                    elif s[0] == "WRITE":
+                        data = await reader.readexactly(int(s[5]))
+                        writes.append(data)
+                        # slow ack so tasks overlap
+                        await asyncio.sleep(0.01)
+                        writer.write(frame(f"OK {len(writes)} 0"))
+                    await writer.drain()
+            except asyncio.IncompleteReadError:
+                writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with DataLinkPool.forSocket("127.0.0.1", port, size=poolSize) as pool:
+                results = await asyncio.gather(
+                    *[
+                        pool.writeJSON("XX_A_00_HHZ/JSON", 0, 0, {"i": i})
+                        for i in range(numTasks)
+                    ]
+                )
+                assert len(pool.connections) == poolSize
+                # a dropped connection is reconnected on next lease
+                leased = [await pool.acquire() for i in range(poolSize)]
+                for dali in leased:
+                    await dali.close()
+                    pool.release(dali)
+                async with pool.connection() as dali:
+                    assert not dali.isClosed()
+            server.close()
+            return results
+
+        results = asyncio.run(asyncio.wait_for(run(), 5))
+        assert len(results) == numTasks
+        assert all(r.type == "OK" for r in results)
+        assert len(writes) == numTasks
+        assert len(connections) == poolSize + 1
+        assert len(idCommands) == poolSize + 1
+
+    def test_dali_args_and_nowait(self):
+        async def run():
+            async with DaliServer() as server:
+                async with DataLinkPool.forSocket(
+                    server.host, server.port, size=2, username="writer", buffered=True, ack_window=4
+                ) as pool:
+                    futures = [
+                        await pool.writeJSON("XX_A_00_HHZ/JSON", i, i + 1, {"i": i}, wait=False)
+                        for i in range(10)
+                    ]
+                    results = await asyncio.gather(*futures)
+                    dali = pool.connections[0]
+                    assert dali.buffered
+                    assert dali.ack_window == 4
+                    assert pool.username == "writer"
+                return results, server.ring.rxPackets
+
+        results, numPackets = asyncio.run(asyncio.wait_for(run(), 5))
+        assert [r.type for r in results] == ["OK"] * 10
+        assert numPackets == 10
@@ -0,0 +1,202 @@
+import asyncio
+from contextlib import aclosing
+import json
+
+import pytest
+
+from simpledali import (
+    DaliServer,
+    Dali2Jsonl,
+    DaliException,
+    MemoryRing,
+    SocketDataLink,
+    WebSocketDataLink,
+)
+from simpledali.checkpoint import Checkpoint
+from simpledali.daliserver import DaliSession
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def writeAndStream(dali, numPackets):
+    serverId = await dali.id("test", "user", 0, "python")
+    assert "PACKETSIZE:512" in serverId.message
+    assert dali.packet_size == 512
+    for i in range(numPackets):
+        r = await dali.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i}, pktid=100 + i)
+        assert r.type == "OK"
+        # ring packet id, not the pktid sent
+        assert r.value == str(i + 1)
+    await dali.writeJSON("XX_ABC_00_LHZ/JSON", 0, 1, {"skip": True})
+    await dali.match("_HHZ/JSON$")
+    r = await dali.positionEarliest()
+    assert r.value == "1"
+    out = []
+    async with aclosing(dali.stream()) as packets:
+        async for daliPacket in packets:
+            out.append(json.loads(bytes(daliPacket.data)))
+            if len(out) == numPackets:
+                break
+    return out
+
+
+class TestDaliServer:
+    @pytest.mark.parametrize("buffered", [False, True])
+    def test_socket(self, buffered):
+        async def go():
+            async with DaliServer() as server:
+                async with SocketDataLink(server.host, server.port, buffered=buffered) as dali:
+                    out = await writeAndStream(dali, 20)
+                    # connection still usable after ENDSTREAM
+                    info = await dali.parsedInfoStreams()
+                    return out, info
+
+        out, info = run(go())
+        assert out == [{"i": i} for i in range(20)]
+        assert info["StreamList"]["TotalStreams"] == 2
+        assert info["StreamList"]["SelectedStreams"] == 1
+        assert info["StreamList"]["Stream"][0]["Name"] == "XX_ABC_00_HHZ/JSON"
+
+    def test_websocket(self):
+        async def go():
+            async with DaliServer(websocket=True) as server:
+                async with WebSocketDataLink(server.websocketurl) as dali:
+                    out = await writeAndStream(dali, 5)
+                    status = await dali.parsedInfoStatus()
+                    return out, status
+
+        out, status = run(go())
+        assert out == [{"i": i} for i in range(5)]
+        assert status["Status"]["LatestPacketID"] == 6
+
+    def test_read_and_bounded_ring(self):
+        async def go():
+            async with DaliServer(ring=MemoryRing(maxPackets=5)) as server:
+                async with SocketDataLink(server.host, server.port) as dali:
+                    for i in range(10):
+                        await dali.writeAck("XX_A_00_HHZ/RAW", i, i, f"{i}".encode("utf-8"))
+                    first = await dali.readEarliest()
+                    with pytest.raises(DaliException):
+                        await dali.read(1)
+                    return first
+
+        first = run(go())
+        assert first.packetId == "6"
+        assert first.data == b"5"
+
+    def test_empty_write(self):
+        async def go():
+            async with DaliServer() as server:
+                async with SocketDataLink(server.host, server.port) as dali:
+                    r = await dali.writeAck("XX_A_00_HHZ/RAW", 0, 0, b"")
+                    daliPacket = await dali.readEarliest()
+                    return r, daliPacket
+
+        r, daliPacket = run(go())
+        assert r.type == "OK"
+        assert r.value == "1"
+        assert daliPacket.data == b""
+
+    def test_dali2jsonl(self, tmp_path):
+        pattern = str(tmp_path / "%n/%s/%n.%s.%l.%c.%Y.%j.%H.jsonl")
+
+        async def go():
+            async with DaliServer() as server:
+                d2j = Dali2Jsonl(".*/JSON", pattern, host=server.host, port=server.port)
+                d2j.do_earliest = True
+                async with SocketDataLink(server.host, server.port) as dali:
+                    for i in range(10):
+                        await dali.writeJSON("FDSN:XX_ABC_00_H_H_Z/JSON", 0, 0, {"i": i})
+                task = asyncio.create_task(d2j.run())
+                await asyncio.sleep(0.2)
+                task.cancel()
+                await task
+
+        run(go())
+        outfile = tmp_path / "XX/ABC/XX.ABC.00.HHZ.1970.001.00.jsonl"
+        lines = outfile.read_text().splitlines()
+        assert [json.loads(l) for l in lines] == [{"i": i} for i in range(10)]
+
+    @pytest.mark.parametrize("pipeline", [False, True])
+    def test_dali2jsonl_checkpoint(self, tmp_path, pipeline):
+        pattern = str(tmp_path / "%n/%s/%n.%s.%l.%c.%Y.%j.%H.jsonl")
+
+        async def archive(server, first, last):
+            d2j = Dali2Jsonl(".*/JSON", pattern, host=server.host, port=server.port)
+            d2j.do_earliest = True
+            d2j.do_pipeline = pipeline
+            d2j.checkpoint = Checkpoint(tmp_path / "d2j.state", everyPackets=3)
+            async with SocketDataLink(server.host, server.port) as dali:
+                for i in range(first, last):
+                    await dali.writeJSON("FDSN:XX_ABC_00_H_H_Z/JSON", 0, 0, {"i": i})
+            task = asyncio.create_task(d2j.run())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+
+        async def go():
+            async with DaliServer() as server:
+                await archive(server, 0, 10)
+                # restart continues after checkpoint, not from earliest
+                await archive(server, 10, 15)
+
+        run(go())
+        outfile = tmp_path / "XX/ABC/XX.ABC.00.HHZ.1970.001.00.jsonl"
+        lines = outfile.read_text().splitlines()
+        assert [json.loads(l) for l in lines] == [{"i": i} for i in range(15)]
+
+    def test_dali2jsonl_pipeline(self, tmp_path):
+        pattern = str(tmp_path / "%n/%s/%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        stations = ["ABC", "DEF", "GHI"]
+
+        async def go():
+            async with DaliServer() as server:
+                d2j = Dali2Jsonl(".*/(BZ)?JSON", pattern, host=server.host, port=server.port)
+                d2j.do_earliest = True
+                d2j.do_pipeline = True
+                d2j.pipelineWorkers = 2
+                d2j.pipelineQueueSize = 2
+                async with SocketDataLink(server.host, server.port) as dali:
+                    for i in range(30):
+                        sta = stations[i % 3]
+                        if i % 2 == 0:
+                            await dali.writeJSON(f"FDSN:XX_{sta}_00_H_H_Z/JSON", 0, 0, {"i": i})
+                        else:
+                            await dali.writeBZ2JSON(f"FDSN:XX_{sta}_00_H_H_Z/BZJSON", 0, 0, {"i": i})
+                task = asyncio.create_task(d2j.run())
+                await asyncio.sleep(0.3)
+                task.cancel()
+                await task
+
+        run(go())
+        for n, sta in enumerate(stations):
+            outfile = tmp_path / f"XX/{sta}/XX.{sta}.00.HHZ.1970.001.00.jsonl"
+            lines = outfile.read_text().splitlines()
+            assert [json.loads(l) for l in lines] == [{"i": i} for i in range(n, 30, 3)]
+
+    def test_endstream_timeout(self, monkeypatch):
+        handle = DaliSession.handle
+
+        async def ignoreEndStream(self, header, data):
+            # server that keeps streaming, never confirms ENDSTREAM
+            if header != "ENDSTREAM":
+                await handle(self, header, data)
+
+        monkeypatch.setattr(DaliSession, "handle", ignoreEndStream)
+
+        async def go():
+            async with DaliServer() as server:
+                async with SocketDataLink(server.host, server.port) as dali:
+                    dali.endstream_timeout = 0.2
+                    await dali.id("test", "user", 0, "python")
+                    for i in range(5):
+                        await dali.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i})
+                    await dali.positionEarliest()
+                    async with aclosing(dali.stream()) as packets:
+                        async for daliPacket in packets:
+                            break
+                    return dali.isClosed(), dali.isStreamMode()
+
+        assert run(go()) == (True, False)
@@ -0,0 +1,166 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from simpledali.filecache import (
+    FileHandleCache,
+    FlushPolicy,
+    BufferedAppendFile,
+    DURABILITY_FSYNC,
+    COMPRESSION_GZIP,
+    COMPRESSION_ZSTD,
+)
+
+
+class TestFileHandleCache:
+    def test_lru_eviction(self, tmp_path):
+        cache = FileHandleCache(maxOpen=2)
+        paths = [tmp_path / "a" / f"{i}.jsonl" for i in range(3)]
+        first = cache.get(paths[0])
+        assert cache.get(paths[0]) is first
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        # 1 was least recently used
+        assert len(cache) == 2
+        assert paths[1] not in cache.handles
+        assert not first.closed
+        assert cache.createdDirs == {tmp_path / "a"}
+        cache.closeAll()
+        assert first.closed
+        assert len(cache) == 0
+
+    def test_idle_eviction(self, tmp_path):
+        cache = FileHandleCache(maxIdle=10)
+        out = cache.get(tmp_path / "x.jsonl")
+        cache.evict(now=cache.handles[tmp_path / "x.jsonl"][1] + 11)
+        assert out.closed
+        assert len(cache) == 0
+
+    def test_idle_eviction_on_flush(self, tmp_path):
+        cache = FileHandleCache(maxIdle=10, flushPolicy=FlushPolicy(flush_age=1.0))
+        out = cache.get(tmp_path / "x.jsonl")
+        out.write("1\n")
+        cache.flushExpired(now=cache.handles[tmp_path / "x.jsonl"][1] + 11)
+        assert out.closed
+        assert len(cache) == 0
+        assert (tmp_path / "x.jsonl").read_text() == "1\n"
+
+    def test_recreate_removed_dir(self, tmp_path):
+        cache = FileHandleCache()
+        path = tmp_path / "sub" / "x.jsonl"
+        cache.get(path).write("one\n")
+        cache.closeAll()
+        shutil.rmtree(tmp_path / "sub")
+        cache.get(path).write("two\n")
+        cache.closeAll()
+        assert path.read_text() == "two\n"
+
+
+class TestBufferedWrites:
+    def test_flush_on_count(self, tmp_path):
+        cache = FileHandleCache(flushPolicy=FlushPolicy(flush_count=3, flush_age=100))
+        path = tmp_path / "x.jsonl"
+        out = cache.get(path)
+        out.write("1\n")
+        out.write("2\n")
+        assert path.read_text() == ""
+        out.write("3\n")
+        assert path.read_text() == "1\n2\n3\n"
+        out.write("4\n")
+        cache.closeAll()
+        assert path.read_text() == "1\n2\n3\n4\n"
+
+    def test_flush_on_bytes(self, tmp_path):
+        cache = FileHandleCache(flushPolicy=FlushPolicy(flush_bytes=5, flush_count=0, flush_age=100))
+        path = tmp_path / "x.jsonl"
+        out = cache.get(path)
+        out.write("ab\n")
+        assert path.read_text() == ""
+        out.write("cd\n")
+        assert path.read_text() == "ab\ncd\n"
+        cache.closeAll()
+
+    def test_flush_on_age(self, tmp_path):
+        cache = FileHandleCache(flushPolicy=FlushPolicy(flush_age=1.0))
+        path = tmp_path / "x.jsonl"
+        out = cache.get(path)
+        start = cache._lastFlushCheck + 10
+        out.write("1\n", now=start)
+        cache.flushExpired(now=start + 0.5)
+        assert path.read_text() == ""
+        cache.flushExpired(now=start + 1.5)
+        assert path.read_text() == "1\n"
+        cache.closeAll()
+
+    def test_no_age_limit(self, tmp_path):
+        cache = FileHandleCache(flushPolicy=FlushPolicy(flush_count=3, flush_age=0))
+        path = tmp_path / "x.jsonl"
+        out = cache.get(path)
+        start = cache._lastFlushCheck + 10
+        out.write("1\n", now=start)
+        out.write("2\n", now=start)
+        assert not out.isExpired(start + 100)
+        cache.flushExpired(now=start + 100)
+        assert path.read_text() == ""
+        out.write("3\n", now=start)
+        assert path.read_text() == "1\n2\n3\n"
+        cache.closeAll()
+
+    def test_fsync_interval(self, tmp_path, monkeypatch):
+        synced = []
+        monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+        policy = FlushPolicy(flush_count=1, durability=DURABILITY_FSYNC, fsync_interval=10)
+        out = BufferedAppendFile(tmp_path / "x.jsonl", policy)
+        out.write("1\n", now=out.lastSync + 1)
+        assert len(synced) == 0
+        out.write("2\n", now=out.lastSync + 11)
+        assert len(synced) == 1
+        out.close()
+        assert len(synced) == 2
+
+    def test_sync_to_disk(self, tmp_path, monkeypatch):
+        synced = []
+        monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+        cache = FileHandleCache(flushPolicy=FlushPolicy(flush_count=100, durability="flush"))
+        cache.get(tmp_path / "x.jsonl").write("1\n")
+        cache.flushAll(sync=True)
+        assert len(synced) == 0
+        cache.syncToDisk = True
+        cache.flushAll(sync=True)
+        assert len(synced) == 1
+        assert (tmp_path / "x.jsonl").read_text() == "1\n"
+        cache.closeAll()
+        assert len(synced) == 2
+
+    def test_bad_durability(self):
+        with pytest.raises(ValueError):
+            FlushPolicy(durability="sometimes")
+
+
+class TestCompressed:
+    def test_gzip_reopen(self, tmp_path):
+        cache = FileHandleCache(compression=COMPRESSION_GZIP)
+        path = tmp_path / "x.jsonl.gz"
+        cache.get(path).write("one\n")
+        cache.closeAll()
+        cache.get(path).write("two\n")
+        cache.closeAll()
+        # second open appends a new gzip member
+        with gzip.open(path, "rt") as f:
+            assert f.read() == "one\ntwo\n"
+
+    def test_zstd(self, tmp_path):
+        zstandard = pytest.importorskip("zstandard")
+        cache = FileHandleCache(compression=COMPRESSION_ZSTD)
+        path = tmp_path / "x.jsonl.zst"
+        cache.get(path).write("one\n")
+        cache.closeAll()
+        with zstandard.open(path, "rt") as f:
+            assert f.read() == "one\n"
+
+    def test_bad_compression(self):
+        with pytest.raises(ValueError):
+            FileHandleCache(compression="lzw")
@@ -0,0 +1,122 @@
+import asyncio
+from contextlib import aclosing
+import json
+import zlib
+
+import pytest
+
+from simpledali import (
+    Dali2Jsonl,
+    DaliPacket,
+    DaliServer,
+    SocketDataLink,
+    JsonCodec,
+    ZstdJsonCodec,
+    registerJsonCodec,
+    jsonCodec,
+    BZ2_JSON_TYPE,
+    ZSTD_JSON_TYPE,
+    LZ4_JSON_TYPE,
+)
+from simpledali.jsoncodec import JSON_CODECS, checkJsonCodec
+
+MESSAGE = {"station": "ABC", "values": [i * 0.5 for i in range(20)]}
+
+
+class ZlibJsonCodec(JsonCodec):
+    def __init__(self):
+        super().__init__("ZJSON")
+
+    def compress(self, data):
+        return zlib.compress(data)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+@pytest.fixture
+def zlibCodec():
+    codec = ZlibJsonCodec()
+    registerJsonCodec(codec)
+    yield codec
+    del JSON_CODECS[codec.packetType]
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def writeAndRead(streamid, packetType):
+    async with DaliServer() as server:
+        async with SocketDataLink(server.host, server.port) as dali:
+            await dali.id("test", "user", 0, "python")
+            r = await dali.writeCompressedJSON(streamid, 0, 0, MESSAGE, packetType)
+            assert r.type == "OK"
+            await dali.positionEarliest()
+            async with aclosing(dali.stream()) as packets:
+                async for daliPacket in packets:
+                    return daliPacket
+
+
+def roundTrip(packetType):
+    codec = checkJsonCodec(packetType)
+    data = json.dumps(MESSAGE).encode("utf-8")
+    assert codec.decompress(codec.compress(data)) == data
+
+
+class TestJsonCodec:
+    def test_bz2(self):
+        roundTrip(BZ2_JSON_TYPE)
+
+    def test_unknown(self):
+        assert jsonCodec("JSON") is None
+        with pytest.raises(ValueError):
+            checkJsonCodec("NOPE")
+
+    def test_abstract(self):
+        class NoDecompress(JsonCodec):
+            def compress(self, data):
+                return data
+
+        with pytest.raises(TypeError):
+            NoDecompress("XJSON")
+
+    def test_zstd(self):
+        pytest.importorskip("zstandard")
+        roundTrip(ZSTD_JSON_TYPE)
+
+    def test_zstd_dictionary(self):
+        pytest.importorskip("zstandard")
+        from simpledali import trainZstdDictionary
+
+        samples = [{"station": f"S{i:03d}", "values": [i, i * 2, i * 3]} for i in range(500)]
+        codec = ZstdJsonCodec(dictionary=trainZstdDictionary(samples, 2048))
+        data = json.dumps(samples[7]).encode("utf-8")
+        compressed = codec.compress(data)
+        assert len(compressed) < len(ZstdJsonCodec().compress(data))
+        assert codec.decompress(compressed) == data
+
+    def test_lz4(self):
+        pytest.importorskip("lz4")
+        roundTrip(LZ4_JSON_TYPE)
+
+    def test_write_and_archive(self, zlibCodec, tmp_path):
+        daliPacket = run(writeAndRead("FDSN:XX_ABC_00_H_H_Z/ZJSON", "ZJSON"))
+        assert daliPacket.streamIdType() == "ZJSON"
+        assert json.loads(zlib.decompress(daliPacket.data)) == MESSAGE
+        pattern = str(tmp_path / "%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        d2j = Dali2Jsonl(".*", pattern)
+        assert d2j.isArchived("ZJSON")
+        d2j.handlePacket(daliPacket)
+        d2j.fileCache.closeAll()
+        lines = (tmp_path / "XX.ABC.00.HHZ.1970.001.00.jsonl").read_text().splitlines()
+        assert [json.loads(l) for l in lines] == [MESSAGE]
+
+    def test_not_installed_skipped(self, tmp_path):
+        codec = jsonCodec(LZ4_JSON_TYPE)
+        if codec.isAvailable():
+            pytest.skip("lz4 is installed")
+        d2j = Dali2Jsonl(".*", str(tmp_path / "%n.%s.jsonl"))
+        assert not d2j.isArchived(LZ4_JSON_TYPE)
+        with pytest.raises(ValueError):
+            checkJsonCodec(LZ4_JSON_TYPE)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+import json
+
+import pytest
+
+from simpledali import encodeJSON, dumpJSON, jsonBackend, setJsonBackend
+
+WHEN = datetime(2024, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+
+MESSAGE = {
+    "utc": WHEN,
+    "micros": WHEN.replace(microsecond=123),
+    "naive": WHEN.replace(tzinfo=None),
+    "offset": WHEN.astimezone(timezone(timedelta(hours=5))),
+    "values": [1, 2.5, "abc", None, True],
+}
+
+
+@pytest.fixture(params=["json", "orjson"])
+def backend(request):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    previous = setJsonBackend(request.param)
+    yield request.param
+    setJsonBackend(previous)
+
+
+class TestJsonEncoder:
+    def test_datetimes(self, backend):
+        assert jsonBackend() == backend
+        out = json.loads(encodeJSON(MESSAGE))
+        assert out == {
+            "utc": "2024-02-03T04:05:06Z",
+            "micros": "2024-02-03T04:05:06.000123Z",
+            "naive": "2024-02-03T04:05:06",
+            "offset": "2024-02-03T09:05:06+05:00",
+            "values": [1, 2.5, "abc", None, True],
+        }
+
+    def test_fallback(self, backend):
+        # too large for orjson, so falls back to json
+        assert json.loads(encodeJSON({"big": 2**70})) == {"big": 2**70}
+
+    def test_same_bytes(self, backend):
+        message = {"utc": WHEN, "name": "Zürich", "values": [1, 2.5, None, True]}
+        assert encodeJSON(message) == (
+            '{"utc":"2024-02-03T04:05:06Z","name":"Zürich","values":[1,2.5,null,true]}'
+        ).encode("UTF-8")
+
+    def test_non_finite(self, backend):
+        # NaN and Infinity like the json module, whatever the backend
+        message = {"a": [1.5, float("nan")], "b": float("inf"), "c": None}
+        assert encodeJSON(message) == b'{"a":[1.5,NaN],"b":Infinity,"c":null}'
+
+    def test_dump(self, backend):
+        s = dumpJSON({"b": WHEN, "a": 1}, indent=True, sort_keys=True)
+        assert s == '{\n  "a": 1,\n  "b": "2024-02-03T04:05:06Z"\n}'
+        assert dumpJSON({"b": WHEN, "a": 1}) == '{"b":"2024-02-03T04:05:06Z","a":1}'
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            setJsonBackend("simdjson")
@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from simpledali import (
+    DaliServer,
+    SocketDataLink,
+    QueuedWriter,
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_DROP_NEWEST,
+)
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+async def writeAndRead(num, numDalis=1, **kwargs):
+    async with DaliServer() as server:
+        dalis = []
+        for i in range(numDalis):
+            dali = SocketDataLink(server.host, server.port)
+            await dali.createDaliConnection()
+            await dali.id("test", "user", 0, "python")
+            dalis.append(dali)
+        async with QueuedWriter(dalis, **kwargs) as writer:
+            for i in range(num):
+                await writer.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i})
+        for dali in dalis:
+            await dali.close()
+        async with SocketDataLink(server.host, server.port) as dali:
+            await dali.positionEarliest()
+            out = []
+            if writer.written > 0:
+                async with aclosing(dali.stream()) as packets:
+                    async for daliPacket in packets:
+                        out.append(daliPacket.dataStartHPTime)
+                        if len(out) == writer.written:
+                            break
+    return writer, out
+
+
+class TestQueuedWriter:
+    def test_block(self):
+        writer, out = run(writeAndRead(50, maxPackets=5, overflow=OVERFLOW_BLOCK))
+        assert writer.written == 50
+        assert writer.dropped == 0
+        assert writer.errors == 0
+        assert writer.maxDepth == 5
+        assert out == list(range(50))
+        assert writer.stats()["depth"] == 0
+
+    def test_drop_newest(self):
+        # puts do not yield while there is no room, so the queue fills
+        writer, out = run(writeAndRead(20, maxPackets=5, overflow=OVERFLOW_DROP_NEWEST))
+        assert writer.dropped == 15
+        assert writer.written == 5
+        assert out == list(range(5))
+
+    def test_drop_oldest(self):
+        writer, out = run(writeAndRead(20, maxPackets=5, overflow=OVERFLOW_DROP_OLDEST))
+        assert writer.dropped == 15
+        assert out == list(range(15, 20))
+
+    def test_max_bytes(self):
+        writer, out = run(
+            writeAndRead(20, maxPackets=100, maxBytes=40, overflow=OVERFLOW_DROP_NEWEST)
+        )
+        assert writer.maxDepth < 20
+        assert writer.dropped == 20 - writer.written
+        assert out == list(range(writer.written))
+
+    def test_several_connections(self):
+        writer, out = run(writeAndRead(40, numDalis=3, maxPackets=4))
+        assert writer.written == 40
+        assert sorted(out) == list(range(40))
+
+    def test_bad_overflow(self):
+        with pytest.raises(ValueError):
+            QueuedWriter(None, overflow="disconnect")
+
+    def test_closed_connection(self):
+        async def doit():
+            async with DaliServer() as server:
+                dali = SocketDataLink(server.host, server.port)
+                await dali.createDaliConnection()
+                await dali.id("test", "user", 0, "python")
+                await dali.close()
+                writer = QueuedWriter(dali, maxPackets=2)
+                with pytest.raises(Exception):
+                    for i in range(10):
+                        await writer.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i})
+                        await asyncio.sleep(0.01)
+                    await writer.close()
+        run(doit())
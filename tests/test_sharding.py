@@ -0,0 +1,90 @@
+import asyncio
+import json
+import re
+import threading
+
+import pytest
+
+from simpledali import DaliServer, SocketDataLink
+from simpledali.sharding import shardMatches, shardConfigs, ShardSupervisor
+
+STREAM_IDS = [
+    "FDSN:CO_BIRD_00_H_H_Z/JSON",
+    "FDSN:CO_JSC_00_H_H_Z/JSON",
+    "FDSN:N4_Z54A_00_H_H_Z/JSON",
+    "FDSN:XX_1ABC_00_H_H_Z/JSON",
+    "FDSN:XX_abc_00_H_H_Z/JSON",
+    "FDSN:XX_#ABC_00_H_H_Z/JSON",
+    "CO_BIRD_00_HHZ/JSON",
+    "FDSN:CO_BIRD_00_H_H_Z/MSEED",
+]
+
+
+def makeConf(tmp_path, match=".*/JSON"):
+    return {
+        "datalink": {"match": match},
+        "jsonl": {"write": str(tmp_path / "%n/%s/%n.%s.%l.%c.%Y.%j.%H.jsonl")},
+    }
+
+
+class TestShardMatches:
+    @pytest.mark.parametrize("match", [".*/JSON", "/JSON$", "^FDSN:CO_.*", "_H_H_Z/"])
+    @pytest.mark.parametrize("shardBy", ["network", "station"])
+    def test_disjoint(self, match, shardBy):
+        shards = [re.compile(p) for p in shardMatches(match, 4, shardBy)]
+        for sid in STREAM_IDS:
+            hits = [s for s in shards if s.search(sid)]
+            # each stream id the original matches is in exactly one shard
+            assert len(hits) == (1 if re.search(match, sid) else 0), sid
+
+    def test_one_shard(self):
+        assert shardMatches(".*/JSON", 1) == [".*/JSON"]
+
+    def test_configs(self, tmp_path):
+        conf = makeConf(tmp_path)
+        conf["jsonl"]["checkpoint"] = "d2j.state"
+        confs = shardConfigs(conf, 3)
+        assert len(confs) == 3
+        assert confs[2]["jsonl"]["checkpoint"] == "d2j.state.2"
+        assert conf["datalink"]["match"] == ".*/JSON"
+
+    def test_pattern_needs_station(self, tmp_path):
+        conf = makeConf(tmp_path)
+        conf["jsonl"]["write"] = str(tmp_path / "%n.%Y.jsonl")
+        with pytest.raises(ValueError):
+            shardConfigs(conf, 2)
+
+
+class TestShardSupervisor:
+    def test_run(self, tmp_path):
+        stations = ["ABC", "BCD", "CDE", "DEF"]
+        loop = asyncio.new_event_loop()
+        server = DaliServer()
+        loop.run_until_complete(server.start())
+
+        async def write():
+            async with SocketDataLink(server.host, server.port) as dali:
+                for i in range(20):
+                    await dali.writeJSON(f"FDSN:XX_{stations[i % 4]}_00_H_H_Z/JSON", 0, 0, {"i": i})
+
+        loop.run_until_complete(write())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            conf = makeConf(tmp_path)
+            conf["datalink"]["host"] = server.host
+            conf["datalink"]["port"] = server.port
+            conf["datalink"]["earliest"] = True
+            supervisor = ShardSupervisor(conf, numShards=2, statsInterval=0.5)
+            totals = supervisor.run(duration=4)
+        finally:
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        assert totals["packets"] == 20
+        assert all(stats["packets"] > 0 for stats in supervisor.stats.values())
+        for n, sta in enumerate(stations):
+            outfile = tmp_path / f"XX/{sta}/XX.{sta}.00.HHZ.1970.001.00.jsonl"
+            lines = outfile.read_text().splitlines()
+            assert [json.loads(l) for l in lines] == [{"i": i} for i in range(n, 20, 4)]
@@ -0,0 +1,424 @@
+import asyncio
+import pytest
+
+from simpledali import DaliPacket, DaliResponse, DaliException, DaliClosed
+from simpledali.socketdali import DaliFrameProtocol
+
+
+def frame(header, data=b""):
+    h = header.encode("utf-8")
+    return b"DL" + len(h).to_bytes(1, "big") + h + data
+
+
+class FakeTransport:
+    def __init__(self):
+        self.closing = False
+        self.paused = False
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+
+def feed(protocol, data, chunk):
+    for i in range(0, len(data), chunk):
+        piece = data[i : i + chunk]
+        buf = protocol.get_buffer(-1)
+        n = min(len(buf), len(piece))
+        buf[:n] = piece[:n]
+        del buf
+        protocol.buffer_updated(n)
+        if n < len(piece):
+            feed(protocol, piece[n:], chunk)
+
+
+class TestDaliFrameProtocol:
+    def test_parse_split_frames(self):
+        payload = b'{"a": 1}'
+        stream = (
+            frame("ID DataLink 2024 :: DLPROTO:1.0 PACKETSIZE:512 WRITE")
+            + frame(f"OK 1 {len(b'hi')}", b"hi")
+            + frame(
+                f"PACKET XX_ABC_00_HHZ/JSON 12 1700000000000000 1700000000000000 1700000001000000 {len(payload)}",
+                payload,
+            )
+            + frame("ENDSTREAM")
+        )
+        for chunk in [1, 3, 7, len(stream)]:
+            protocol = DaliFrameProtocol(bufsize=64)
+            protocol.connection_made(FakeTransport())
+            feed(protocol, stream, chunk)
+            frames = list(protocol.frames)
+            assert len(frames) == 4
+            assert isinstance(frames[0], DaliResponse)
+            assert frames[0].type == "ID"
+            assert frames[1].type == "OK"
+            assert frames[1].value == "1"
+            assert frames[1].message == "hi"
+            assert isinstance(frames[2], DaliPacket)
+            assert frames[2].streamId == "XX_ABC_00_HHZ/JSON"
+            assert frames[2].packetId == "12"
+            assert frames[2].dSize == len(payload)
+            assert isinstance(frames[2].data, memoryview)
+            assert bytes(frames[2].data) == payload
+            assert frames[3].type == "ENDSTREAM"
+
+    def test_payload_survives_buffer_reuse(self):
+        protocol = DaliFrameProtocol(bufsize=64)
+        protocol.connection_made(FakeTransport())
+        packets = []
+        for i in range(50):
+            payload = f"payload {i:04d}".encode("utf-8")
+            feed(
+                protocol,
+                frame(f"PACKET XX_A_00_HHZ/JSON {i} 0 0 0 {len(payload)}", payload),
+                5,
+            )
+            packets.append(protocol.frames.popleft())
+        for i, p in enumerate(packets):
+            assert bytes(p.data) == f"payload {i:04d}".encode("utf-8")
+
+    def test_bad_preamble(self):
+        protocol = DaliFrameProtocol()
+        transport = FakeTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b"XX\x00", 3)
+        assert transport.closing
+        with pytest.raises(DaliException):
+            asyncio.run(protocol.nextFrame())
+
+    def test_closed_after_frames(self):
+        async def read_all(protocol):
+            out = [await protocol.nextFrame()]
+            with pytest.raises(DaliClosed):
+                await protocol.nextFrame()
+            return out
+
+        protocol = DaliFrameProtocol()
+        protocol.connection_made(FakeTransport())
+        feed(protocol, frame("ENDSTREAM"), 100)
+        protocol.connection_lost(None)
+        out = asyncio.run(read_all(protocol))
+        assert out[0].type == "ENDSTREAM"
+
+
+async def readFrame(reader):
+    pre = await reader.readexactly(3)
+    header = (await reader.readexactly(pre[2])).decode("utf-8")
+    s = header.split(" ")
+    data = b""
+    if s[0] == "WRITE":
+        data = await reader.readexactly(int(s[5]))
+    return header, data
+
+
+class TestPipelinedWrites:
+    def test_window(self):
+        window = 4
+        numWrites = 10
+
+        async def handle(reader, writer):
+            pending = []
+            for i in range(numWrites):
+                header, data = await readFrame(reader)
+                pending.append(header.split(" ")[6])
+                # only reply once a full window of writes has arrived
+                if len(pending) == window or i == numWrites - 1:
+                    for pktid in pending:
+                        writer.write(frame(f"OK {pktid} 0"))
+                    pending = []
+                    await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port, ack_window=window)
+            await dali.createDaliConnection()
+            futures = []
+            for i in range(numWrites):
+                f = await dali.writeJSON(
+                    "XX_A_00_HHZ/JSON", 0, 0, {"i": i}, pktid=100 + i, wait=False
+                )
+                futures.append(f)
+            responses = await asyncio.gather(*futures)
+            await dali.close()
+            server.close()
+            return responses
+
+        responses = asyncio.run(asyncio.wait_for(run(), 5))
+        assert [r.value for r in responses] == [str(100 + i) for i in range(numWrites)]
+        assert all(r.type == "OK" for r in responses)
+
+    def test_ring_ids(self):
+        numWrites = 6
+
+        async def handle(reader, writer):
+            for i in range(numWrites):
+                await readFrame(reader)
+            # like ringserver, reply with ring packet ids, which here
+            # equal the pktids of other writes
+            for i in range(numWrites):
+                if i == 3:
+                    writer.write(frame("ERROR 0 0"))
+                else:
+                    writer.write(frame(f"OK {101 + i} 0"))
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port, ack_window=numWrites)
+            await dali.createDaliConnection()
+            futures = [
+                await dali.writeJSON("XX_A_00_HHZ/JSON", 0, 0, {"i": i}, pktid=100 + i, wait=False)
+                for i in range(numWrites)
+            ]
+            responses = await asyncio.gather(*futures)
+            await dali.close()
+            server.close()
+            return responses
+
+        responses = asyncio.run(asyncio.wait_for(run(), 5))
+        assert [r.type for r in responses] == ["OK", "OK", "OK", "ERROR", "OK", "OK"]
+        assert [r.value for r in responses] == ["101", "102", "103", "0", "105", "106"]
+
+    @pytest.mark.parametrize("cancel", [False, True])
+    def test_pending_failed(self, cancel):
+        window = 2
+
+        async def handle(reader, writer):
+            # ack the first write, then drop the rest
+            await readFrame(reader)
+            writer.write(frame("OK 100 0"))
+            await writer.drain()
+            for i in range(window):
+                await readFrame(reader)
+            if not cancel:
+                writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port, ack_window=window)
+            await dali.createDaliConnection()
+            futures = [
+                await dali.writeJSON("XX_A_00_HHZ/JSON", 0, 0, {"i": i}, pktid=100 + i, wait=False)
+                for i in range(window + 1)
+            ]
+            if cancel:
+                await asyncio.sleep(0.05)
+                dali._ackReader.cancel()
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            # window slots are all free again
+            assert not dali._ackSlots.locked()
+            assert len(dali._pendingAcks) == 0
+            await dali.close()
+            server.close()
+            return results
+
+        results = asyncio.run(asyncio.wait_for(run(), 5))
+        assert results[0].type == "OK"
+        assert all(isinstance(r, DaliClosed) for r in results[1:])
+
+
+class TestBulkSend:
+    def test_unacked_writes_coalesced(self):
+        numWrites = 50
+        received = []
+
+        async def handle(reader, writer):
+            for i in range(numWrites + 1):
+                header, data = await readFrame(reader)
+                received.append((header, data))
+            writer.write(frame("OK 0 0"))
+            await writer.drain()
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port, flush_bytes=1024, flush_latency=0.01)
+            await dali.createDaliConnection()
+            for i in range(numWrites):
+                await dali.write("XX_A_00_HHZ/JSON", i, i, "N", f"{i:04d}".encode("utf-8"))
+            assert dali._sendBufferSize < 1024
+            # latency timer sends the remainder
+            await asyncio.sleep(0.05)
+            assert dali._sendBufferSize == 0
+            r = await dali.writeAck("XX_A_00_HHZ/JSON", 0, 0, b"last")
+            await dali.close()
+            server.close()
+            return r
+
+        r = asyncio.run(asyncio.wait_for(run(), 5))
+        assert r.type == "OK"
+        assert [d for h, d in received[:numWrites]] == [
+            f"{i:04d}".encode("utf-8") for i in range(numWrites)
+        ]
+        assert received[-1][1] == b"last"
+
+
+class TestStreamResume:
+    def test_resume_after_drop(self):
+        commands = []
+        connectionNum = [0]
+
+        def packet(i):
+            data = f"{i}".encode("utf-8")
+            return frame(
+                f"PACKET XX_A_00_HHZ/JSON {i} {1000 + i} {i} {i} {len(data)}", data
+            )
+
+        async def handle(reader, writer):
+            connectionNum[0] += 1
+            conn = connectionNum[0]
+            resumeAt = 1
+            try:
+                while True:
+                    pre = await reader.readexactly(3)
+                    header = (await reader.readexactly(pre[2])).decode("utf-8")
+                    s = header.split(" ")
+                    commands.append((conn, header))
+                    if s[0] == "ID":
+                        writer.write(frame("ID DataLink test :: DLPROTO:1.0 PACKETSIZE:512"))
+                    elif s[0] == "MATCH":
+                        await reader.readexactly(int(s[1]))
+                        writer.write(frame("OK 1 0"))
+                    elif s[0] == "POSITION":
+                        resumeAt = int(s[2])
+                        writer.write(frame(f"OK {resumeAt} 0"))
+                    elif s[0] == "STREAM":
+                        if conn == 1:
+                            for i in range(1, 6):
+                                writer.write(packet(i))
+                            await writer.drain()
+                            # drop connection mid stream
+                            writer.transport.abort()
+                            return
+                        # ringserver resumes after the positioned packet,
+                        # send it again anyway to check duplicates are dropped
+                        for i in range(resumeAt, 11):
+                            writer.write(packet(i))
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port)
+            await dali.createDaliConnection()
+            await dali.id("test", "user", 0, "python")
+            await dali.match("XX_.*")
+            ids = []
+            async for p in dali.streamResume(maxRetries=3, retryDelay=0.01):
+                ids.append(int(p.packetId))
+                if len(ids) == 10:
+                    break
+            await dali.close()
+            server.close()
+            return ids
+
+        ids = asyncio.run(asyncio.wait_for(run(), 5))
+        assert ids == list(range(1, 11))
+        second = [h for c, h in commands if c == 2]
+        assert second[0].startswith("ID ")
+        assert second[1].startswith("MATCH ")
+        assert second[2] == "POSITION SET 5 1005"
+        assert second[3] == "STREAM"
+
+    def test_drop_before_first_packet(self):
+        commands = []
+        connectionNum = [0]
+
+        async def handle(reader, writer):
+            connectionNum[0] += 1
+            conn = connectionNum[0]
+            try:
+                while True:
+                    pre = await reader.readexactly(3)
+                    header = (await reader.readexactly(pre[2])).decode("utf-8")
+                    s = header.split(" ")
+                    commands.append((conn, header))
+                    if s[0] == "ID":
+                        writer.write(frame("ID DataLink test :: DLPROTO:1.0 PACKETSIZE:512"))
+                    elif s[0] == "POSITION":
+                        writer.write(frame("OK 1 0"))
+                    elif s[0] == "STREAM":
+                        if conn == 1:
+                            # drop before any packet is sent
+                            writer.transport.abort()
+                            return
+                        for i in range(1, 4):
+                            data = f"{i}".encode("utf-8")
+                            writer.write(frame(
+                                f"PACKET XX_A_00_HHZ/JSON {i} {1000 + i} {i} {i} {len(data)}", data
+                            ))
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        async def run():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            from simpledali import SocketDataLink
+            dali = SocketDataLink("127.0.0.1", port)
+            await dali.createDaliConnection()
+            await dali.id("test", "user", 0, "python")
+            await dali.positionEarliest()
+            ids = []
+            async for p in dali.streamResume(maxRetries=3, retryDelay=0.01):
+                ids.append(int(p.packetId))
+                if len(ids) == 3:
+                    break
+            await dali.close()
+            server.close()
+            return ids
+
+        ids = asyncio.run(asyncio.wait_for(run(), 5))
+        assert ids == [1, 2, 3]
+        second = [h for c, h in commands if c == 2]
+        assert second[0].startswith("ID ")
+        # the requested start is kept, not the live edge
+        assert second[1] == "POSITION SET EARLIEST "
+        assert second[2] == "STREAM"
+
+
+class TestWriteHeader:
+    def test_cached_prefix(self):
+        from simpledali import SocketDataLink
+        from simpledali.socketdali import encodeFrame
+
+        dali = SocketDataLink("localhost", 16000)
+        sent = []
+
+        async def send(header, data):
+            sent.append(encodeFrame(header, data))
+
+        dali.send = send
+
+        async def go():
+            await dali.write("XX_ABC_00_HHZ/JSON", 1000, 2000, "N", b"abc")
+            await dali.write("XX_ABC_00_HHZ/JSON", 3000, 4000, "A", b"de", pktid=7)
+
+        asyncio.run(go())
+        assert sent == [
+            frame("WRITE XX_ABC_00_HHZ/JSON 1000 2000 N 3", b"abc"),
+            frame("WRITE XX_ABC_00_HHZ/JSON 3000 4000 A 2 7", b"de"),
+        ]
+        assert dali.writePrefix("XX_ABC_00_HHZ/JSON") is dali.writePrefix("XX_ABC_00_HHZ/JSON")
@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import pytest
+
+from simpledali import DaliServer, SyncDataLink
+
+
+def runWithServer(work):
+    """
+    Run the blocking work(server) in a thread while a DaliServer runs.
+    """
+    async def go():
+        async with DaliServer(websocket=True) as server:
+            return await asyncio.to_thread(work, server)
+
+    return asyncio.run(asyncio.wait_for(go(), 10))
+
+
+class TestSyncDataLink:
+    def test_write_and_stream(self):
+        def work(server):
+            with SyncDataLink.forSocket(server.host, server.port, timeout=5) as dali:
+                r = dali.id("test", "user", 0, "python")
+                assert r.type == "ID"
+                for i in range(5):
+                    r = dali.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i})
+                    assert r.type == "OK"
+                futures = [
+                    dali.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i}, wait=False)
+                    for i in range(5, 10)
+                ]
+                assert [f.result(5).type for f in futures] == ["OK"] * 5
+                dali.positionEarliest()
+                out = []
+                stream = dali.stream()
+                for daliPacket in stream:
+                    out.append(json.loads(daliPacket.data))
+                    if len(out) == 10:
+                        break
+                stream.close()
+                # back in query mode after the stream is closed
+                assert dali.info("STATUS").type == "INFO"
+            assert dali.loop.is_closed()
+            return out
+
+        out = runWithServer(work)
+        assert out == [{"i": i} for i in range(10)]
+
+    def test_threads(self):
+        def work(server):
+            with SyncDataLink.forWebSocket(server.websocketurl, timeout=5) as dali:
+                dali.id("test", "user", 0, "python")
+
+                def send(t):
+                    return [
+                        dali.writeJSON(f"XX_T{t}_00_HHZ/JSON", i, i + 1, {"i": i}).type
+                        for i in range(20)
+                    ]
+
+                with ThreadPoolExecutor(4) as executor:
+                    results = list(executor.map(send, range(4)))
+                return results, server.ring.rxPackets
+
+        results, rxPackets = runWithServer(work)
+        assert results == [["OK"] * 20] * 4
+        assert rxPackets == 80
+
+    def test_connect_fails(self):
+        with pytest.raises(OSError):
+            SyncDataLink.forSocket("localhost", 1, timeout=5)
+
+    def test_dali_args(self):
+        def work(server):
+            with SyncDataLink.forSocket(server.host, server.port, timeout=5, ack_window=2) as dali:
+                dali.id("test", "user", 0, "python")
+                futures = [
+                    dali.writeJSON("XX_ABC_00_HHZ/JSON", i, i + 1, {"i": i}, wait=False)
+                    for i in range(5)
+                ]
+                assert [f.result(5).type for f in futures] == ["OK"] * 5
+                return dali.timeout, dali.dali.ack_window
+
+        assert runWithServer(work) == (5, 2)
@@ -0,0 +1,21 @@
+import asyncio
+
+from simpledali.util import asyncioRun, eventLoopName
+
+
+async def loopName():
+    await asyncio.sleep(0)
+    return eventLoopName()
+
+
+class TestAsyncioRun:
+    def test_default_loop(self):
+        assert asyncioRun(loopName()) == "asyncio"
+
+    def test_uvloop_or_fallback(self):
+        try:
+            import uvloop
+            expected = "uvloop"
+        except ImportError:
+            expected = "asyncio"
+        assert asyncioRun(loopName(), use_uvloop=True) == expected
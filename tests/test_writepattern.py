@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from simpledali import DaliPacket, datetimeToHPTime
+from simpledali.writepattern import WritePattern, PatternPaths
+from simplemseed import FDSNSourceId
+
+
+def packet(streamId, time):
+    hptime = str(datetimeToHPTime(time))
+    return DaliPacket("PACKET", streamId, "1", hptime, hptime, hptime, 0, b"")
+
+
+class TestWritePattern:
+    def test_fill(self):
+        sid = FDSNSourceId.parse("FDSN:CO_BIRD_00_H_H_Z")
+        time = datetime(2024, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+        p = WritePattern("/data/{x}/%n/%s/%Y/%j/%n.%s.%l.%c.%Y.%j.%H.jsonl")
+        assert p.fill(sid, time) == "/data/{x}/CO/BIRD/2024/034/CO.BIRD.00.HHZ.2024.034.04.jsonl"
+        assert p.fillSid(sid) == "/data/{x}/CO/BIRD/%Y/%j/CO.BIRD.00.HHZ.%Y.%j.%H.jsonl"
+
+    def test_bad_flag(self):
+        with pytest.raises(ValueError):
+            WritePattern("/data/%n/%M.jsonl")
+        with pytest.raises(ValueError):
+            WritePattern("")
+
+    def test_memo_per_hour(self):
+        paths = PatternPaths("%n.%s.%Y.%j.%H", {"W": "%n.%s.%Y.%j"})
+        t = datetime(2024, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+        first = paths.pathForPacket(packet("FDSN:CO_BIRD_00_H_H_Z/JSON", t))
+        same = paths.pathForPacket(packet("FDSN:CO_BIRD_00_H_H_Z/JSON", t.replace(minute=59)))
+        nextHour = paths.pathForPacket(packet("FDSN:CO_BIRD_00_H_H_Z/JSON", t.replace(hour=5)))
+        assert str(first) == "CO.BIRD.2024.034.04"
+        assert same is first
+        assert str(nextHour) == "CO.BIRD.2024.034.05"
+        band = paths.pathForPacket(packet("CO_BIRD_00_WKZ/JSON", t))
+        assert str(band) == "CO.BIRD.2024.034"
+        assert paths.pathForPacket(packet("bad/JSON", t)) is None